@@ -0,0 +1,270 @@
+'''
+Generates reproducible synthetic BibTeX files for benchmarking the
+create_dumbib_database.py script.
+
+The entries mimic what the script sees in practice: DBLP-style and
+Google-Scholar-style conference and journal papers, arXiv preprints,
+workshop papers, and books. A fraction of the entries are duplicates of
+earlier entries (written in the other style, as happens when merging
+DBLP and Google Scholar exports), and a fraction use a venue that is not
+in "venue_list.csv".
+
+Usage:
+$ python benchmarks/generate_bibtex.py -n 10000 -out synthetic.bib
+'''
+import argparse
+import csv
+import os
+import random
+
+#======================================================================
+# vocabulary used for generating the entries
+#======================================================================
+first_names = ['Alice', 'Bob', 'Carol', 'David', 'Emeline', 'Farhad',
+               'Gyorgy', 'Hana', 'Ivan', 'Jia', 'Kavya', 'Lucas',
+               'Martha', 'Nikhil', 'Olga', 'Pierre', 'Qiang', 'Rupam',
+               'Samuele', 'Tim', 'Uma', 'Viktor', 'Wei', 'Ximena',
+               'Yangchen', 'Zoe']
+surname_syllables = ['ba', 'ber', 'cha', 'dor', 'el', 'fin', 'gar',
+                     'hol', 'ing', 'jo', 'kas', 'lin', 'mah', 'mood',
+                     'nov', 'ot', 'pan', 'quin', 'ros', 'sut', 'ton',
+                     'vak', 'win', 'yer', 'zel']
+surname_prefixes = ['van', 'von', 'de', 'van der']
+title_words = ['adaptive', 'agents', 'algorithms', 'analysis',
+               'approximate', 'attention', 'bandits', 'bayesian',
+               'bounds', 'causal', 'continual', 'control', 'convergence',
+               'convex', 'deep', 'diffusion', 'discovery', 'distributed',
+               'dynamics', 'efficient', 'embeddings', 'estimation',
+               'exploration', 'fast', 'federated', 'generalization',
+               'gradient', 'graphs', 'hierarchical', 'inference',
+               'kernel', 'language', 'learning', 'linear', 'markov',
+               'memory', 'meta', 'methods', 'models', 'networks',
+               'neural', 'offline', 'online', 'optimal', 'optimization',
+               'planning', 'policy', 'private', 'probabilistic',
+               'regret', 'reinforcement', 'representations', 'robust',
+               'sample', 'scalable', 'search', 'sparse', 'stochastic',
+               'temporal', 'theory', 'transformers', 'uncertainty',
+               'value', 'variational']
+title_connectives = ['for', 'with', 'of', 'via', 'in', 'and', 'on']
+unknown_venue_words = ['Zorbic', 'Quanta', 'Plimsoll', 'Vexillology',
+                       'Orrery', 'Cromulent', 'Snollygoster', 'Tatterdemalion']
+book_publishers = ['MIT Press', 'Cambridge University Press']
+
+ENTRY_STYLES = ['dblp', 'scholar', 'arxiv', 'workshop', 'book']
+
+#======================================================================
+# functions for generating the individual fields
+#======================================================================
+def load_venues(venue_filename):
+    '''
+    Input: the path of the venue list CSV file
+    Output: a list of the venues that are not book publishers, as
+            dictionaries with the keys 'venue_name' and 'abbreviation'
+    '''
+    with open(venue_filename, newline='', encoding='utf-8') as f:
+        return [row for row in csv.DictReader(f)
+                if row['venue_name'] not in book_publishers]
+
+def generate_author(rng):
+    '''
+    Output: a tuple (<first names>, <last name>)
+    '''
+    first = rng.choice(first_names)
+    if rng.random() < 0.3:
+        first += ' ' + rng.choice(first_names)[0] + '.'
+    last = ''.join(rng.choice(surname_syllables)
+                   for _ in range(rng.randint(2, 3))).capitalize()
+    if rng.random() < 0.05:
+        last = rng.choice(surname_prefixes) + ' ' + last
+    return first, last
+
+# rarer technical terms, so that the titles have a realistic vocabulary
+# of a few thousand words rather than just the common words above
+technical_terms = [a + b + c for a in surname_syllables
+                   for b in surname_syllables for c in ['ic', 'ion', 'er']]
+
+def generate_title(rng):
+    words = [rng.choice(title_words) if rng.random() < 0.5
+             else rng.choice(technical_terms)
+             for _ in range(rng.randint(3, 7))]
+    position = rng.randint(1, len(words) - 1)
+    words.insert(position, rng.choice(title_connectives))
+    title = ' '.join(words)
+    if rng.random() < 0.2:
+        # some titles protect acronyms with braces
+        title = '{RL} for ' + title
+    return title[0].upper() + title[1:]
+
+def generate_unknown_venue(rng):
+    return 'Transactions on {} {}'.format(rng.choice(unknown_venue_words),
+                                          rng.choice(unknown_venue_words))
+
+def generate_paper(rng, venues, unknown_venue_rate, paper_id):
+    '''
+    Output: a dictionary describing a paper independently of how it is
+            formatted in the BibTeX file
+    '''
+    style = rng.choice(ENTRY_STYLES)
+    if style == 'book':
+        venue = {'venue_name': rng.choice(book_publishers),
+                 'abbreviation': '??'}
+    elif rng.random() < unknown_venue_rate:
+        venue = {'venue_name': generate_unknown_venue(rng),
+                 'abbreviation': '??'}
+    else:
+        venue = rng.choice(venues)
+    return {'id': paper_id,
+            'style': style,
+            'authors': [generate_author(rng)
+                        for _ in range(rng.choice([1, 2, 2, 3, 4, 6, 12]))],
+            'title': generate_title(rng),
+            'year': rng.randint(1990, 2025),
+            'venue': venue,
+            'eprint': '{:02d}{:02d}.{:05d}'.format(rng.randint(10, 25),
+                                                  rng.randint(1, 12),
+                                                  rng.randint(0, 99999))}
+
+#======================================================================
+# functions for formatting the papers as BibTeX entries
+#======================================================================
+def format_entry(paper, style=None):
+    '''
+    Input: a paper created by generate_paper(), and optionally the style
+           to use instead of the paper's own style
+    Output: the BibTeX entry as a string
+    '''
+    style = paper['style'] if style is None else style
+    last_name = paper['authors'][0][1].replace(' ', '')
+    venue = paper['venue']
+
+    if style == 'dblp':
+        authors = ' and\n                  '.join(
+            '{} {}'.format(first, last) for first, last in paper['authors'])
+        if venue['abbreviation'] != '??':
+            booktitle = 'Proceedings of the {}, {{{}}} {}'.format(
+                venue['venue_name'], venue['abbreviation'], paper['year'])
+        else:
+            booktitle = venue['venue_name']
+        return ('@inproceedings{{DBLP:conf/x/{}{:02d}_{},\n'
+                '  author    = {{{}}},\n'
+                '  title     = {{{}}},\n'
+                '  booktitle = {{{}}},\n'
+                '  pages     = {{{}--{}}},\n'
+                '  year      = {{{}}},\n'
+                '  url       = {{https://example.org/{}}}\n'
+                '}}'.format(last_name, paper['year'] % 100, paper['id'],
+                            authors, paper['title'], booktitle,
+                            paper['id'] % 900, paper['id'] % 900 + 12,
+                            paper['year'], paper['id']))
+    elif style == 'scholar':
+        authors = ' and '.join('{}, {}'.format(last, first)
+                               for first, last in paper['authors'])
+        return ('@article{{{}{}{},\n'
+                '  title={{{}}},\n'
+                '  author={{{}}},\n'
+                '  journal={{{}}},\n'
+                '  volume={{{}}},\n'
+                '  number={{{}}},\n'
+                '  pages={{{}--{}}},\n'
+                '  year={{{}}},\n'
+                '  publisher={{Some Publisher}}\n'
+                '}}'.format(last_name.lower(), paper['year'], paper['id'],
+                            paper['title'], authors, venue['venue_name'],
+                            paper['id'] % 40, paper['id'] % 12,
+                            paper['id'] % 900, paper['id'] % 900 + 12,
+                            paper['year']))
+    elif style == 'arxiv':
+        authors = ' and '.join('{} {}'.format(first, last)
+                               for first, last in paper['authors'])
+        return ('@article{{{}{}arxiv{},\n'
+                '  title = "{}",\n'
+                '  author = {{{}}},\n'
+                '  journal = {{arXiv preprint arXiv:{}}},\n'
+                '  eprint = {{{}}},\n'
+                '  archivePrefix = {{arXiv}},\n'
+                '  year = {}\n'
+                '}}'.format(last_name.lower(), paper['year'], paper['id'],
+                            paper['title'], authors, paper['eprint'],
+                            paper['eprint'], paper['year']))
+    elif style == 'workshop':
+        authors = ' and '.join('{} {}'.format(first, last)
+                               for first, last in paper['authors'])
+        return ('@inproceedings{{{}{}ws{},\n'
+                '  author = {{{}}},\n'
+                '  title = {{{}}},\n'
+                '  booktitle = {{{} Workshop on {}}},\n'
+                '  year = {{{}}}\n'
+                '}}'.format(last_name.lower(), paper['year'], paper['id'],
+                            authors, paper['title'],
+                            venue['abbreviation'].strip('?') or 'Joint',
+                            paper['title'].split()[-1].capitalize(),
+                            paper['year']))
+    elif style == 'book':
+        authors = ' and '.join('{}, {}'.format(last, first)
+                               for first, last in paper['authors'][:3])
+        return ('@book{{{}{}book{},\n'
+                '  author = {{{}}},\n'
+                '  title = {{{}}},\n'
+                '  publisher = {{{}}},\n'
+                '  edition = {{{}}},\n'
+                '  year = {{{}}}\n'
+                '}}'.format(last_name.lower(), paper['year'], paper['id'],
+                            authors, paper['title'], venue['venue_name'],
+                            paper['id'] % 3 + 1, paper['year']))
+    else:
+        raise ValueError('Unknown entry style: {}'.format(style))
+
+def generate_bibtex(num_entries, duplicate_rate=0.05, unknown_venue_rate=0.05,
+                    seed=0, venue_filename=None):
+    '''
+    Input: the number of entries, the fraction of the entries that are
+           duplicates of earlier entries, the fraction of the (non-book)
+           entries with a venue that is not in the venue list, the random
+           seed, and the path of the venue list CSV file (default: the
+           "venue_list.csv" file of the repository)
+    Output: the contents of the BibTeX file as a string
+
+    Note: The output only depends on the arguments, i.e. the same
+    arguments always produce exactly the same file.
+    '''
+    if venue_filename is None:
+        venue_filename = os.path.join(
+            os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            'venue_list.csv')
+    venues = load_venues(venue_filename)
+    rng = random.Random(seed)
+
+    papers = []
+    entries = []
+    for i in range(num_entries):
+        if len(papers) > 0 and rng.random() < duplicate_rate:
+            # the same paper as exported from the "other" database
+            paper = rng.choice(papers)
+            style = 'scholar' if paper['style'] == 'dblp' else 'dblp'
+            entries.append(format_entry(paper, style))
+        else:
+            paper = generate_paper(rng, venues, unknown_venue_rate, i)
+            papers.append(paper)
+            entries.append(format_entry(paper))
+
+    return '\n\n'.join(entries) + '\n'
+
+
+#======================================================================
+# The main() code
+#======================================================================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--num_entries', required=True, type=int)
+    parser.add_argument('-out', '--output_filename', required=True,
+                        type=str)
+    parser.add_argument('--duplicate_rate', default=0.05, type=float)
+    parser.add_argument('--unknown_venue_rate', default=0.05, type=float)
+    parser.add_argument('--seed', default=0, type=int)
+    parser.add_argument('--venues', default=None, type=str)
+
+    args = parser.parse_args()
+    with open(args.output_filename, 'w', encoding='utf-8') as f:
+        f.write(generate_bibtex(args.num_entries, args.duplicate_rate,
+                                args.unknown_venue_rate, args.seed,
+                                args.venues))
@@ -0,0 +1,151 @@
+'''
+Times the three stages of create_dumbib_database.py, i.e.
+process_bibtex_into_reference_list(), sort_and_create_keys_for_references(),
+and layout_latex_references(), on synthetic BibTeX files of different
+sizes (see generate_bibtex.py), and writes the results as JSON so that
+they can be compared between commits.
+
+Usage:
+$ python benchmarks/run_benchmarks.py -out results.json
+$ python benchmarks/run_benchmarks.py --sizes 1000 10000 --repeat 3
+
+Notes:
+The venue index is loaded before the timings start, the entry cache is
+not used, and the entries are parsed serially. Each stage is timed
+separately; with --repeat, the whole pipeline is run several times and
+the fastest time of each stage is reported. The messages that
+layout_latex_references() prints on the terminal are discarded.
+'''
+import argparse
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+benchmarks_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(benchmarks_dir))
+
+import create_dumbib_database as cdd
+from generate_bibtex import generate_bibtex
+
+STAGES = ['process_bibtex_into_reference_list',
+          'sort_and_create_keys_for_references',
+          'layout_latex_references']
+
+def time_pipeline(bibtex_filename, dumbib_database_filename, venue_index):
+    '''
+    Input: the BibTeX file, the dumbib database file to write, and the
+           venue index
+    Output: a tuple (<dictionary of seconds taken by each stage>,
+            <number of references>)
+    '''
+    timings = {}
+
+    start = time.perf_counter()
+    reference_list = cdd.process_bibtex_into_reference_list(
+        [bibtex_filename], venue_index=venue_index)
+    timings['process_bibtex_into_reference_list'] = \
+        time.perf_counter() - start
+
+    start = time.perf_counter()
+    reference_list = cdd.sort_and_create_keys_for_references(reference_list)
+    timings['sort_and_create_keys_for_references'] = \
+        time.perf_counter() - start
+
+    with open(os.devnull, 'w') as devnull, \
+         contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        cdd.layout_latex_references(reference_list, dumbib_database_filename)
+        timings['layout_latex_references'] = time.perf_counter() - start
+
+    return timings, len(reference_list)
+
+def get_git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'],
+                              cwd=benchmarks_dir, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmarks(sizes, repeat, duplicate_rate, unknown_venue_rate, seed):
+    '''
+    Output: a dictionary with the benchmark results (see the keys below)
+    '''
+    venue_index = cdd.load_venue_index(cdd.venue_filename)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for num_entries in sizes:
+            bibtex_filename = os.path.join(
+                tmp_dir, 'synthetic_{}.bib'.format(num_entries))
+            with open(bibtex_filename, 'w', encoding='utf-8') as f:
+                f.write(generate_bibtex(num_entries, duplicate_rate,
+                                        unknown_venue_rate, seed))
+
+            best_timings = None
+            for _ in range(repeat):
+                timings, num_references = time_pipeline(
+                    bibtex_filename,
+                    os.path.join(tmp_dir, 'dumbib_database.tex'),
+                    venue_index)
+                if best_timings is None:
+                    best_timings = timings
+                else:
+                    best_timings = {stage: min(best_timings[stage],
+                                               timings[stage])
+                                    for stage in STAGES}
+
+            results.append({
+                'num_entries': num_references,
+                'seconds': best_timings,
+                'microseconds_per_entry': {
+                    stage: 1e6 * best_timings[stage] / max(num_references, 1)
+                    for stage in STAGES}})
+            print_result(results[-1])
+
+    return {'commit': get_git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'settings': {'repeat': repeat,
+                         'duplicate_rate': duplicate_rate,
+                         'unknown_venue_rate': unknown_venue_rate,
+                         'seed': seed},
+            'results': results}
+
+def print_result(result):
+    print('{:>7d} entries: '.format(result['num_entries'])
+          + ', '.join('{} {:.3f}s'.format(stage.split('_')[0],
+                                          result['seconds'][stage])
+                      for stage in STAGES), file=sys.stderr)
+
+
+#======================================================================
+# The main() code
+#======================================================================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', nargs='+', default=[1000, 10000, 100000],
+                        type=int)
+    parser.add_argument('--repeat', default=1, type=int)
+    parser.add_argument('--duplicate_rate', default=0.05, type=float)
+    parser.add_argument('--unknown_venue_rate', default=0.05, type=float)
+    parser.add_argument('--seed', default=0, type=int)
+    parser.add_argument('-out', '--output_filename', default=None, type=str,
+                        help='the JSON file for the results (default:'\
+                        ' print them on the terminal)')
+
+    args = parser.parse_args()
+    benchmark_results = run_benchmarks(args.sizes, args.repeat,
+                                       args.duplicate_rate,
+                                       args.unknown_venue_rate, args.seed)
+    if args.output_filename is None:
+        print(json.dumps(benchmark_results, indent=2))
+    else:
+        with open(args.output_filename, 'w') as f:
+            json.dump(benchmark_results, f, indent=2)
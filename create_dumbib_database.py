@@ -1,7 +1,32 @@
 import argparse
-import pandas
-import pdb
+import bisect
+import bz2
+import collections
+import collections.abc
+import concurrent.futures
+import cProfile
+import csv
+import functools
+import glob
+import hashlib
+import heapq
+import io
+import itertools
+import json
+import lzma
+import math
+import mmap
+import os
+import pickle
+import random
 import re
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+import unicodedata
+import zlib
 
 #======================================================================
 # Utilities and functions (the main() code is at the very end)
@@ -39,33 +64,145 @@ bib_entry_types = {
                       'venue': 'note' }
 }
 
-venue_list = pandas.read_csv('venue_list.csv')
+# the default venue list, i.e. the "venue_list.csv" file next to this
+# script; the entry points which are not given a venue index load it
+# (see load_venue_index())
+venue_filename = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              'venue_list.csv')
 
-def find_bibliography_type(bib_dict):
+class Reference:
+    '''
+    All the information about a single BibTeX entry.
+
+    The raw BibTeX text is not stored; instead, "source" and "span"
+    (a tuple (<byte offset>, <length>)) point to the entry in the BibTeX
+    file, and the text is read from there only when it is needed (see
+    read_raw_data()). The "fields" of the entry are only stored while
+    the entry is being parsed.
+    '''
+    __slots__ = (
+        'INCLUDE_FLAG',            # whether to include this in bib
+        'author_string',           # a single string of all authors
+        'author_list',             # list of authors
+        'author_strings',          # the author strings without the
+                                   # year index (see
+                                   # create_author_strings())
+        'bib_key',                 # key used in the .bib file
+        'cited',                   # False if it cannot have been cited
+                                   # (its venue is then pending, see
+                                   # complete_reference())
+        'collation_key',           # for sorting and comparing entries
+        'dependencies',            # macros and crossrefs used (see
+                                   # BibtexFields)
+        'duplicate',               # if this is a duplicate entry
+        'duplicate_of',            # id of the entry this duplicates
+        'entry_type',              # entry type used in .bib file
+        'fields',                  # all the fields of the entry
+        'hash',                    # hash of the raw BibTeX entry
+        'id',                      # to keep track of all entries
+        'key',                     # key for LaTeX referencing
+        'line',                    # line number of the entry in source
+        'pending_problems',        # problems not yet in the warnings of
+                                   # an uncited entry
+        'possible_duplicate',      # for possible duplicates
+        'print_author_string',     # this is what is printed in-text
+        'source',                  # the BibTeX file of this entry
+        'span',                    # (offset, length) of the raw entry
+        'title',
+        'type',                    # stores 'article', 'book', etc.
+        'venue',                   # venue of publication
+        'error_message',           # what error to print
+        'warning_message',         # what warnings to print
+        'xyz_print_author_string', # for printing the XYZ+2025 style
+        'year',
+        'year_index'               # for (Feynman, 1960a, 1960b)
+    )
+
+    def __init__(self, bib_id, source, span, entry_hash, line=None):
+        self.INCLUDE_FLAG = True
+        self.author_string = ''
+        self.author_list = None
+        self.author_strings = None
+        self.bib_key = None
+        self.cited = None
+        self.collation_key = None
+        self.dependencies = ()
+        self.duplicate = False
+        self.duplicate_of = None
+        self.entry_type = None
+        self.fields = None
+        self.hash = entry_hash
+        self.id = bib_id
+        self.key = 'None'
+        self.line = line
+        self.pending_problems = ()
+        self.possible_duplicate = False
+        self.print_author_string = None
+        self.source = source
+        self.span = span
+        self.title = ''
+        self.type = None
+        self.venue = None
+        self.error_message = ''
+        self.warning_message = ''
+        self.xyz_print_author_string = None
+        self.year = 0
+        self.year_index = ''
+
+def find_fields(reference, raw_data, symbol_table=None):
+    '''
+    Input: a string containing the individual bibtex entry, and
+           optionally the symbol table of the BibTeX files (see
+           create_symbol_table())
+    Output: a dictionary containing all the fields of the entry, along
+            with the entry type and the BibTeX key
+
+    Notes:
+    The entry is tokenized only once, and the other find_* functions
+    read their fields from reference.fields instead of searching the
+    raw text again. See tokenize_bibtex_entry() for the details.
+
+    The @string macros and the fields inherited through "crossref" are
+    resolved when a field is read (see BibtexFields).
+    '''
+    try:
+        bib_type, bib_key, fields = tokenize_bibtex_entry(raw_data)
+        reference.entry_type = bib_type
+        reference.bib_key = bib_key
+        reference.fields = BibtexFields(fields, symbol_table)
+    except:
+        reference.error_message += \
+            '\n- Unable to read the fields of this entry; check the'\
+            ' entry for unbalanced braces or quotes.'
+        reference.INCLUDE_FLAG = False
+
+def find_bibliography_type(reference):
     '''
     Input: a string containing the individual bibtex entry
     Output: a string containing the type of the bibliography, i.e.
             fields such as 'article', 'book', 'misc', etc.
 
-    Note: Does not work if there is
-    @Comment commented text in the .bib file!!
+    Note: The @comment, @preamble, and @string entries never get here
+    (see read_references()).
     '''
     try:
-        bib_type = re.findall(r'[a-z]+', bib_dict['raw_data'])[0]
+        bib_type = reference.entry_type
         if bib_type in bib_entry_types:
-            bib_dict['type'] = bib_type
+            reference.type = bib_type
         else:
             raise ValueError('Unknown bibliography type!')
     except:
-        bib_dict['error_message'] += \
+        reference.error_message += \
             '\n- Unknown bibliography entry type.'\
             ' (Please add it to the source code in the dictionary'\
             ' "bib_entry_types" in the code to proceed.)'
-        bib_dict['INCLUDE_FLAG'] = False
+        reference.INCLUDE_FLAG = False
 
-def find_author_list(bib_dict):
+def find_author_list(reference, author_name_cache=None):
     '''
-    Input: a string containing the individual bibtex entry
+    Input: a string containing the individual bibtex entry, and
+           optionally the author name cache to use (see
+           get_author_name())
     Output: list of strings, each containing the author names
 
     Notes:    
@@ -115,58 +252,105 @@ def find_author_list(bib_dict):
     If you care about these issues, please do a manual check!
     '''
     try:
-        raw_text = re.findall(r'author\s*=\s*{[\s\S]+}',
-                              bib_dict['raw_data'])[0]
-
-        parenthetical_text = extract_text_in_braces(raw_text)
-        if parenthetical_text.isspace():
+        parenthetical_text = reference.fields['author']
+        if not parenthetical_text.strip():
             raise ValueError('Author field is empty!')
 
         processed_author_list = []
         author_list = re.split(r'\s+and\s+', parenthetical_text)
         for author in author_list:
-
-            # for dealing with names like 'von der' or 'van de'
-            author = re.sub(r"von de", "von_de", author)
-            author = re.sub(r"van de", "van_de", author)
-            
-            if ',' in author: # google scholar style
-                names_list = re.split(r',', author)
-                last_name = names_list[0]
-                remaining_names_list = re.split(r'\s', names_list[1])
-            else: # DBLP style
-                names_list = re.split(r'\s', author)
-                last_name = names_list[-1]
-                remaining_names_list = names_list[0:-1]
-                
-            first_names = ''
-            for remaining_name in remaining_names_list:
-                if len(remaining_name) > 0:
-                    if remaining_name.lower() in \
-                       ['van', 'von', 'da', 'de', 'der', 'von_der',
-                        'van_der']:
-                        last_name = remaining_name + ' ' + last_name
-                    else:
-                        # for taking care of names like
-                        # "\'Emeline Pierre" --> "Pierre \'E"
-                        j = 0
-                        while not remaining_name[j].isalpha():
-                            first_names += remaining_name[j]
-                            j += 1
-                        first_names += remaining_name[j] + '.\\ '
-            # remove the extra space and backslash at the end
-            first_names = first_names[:-2] 
-
-            processed_author_list.append(
-                {'last_name': last_name.replace('_', ' '),
-                 'first_names': first_names})
-        bib_dict['author_list'] = processed_author_list
+            last_name, first_names = get_author_name(author,
+                                                     author_name_cache)
+            processed_author_list.append({'last_name': last_name,
+                                          'first_names': first_names})
+        reference.author_list = processed_author_list
     except:
-        bib_dict['error_message'] += \
+        reference.error_message += \
             '\n- The entry has problems with the author list.'
-        bib_dict['INCLUDE_FLAG'] = False
+        reference.INCLUDE_FLAG = False
+
+def parse_author_name(author):
+    '''
+    Input: a single author, as written in the BibTeX author field
+    Output: a tuple (<last name>, <initials of the first names>)
+
+    Note: See find_author_list() for the details. This is a pure
+    function, so its results are memoized by get_author_name().
+    '''
+    # for dealing with names like 'von der' or 'van de'
+    author = re.sub(r"von de", "von_de", author)
+    author = re.sub(r"van de", "van_de", author)
+
+    if ',' in author: # google scholar style
+        names_list = re.split(r',', author)
+        last_name = names_list[0]
+        remaining_names_list = re.split(r'\s', names_list[1])
+    else: # DBLP style
+        names_list = re.split(r'\s', author)
+        last_name = names_list[-1]
+        remaining_names_list = names_list[0:-1]
+
+    first_names = ''
+    for remaining_name in remaining_names_list:
+        if len(remaining_name) > 0:
+            if remaining_name.lower() in \
+               ['van', 'von', 'da', 'de', 'der', 'von_der', 'van_der']:
+                last_name = remaining_name + ' ' + last_name
+            else:
+                # for taking care of names like
+                # "\'Emeline Pierre" --> "Pierre \'E"
+                j = 0
+                while not remaining_name[j].isalpha():
+                    first_names += remaining_name[j]
+                    j += 1
+                first_names += remaining_name[j] + '.\\ '
+    # remove the extra space and backslash at the end
+    first_names = first_names[:-2]
+
+    return last_name.replace('_', ' '), first_names
+
+# the number of parsed author names kept in an author name cache
+AUTHOR_NAME_CACHE_SIZE = 2**14
+
+def create_author_name_cache(names=()):
+    '''
+    Input: optionally, the (<author>, <parsed name>) pairs to start with,
+           e.g. those saved in the entry cache (see load_entry_cache())
+    Output: an author name cache for get_author_name(), i.e. a
+            dictionary with the keys 'names' (the parsed names, in least
+            recently used order), and 'hits' and 'misses' (the number of
+            lookups that were found, or not, in it)
+    '''
+    return {'names': collections.OrderedDict(names), 'hits': 0,
+            'misses': 0}
+
+def get_author_name(author, author_name_cache=None):
+    '''
+    Input: a single author, as written in the BibTeX author field, and
+           optionally the author name cache (see
+           create_author_name_cache(); default: no cache)
+    Output: parse_author_name(author), from the cache if possible
+
+    Note: Only the AUTHOR_NAME_CACHE_SIZE most recently used names are
+    kept. The names that cannot be parsed (i.e. for which
+    parse_author_name() raises an exception) are not cached.
+    '''
+    if author_name_cache is None:
+        return parse_author_name(author)
+    names = author_name_cache['names']
+    parsed_name = names.get(author)
+    if parsed_name is None:
+        author_name_cache['misses'] += 1
+        parsed_name = parse_author_name(author)
+        names[author] = parsed_name
+        if len(names) > AUTHOR_NAME_CACHE_SIZE:
+            names.popitem(last=False)
+    else:
+        author_name_cache['hits'] += 1
+        names.move_to_end(author)
+    return parsed_name
 
-def find_year(bib_dict):
+def find_year(reference):
     '''
     Input: a string containing the individual bibtex entry
     Output: a string containing the year of publication
@@ -176,47 +360,51 @@ def find_year(bib_dict):
     the BibTeX entry contains "2023, July", the outupt is just "2023".
     '''
     try:
-        raw_text = re.findall(r'year\s*=\s*{[\s\S]+}',
-                              bib_dict['raw_data'])[0]
-        parenthetical_text = extract_text_in_braces(raw_text)
-        if parenthetical_text.isspace():
+        parenthetical_text = reference.fields['year']
+        if not parenthetical_text.strip():
             raise ValueError('Year field is empty!')
         
         re_out = re.findall(r'[0-9]+', parenthetical_text)
         if len(re_out) != 1:
-            bib_dict['error_message'] += \
+            reference.error_message += \
                 '\n- The entry has problems with the publication year.'
-            bib_dict['INCLUDE_FLAG'] = False
+            reference.INCLUDE_FLAG = False
         else: 
             year = re_out[0]
-            bib_dict['year'] = year
+            reference.year = year
     except:
-        bib_dict['error_message'] += \
+        reference.error_message += \
             '\n- The entry has problems with the publication year.'
-        bib_dict['INCLUDE_FLAG'] = False
+        reference.INCLUDE_FLAG = False
 
-def find_title(bib_dict):
+def find_title(reference):
     '''
     Input: a string containing the individual bibtex entry
     Output: a string containing BibTeX entry's title (verbatim).
     '''
     try:
-        raw_text = re.findall(r'title\s*=\s*{[\s\S]+}',
-                              bib_dict['raw_data'])[0]
-        parenthetical_text = extract_text_in_braces(raw_text)
-        if parenthetical_text.isspace():
+        parenthetical_text = reference.fields['title']
+        if not parenthetical_text.strip():
             raise ValueError('Title field is empty!')
         
         # remove all the whitespaces in the title and store it
-        bib_dict['title'] = ' '.join(parenthetical_text.split())
+        reference.title = ' '.join(parenthetical_text.split())
     except:
-        bib_dict['error_message'] += \
+        reference.error_message += \
             '\n- The entry has problems with the title.'
-        bib_dict['INCLUDE_FLAG'] = False
+        reference.INCLUDE_FLAG = False
 
-def find_venue(bib_dict):
+# the fields telling whether an entry is an arXiv pre-print, besides its
+# venue field (see find_venue())
+arxiv_fields = ['archiveprefix', 'eprinttype', 'eprint']
+
+def find_venue(reference, venue_index, venue_match_threshold=None):
     '''
-    Input: a string containing the individual bibtex entry
+    Input: a string containing the individual bibtex entry, the venue
+           index to use (see load_venue_index()), and optionally the
+           similarity above which an unknown venue is replaced by the
+           most similar venue (see the --venue_match_threshold option;
+           default: never)
     Output: a string containing the publication venue
 
     Notes:
@@ -225,36 +413,46 @@ def find_venue(bib_dict):
     one of the venues listed in the CSV file, by comparing the
     the BibTeX entry against the "search_string" field of the CSV file.
     
+    All the search strings are matched in a single scan of the venue
+    text (see build_venue_index()). If more than one search string
+    matches, the longest one wins, e.g. "asian conference on machine
+    learning" wins over "conference on machine learning".
+
     If a match is found, then it returns the string
     "<venue_name> (<abbreviation>)". If an abbreviation does not exist
     for this venue in the CSV file, it just outputs "<venue_name>".
     (The venue names are capitalized in the CSV file.)
 
     If a match is not found, then it prompts the user to update the CSV
-    file before it can proceed.
+    file before it can proceed, and suggests the most similar venues of
+    the CSV file (see find_similar_venues()). If the similarity of the
+    most similar venue is at least "venue_match_threshold" (see the
+    --venue_match_threshold option), that venue is used instead, with a
+    warning.
 
-    If it finds the term "arXiv" in the BibTeX entry, it updates the
-    variable "bib_dict['type'] = 'arXiv', finds the "eprint" number of
-    the pre-print, and returns "arXiv: <eprint_number>".
+    If it finds the term "arXiv" in the venue field or in one of the
+    "arxiv_fields" (e.g. "archivePrefix") of the BibTeX entry, it finds
+    the "eprint" number of the pre-print, and returns "arXiv:
+    <eprint_number>". The other fields are not read, so that their
+    macros are not resolved (see BibtexFields) just for this.
 
     If there is the term "workshop" in the venue name, then this function
     does not do any processing and outputs the venue name verbatim,
     along with a message.
     '''
     try:
-        FLAG_ARXIV = True if 'arxiv' in bib_dict['raw_data'].lower() \
-            else False
-        venue_string = 'eprint' if FLAG_ARXIV\
-            else bib_entry_types[bib_dict['type']]['venue']
-        regex_venue_style = venue_string + r'\s*=\s*{[\s\S]+}'
-   
-        raw_text = re.findall(regex_venue_style, bib_dict['raw_data'])[0]
-        parenthetical_text = extract_text_in_braces(raw_text)
-        if parenthetical_text.isspace():
+        venue_string = bib_entry_types.get(reference.type, {}).get('venue')
+        FLAG_ARXIV = any('arxiv' in reference.fields.get(field, '').lower()
+                         for field in arxiv_fields + [venue_string])
+        if FLAG_ARXIV:
+            venue_string = 'eprint'
+
+        parenthetical_text = reference.fields[venue_string]
+        if not parenthetical_text.strip():
             raise ValueError('Venue field is empty!')
 
         if 'workshop' in parenthetical_text.lower():
-            bib_dict['warning_message'] += \
+            reference.warning_message += \
                 '\n- The publication venue is a workshop, and thus'\
                 + ' the venue name was used verbatim. You might need to'\
                 + ' edit it manually for proper formatting.'
@@ -262,370 +460,4594 @@ def find_venue(bib_dict):
         elif FLAG_ARXIV:
             processed_venue_name = 'arXiv: ' + parenthetical_text
         else:
-            FLAG_FOUND_VENUE = False
-            for i, row in venue_list.iterrows():
-                if row['search_string'] in parenthetical_text.lower():
-                    FLAG_FOUND_VENUE = True
-                    venue_name = row['venue_name']
-                    abbrv = row['abbreviation']
-                    processed_venue_name = venue_name
-                    if abbrv != '??':
-                        processed_venue_name += ' ({})'.format(abbrv)
+            matches = find_matching_venues(venue_index,
+                                           parenthetical_text.lower())
+            FLAG_FOUND_VENUE = len(matches) > 0
+            if FLAG_FOUND_VENUE:
+                # the longest search string wins; ties are broken by the
+                # order of the venues in the CSV file
+                row = venue_index['venues'][min(
+                    matches, key=lambda idx: (
+                        -len(venue_index['venues'][idx]['search_string']),
+                        idx))]
+                processed_venue_name = format_venue_name(row)
 
             if not FLAG_FOUND_VENUE:
-                processed_venue_name = None
-                bib_dict['error_message'] += \
-                    '\n- Unknown publication venue: {}. Please add it'\
-                    ' to the "venue_list.csv" file to process this'\
-                    ' entry.'.format(parenthetical_text)
-                bib_dict['INCLUDE_FLAG'] = False
+                min_similarity = VENUE_SUGGESTION_MIN_SIMILARITY
+                if venue_match_threshold is not None:
+                    min_similarity = min(min_similarity,
+                                         venue_match_threshold)
+                similar_venues = find_similar_venues(
+                    venue_index, parenthetical_text,
+                    min_similarity=min_similarity)
+                if venue_match_threshold is not None \
+                   and len(similar_venues) > 0 \
+                   and similar_venues[0][1] >= venue_match_threshold:
+                    idx, similarity = similar_venues[0]
+                    processed_venue_name = format_venue_name(
+                        venue_index['venues'][idx])
+                    reference.warning_message += \
+                        '\n- Unknown publication venue: {}. The most'\
+                        ' similar venue in the "venue_list.csv" file was'\
+                        ' used instead: {} (similarity: {:.2f}). Please'\
+                        ' check it, or add the venue to the file.'.format(
+                            parenthetical_text, processed_venue_name,
+                            similarity)
+                else:
+                    processed_venue_name = None
+                    reference.error_message += \
+                        '\n- Unknown publication venue: {}. Please add it'\
+                        ' to the "venue_list.csv" file to process this'\
+                        ' entry.'.format(parenthetical_text)
+                    suggestions = [
+                        '{} ({:.2f})'.format(format_venue_name(
+                            venue_index['venues'][idx]), similarity)
+                        for idx, similarity in similar_venues
+                        if similarity >= VENUE_SUGGESTION_MIN_SIMILARITY]
+                    if len(suggestions) > 0:
+                        reference.error_message += \
+                            ' The most similar venues in the file are:'\
+                            ' {}.'.format(', '.join(suggestions))
+                    reference.INCLUDE_FLAG = False
                 
-        bib_dict['venue'] = processed_venue_name
+        reference.venue = processed_venue_name
     except:
-        bib_dict['error_message'] += \
+        reference.error_message += \
             '\n- Unable to find the publication venue for this entry.'
-        bib_dict['INCLUDE_FLAG'] = False
+        reference.INCLUDE_FLAG = False
 
 #--------------------------------------------------------------------
 # other utility functions
 #--------------------------------------------------------------------
-def process_bibtex_into_reference_list(bibtex_filename):
+def process_bibtex_into_reference_list(bibtex_filenames, entry_cache=None,
+                                       jobs=1, cited_base_keys=None,
+                                       venue_index=None,
+                                       venue_match_threshold=None,
+                                       sources=None, author_name_cache=None):
     '''
-    Input: the BibTeX filename
+    Input: a list of BibTeX filenames, optionally the entry cache from a
+           previous run (see load_entry_cache()), the number of worker
+           processes to use for parsing the entries, the base keys of
+           the cited references (see parse_reference()), the venue index
+           (default: that of the default venue list) and the venue match
+           threshold (see find_venue()), a dictionary into which to put
+           the decompressed contents of the compressed files and of the
+           standard input, for reading the raw text of their entries
+           later (see write_log(); default: these contents are written
+           into temporary files instead, see read_bibtex_entries()), and
+           the author name cache (see create_author_name_cache();
+           default: a new one for this call)
     Output:
-    A list of dictionaries having author names, year, title, publisher,
-    and whether the publication is 'book_like' or 'paper_like'.
+    A list of references (see the class Reference) having author names,
+    year, title, publisher, and whether the publication is 'book_like'
+    or 'paper_like'.
 
     Notes:
     This function throws away any information not mentioned in the
     comment above. For instance, it does not include the page numbers
     of the publication.
-    '''
-    with open(bibtex_filename) as f:
-        bibtex_data = f.read()
-        
-    bib_list = re.split(r'(@[a-z]*{)', bibtex_data)
-    num_references = len(bib_list)
-    
-    if num_references % 2 != 1:
-        raise ValueError('Error in reading the input file:'\
-                         '\n{}'.format(input_filename))
 
+    The entries of all the files are numbered consecutively (in the
+    order of the files), and each reference records the file and the
+    line number it came from.
+
+    If an entry with exactly the same raw text is found in the entry
+    cache, its parsed fields are reused instead of parsing it again
+    (unless a macro or a crossref entry that it used has changed; see
+    restore_from_entry_cache()).
+
+    The @string macros of all the files go into a single symbol table,
+    in the order of the files (see read_references()). The entries with
+    a "crossref" field are only parsed once all the files have been
+    read, since their parent entry usually comes after them.
+
+    If jobs > 1, the remaining entries (of all the files) are parsed in
+    parallel by a pool of worker processes. Each entry is parsed
+    independently, so the output (including all the error and warning
+    messages) is exactly the same as that of a serial run. In
+    particular, each entry is parsed with the macros defined before it
+    (see parse_entry_spans()), and the crossref entries with all of
+    them, as in a serial run. The workers only get the raw text of the
+    entries of the compressed files and of the standard input, not their
+    whole contents, so if there are any, the crossref entries (whose
+    parent entry may be in one of them) are parsed serially.
+    '''
+    if venue_index is None:
+        venue_index = load_venue_index(venue_filename)
+    symbol_table = create_symbol_table(author_name_cache=author_name_cache)
+    # the decompressed contents are only kept in memory if the caller
+    # needs them
+    keep_contents = sources is not None
     reference_list = []
-    for i in range(1, num_references, 2):
-        raw_bib_type = bib_list[i]
-        raw_bib_info = bib_list[i+1]
-
-        bib_dict = dict({
-            'INCLUDE_FLAG': True,            # whether to include this in bib
-            'author_string': '',             # a single string of all authors
-            'author_list': None,             # list of authors
-            'duplicate': False,              # if this is a duplicate entry
-            'id': None,                      # to keep track of all entries
-            'key': 'None',                   # key for LaTeX referencing
-            'possible_duplicate': False,     # for possible duplicates
-            'print_author_string': None,     # this is what is printed in-text
-            'raw_data': None,                # the raw BibTeX entry
-            'title': '',                     
-            'type': None,                    # stores 'article', 'book', etc.
-            'venue': None,                   # venue of publication
-            'error_message': '',             # what error to print
-            'warning_message': '',           # what warnings to print
-            'xyz_print_author_string': None, # for printing the XYZ+2025 style
-            'year': 0,                       
-            'year_index': ''                 # for (Feynman, 1960a, 1960b)
-        })
-
-        bib_dict['id'] = int((i - 1) / 2)
-
-        # for removing trailing newlines
-        bib_dict['raw_data'] = (raw_bib_type + raw_bib_info).rstrip()
-        
-        find_bibliography_type(bib_dict)
-        find_author_list(bib_dict)
-        find_year(bib_dict)
-        find_title(bib_dict)
-        find_venue(bib_dict)
-        
-        reference_list.append(bib_dict)
+    # {<filename>: [(<reference>, <number of macro definitions before
+    # it>, <raw text, or None to read it from the file>), ...]}
+    entries_to_parse = {}
+    crossref_children = []
+    for bibtex_filename in bibtex_filenames:
+        for reference, raw_data in read_references(
+                read_bibtex_entries(bibtex_filename,
+                                    symbol_table['open_sources'],
+                                    keep_contents),
+                bibtex_filename, symbol_table, len(reference_list)):
+            if bibtex_crossref_regex.search(raw_data):
+                crossref_children.append(reference) # parsed below
+            elif restore_from_entry_cache(reference, entry_cache,
+                                          symbol_table, cited_base_keys,
+                                          venue_index, venue_match_threshold,
+                                          raw_data):
+                pass
+            elif jobs > 1: # parsed below in parallel
+                entries_to_parse.setdefault(bibtex_filename, []).append(
+                    (reference, len(symbol_table['macro_definitions']),
+                     raw_data if is_decompressed_source(
+                         symbol_table['open_sources'].get(bibtex_filename))
+                     else None))
+            else:
+                parse_reference(reference, raw_data, cited_base_keys,
+                                venue_index, symbol_table,
+                                venue_match_threshold)
+
+            reference_list.append(reference)
+
+    # the contents of the compressed files and of the standard input
+    # (the other open sources are memory maps)
+    decompressed_sources = {
+        source: data
+        for source, data in symbol_table['open_sources'].items()
+        if is_decompressed_source(data)}
+    for reference in crossref_children:
+        if restore_from_entry_cache(reference, entry_cache, symbol_table,
+                                    cited_base_keys, venue_index,
+                                    venue_match_threshold):
+            pass
+        elif jobs > 1 and len(decompressed_sources) == 0:
+            entries_to_parse.setdefault(reference.source, []).append(
+                (reference, len(symbol_table['macro_definitions']), None))
+        else:
+            parse_reference(reference, read_raw_data(
+                reference, symbol_table['open_sources']), cited_base_keys,
+                            venue_index, symbol_table, venue_match_threshold)
+    if sources is not None:
+        sources.update(decompressed_sources)
+    close_symbol_table(symbol_table)
+
+    if len(entries_to_parse) > 0:
+        # the entries of each file are dealt out to the workers in turn
+        # (keeping their order in the file), so that every worker gets
+        # about the same number of entries; each worker gets a single
+        # task, with all it needs to parse its share (see
+        # parse_entry_spans()), and executor.map() returns the results in
+        # the order of the workers
+        num_workers = min(jobs, max(len(references) for references
+                                    in entries_to_parse.values()))
+        shares = [[(bibtex_filename, references[worker::num_workers])
+                   for bibtex_filename, references
+                   in entries_to_parse.items()
+                   if len(references) > worker]
+                  for worker in range(num_workers)]
+        # the workers replay the macro definitions, and only need the key
+        # index to resolve crossrefs
+        worker_symbol_table = {
+            'macro_definitions': symbol_table['macro_definitions'],
+            'entries': symbol_table['entries']
+                       if len(crossref_children) > 0 else {},
+            'author_names': list(
+                symbol_table['author_names']['names'].items())}
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=num_workers) as executor:
+            for share, parsed_share in zip(shares, executor.map(
+                    parse_entry_spans,
+                    [[(bibtex_filename,
+                       [(reference.span, macro_version, raw_data)
+                        for reference, macro_version, raw_data in references])
+                      for bibtex_filename, references in share]
+                     for share in shares],
+                    [worker_symbol_table] * num_workers,
+                    [cited_base_keys] * num_workers,
+                    [venue_index] * num_workers,
+                    [venue_match_threshold] * num_workers)):
+                for (_, references), parsed_references in zip(share,
+                                                             parsed_share):
+                    for (reference, _, _), parsed_fields in zip(
+                            references, parsed_references):
+                        restore_cached_fields(reference, parsed_fields)
 
     return reference_list
 
-def sort_and_create_keys_for_references(reference_list):
+def find_bibtex_files(patterns):
+    '''
+    Input: a list of BibTeX filenames and glob patterns (e.g. "*.bib")
+    Output: the list of the BibTeX files, without repetitions
+
+    Note: The files matching a pattern are sorted by name, so that the
+    order of the entries does not depend on the file system. A pattern
+    that matches nothing is kept as it is, so that a missing file gives
+    an error rather than being silently ignored.
+    '''
+    bibtex_filenames = []
+    for pattern in patterns:
+        for bibtex_filename in sorted(glob.glob(pattern)) or [pattern]:
+            if bibtex_filename not in bibtex_filenames:
+                bibtex_filenames.append(bibtex_filename)
+    return bibtex_filenames
+
+# an entry starts with "@<type>{" at the start of a line (possibly
+# indented), so that an "@" inside a field value (such as "bob@example
+# (preferred)") does not start a new entry; the entry itself starts at
+# the "@" (group 1)
+bibtex_entry_start_regex = re.compile(rb'(?m)^[ \t]*(@[A-Za-z]+\s*[{(])')
+
+def read_bibtex_entries(bibtex_filename, open_sources=None,
+                        keep_contents=True):
+    '''
+    Input: the BibTeX filename, or '-' for the standard input, and
+           optionally the open sources of a symbol table (see
+           create_symbol_table()), and whether to keep the decompressed
+           contents of a compressed file or of the standard input in
+           memory
+    Output: a generator yielding a tuple (<start offset>, <end offset>,
+            <line number>, <raw text>) for each BibTeX entry in the file
+
+    Notes:
+    The file is memory-mapped and the entries are yielded one at a time,
+    so only the current entry is ever copied into memory, irrespective
+    of the size of the file. An entry starts at "@<type>{" (or
+    "@<type>("; the type is case-insensitive) at the start of a line, and
+    extends up to the start of the next entry; any trailing whitespace
+    is removed. The offsets are byte offsets into the file, and any text
+    before the first entry is ignored.
+
+    Compressed files and the standard input cannot be memory-mapped, so
+    they are read (and decompressed) chunk by chunk instead, and their
+    entries are yielded as soon as they have been read (see
+    split_bibtex_stream()); the offsets are then offsets into the
+    decompressed contents. These contents are put into "open_sources",
+    so that the raw text of the entries can be read again later (see
+    read_raw_data()), until close_symbol_table() frees them. If
+    keep_contents is False, they are written into an anonymous temporary
+    file instead, so that the memory used does not grow with the size
+    of the file.
+
+    The files have to be encoded in UTF-8; an entry which is not raises
+    a UnicodeDecodeError naming the file and the line of the entry.
+    '''
+    try:
+        if bibtex_filename == '-':
+            yield from split_decompressed_bibtex_stream(
+                bibtex_filename, sys.stdin.buffer, open_sources,
+                keep_contents)
+            return
+        with open(bibtex_filename, 'rb') as f:
+            if get_decompressor(f.read(6)) is not None:
+                f.seek(0)
+                yield from split_decompressed_bibtex_stream(
+                    bibtex_filename, f, open_sources, keep_contents)
+                return
+            if os.fstat(f.fileno()).st_size == 0:
+                return # an empty file cannot be memory-mapped
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                yield from split_bibtex_entries(data)
+    except UnicodeDecodeError as e:
+        e.reason += ' of {}'.format(bibtex_filename)
+        raise
+
+def split_decompressed_bibtex_stream(bibtex_filename, f, open_sources,
+                                     keep_contents=True):
+    '''
+    Input: the BibTeX filename, the binary stream to read it from, the
+           open sources, and whether to keep the contents in memory (see
+           read_bibtex_entries())
+    Output: a generator yielding the entries of the stream (decompressed
+            if need be) in the same form as read_bibtex_entries()
+    '''
+    if keep_contents:
+        blocks = []
+    elif open_sources is not None:
+        blocks = tempfile.TemporaryFile() # closed by close_symbol_table()
+    else:
+        blocks = None
+    if open_sources is not None:
+        open_sources[bibtex_filename] = blocks
+    yield from split_bibtex_stream(read_decompressed_chunks(f), blocks)
+
+def is_decompressed_source(data):
+    '''
+    Input: an open source (see read_raw_data())
+    Output: True if it holds the decompressed contents of a compressed
+            file or of the standard input, either as a list of blocks or
+            as a temporary file (see read_bibtex_entries())
+    '''
+    return isinstance(data, list) \
+        or (hasattr(data, 'seek') and not isinstance(data, mmap.mmap))
+
+# the size of the chunks in which the compressed files and the standard
+# input are read (a chunk of a compressed file is usually decompressed
+# into a few times more bytes)
+READ_CHUNK_SIZE = 2**16
+# the size of the blocks in which their decompressed contents are stored
+# (see append_to_blocks())
+SOURCE_BLOCK_SIZE = 2**20
+
+# the magic bytes at the start of the compressed files, and the
+# decompressors for them (gzip, xz, and bzip2)
+compression_formats = [
+    (b'\x1f\x8b', functools.partial(zlib.decompressobj, 16 + zlib.MAX_WBITS)),
+    (b'\xfd7zXZ\x00', lzma.LZMADecompressor),
+    (b'BZh', bz2.BZ2Decompressor)]
+
+def get_decompressor(header):
+    '''
+    Input: the first few bytes of a file
+    Output: a function creating a decompressor object for the file (see
+            read_decompressed_chunks()), or None if the file is not
+            compressed
+    '''
+    for magic_bytes, create_decompressor in compression_formats:
+        if header.startswith(magic_bytes):
+            return create_decompressor
+    return None
+
+def read_decompressed_chunks(f):
+    '''
+    Input: a binary stream, at the start of a file which is compressed
+           with gzip, xz, or bzip2, or not compressed at all
+    Output: a generator yielding the (decompressed) contents of the file
+            in chunks
+
+    Notes:
+    The format is detected from the magic bytes at the start of the file,
+    irrespective of its name, and the file is decompressed as a stream
+    (never into a temporary file, and without reading the whole
+    compressed file first), so that the standard input, which cannot be
+    rewound, can be decompressed as well.
+
+    A file made of several concatenated compressed streams (e.g. by
+    "cat a.bib.gz b.bib.gz") is decompressed as a whole, as by the
+    gzip, xz, and bzip2 tools; the null bytes padding the streams are
+    skipped. A truncated file raises EOFError.
+    '''
+    chunk = f.read(6)
+    create_decompressor = get_decompressor(chunk)
+    if create_decompressor is None:
+        while len(chunk) > 0:
+            yield chunk
+            chunk = f.read(READ_CHUNK_SIZE)
+        return
+
+    decompressor = None
+    while len(chunk) > 0:
+        if decompressor is None:
+            chunk = chunk.lstrip(b'\x00')
+            if len(chunk) == 0:
+                chunk = f.read(READ_CHUNK_SIZE)
+                continue
+            decompressor = create_decompressor()
+        yield decompressor.decompress(chunk)
+        if decompressor.eof:
+            # the next stream (if any) starts right after this one
+            chunk = decompressor.unused_data
+            decompressor = None
+        else:
+            chunk = b''
+        if len(chunk) == 0:
+            chunk = f.read(READ_CHUNK_SIZE)
+    if decompressor is not None:
+        raise EOFError('Compressed file ended before the end-of-stream'\
+                       ' marker was reached')
+
+def split_bibtex_entries(data):
+    '''
+    Input: the contents of a BibTeX file as bytes (or any bytes-like
+           object, such as a memory map)
+    Output: a generator yielding the entries in the same form as
+            read_bibtex_entries()
+
+    Note: To read a BibTeX string, use split_bibtex_entries(
+    text.encode('utf-8')); the offsets are byte offsets into these bytes.
+    '''
+    start_offset = None
+    line = 1
+    for match in bibtex_entry_start_regex.finditer(data):
+        if start_offset is None:
+            line += data[:match.start(1)].count(b'\n')
+        else:
+            raw_bytes = data[start_offset:match.start(1)]
+            yield create_raw_entry(start_offset, raw_bytes, line)
+            line += raw_bytes.count(b'\n')
+        start_offset = match.start(1)
+    if start_offset is not None:
+        yield create_raw_entry(start_offset, data[start_offset:], line)
+
+def split_bibtex_stream(chunks, blocks):
+    '''
+    Input: an iterable of the successive chunks (as bytes) of the
+           contents of a BibTeX file, and an empty list, into which these
+           contents are put as blocks (see append_to_blocks()), or an
+           empty binary file, into which they are written, or None not
+           to keep them
+    Output: a generator yielding the entries in the same form as
+            split_bibtex_entries(<the whole contents>)
+
+    Notes:
+    An entry is yielded as soon as the start of the next entry (or the
+    end of the contents) has been read. Only the contents from the start
+    of the current entry are kept for the search; since the start of an
+    entry can be cut in two by the end of a chunk, the search for the
+    next start resumes at the start of the line of the last "@" which has
+    not been matched yet.
+    '''
+    # the contents being searched, starting at offset "tail_offset"
+    tail = bytearray()
+    tail_offset = 0
+    start_offset = None
+    line = 1
+    position = 0
+    for chunk in chunks:
+        if isinstance(blocks, list):
+            append_to_blocks(blocks, chunk)
+        elif blocks is not None:
+            blocks.write(chunk)
+        tail += chunk
+        for match in bibtex_entry_start_regex.finditer(tail, position):
+            if start_offset is None:
+                line += tail.count(b'\n', 0, match.start(1))
+            else:
+                raw_bytes = tail[start_offset-tail_offset:match.start(1)]
+                yield create_raw_entry(start_offset, raw_bytes, line)
+                line += raw_bytes.count(b'\n')
+            start_offset = tail_offset + match.start(1)
+            position = match.end()
+        last_at = tail.rfind(b'@', position)
+        position = max(position, tail.rfind(
+            b'\n', 0, len(tail) if last_at < 0 else last_at) + 1)
+        if start_offset is None:
+            line += tail.count(b'\n', 0, position)
+            trimmed_length = position
+        else:
+            trimmed_length = start_offset - tail_offset
+        del tail[:trimmed_length]
+        tail_offset += trimmed_length
+        position -= trimmed_length
+    if start_offset is not None:
+        yield create_raw_entry(start_offset, tail[start_offset-tail_offset:],
+                               line)
+
+def append_to_blocks(blocks, data):
+    '''
+    Input: a list of blocks, and the bytes to append to them
+    Output: None
+
+    Note: The contents of the compressed files and of the standard input
+    are stored as a list of bytearrays of SOURCE_BLOCK_SIZE bytes (except
+    the last one, which is filled up by the next call), so that they never
+    need to be copied into a bigger buffer as they grow (see
+    read_span()).
+    '''
+    data = memoryview(data)
+    while len(data) > 0:
+        if len(blocks) == 0 or len(blocks[-1]) == SOURCE_BLOCK_SIZE:
+            blocks.append(bytearray())
+        length = SOURCE_BLOCK_SIZE - len(blocks[-1])
+        blocks[-1] += data[:length]
+        data = data[length:]
+
+def create_raw_entry(start_offset, raw_bytes, line):
+    raw_bytes = raw_bytes.rstrip()
+    try:
+        raw_data = raw_bytes.decode('utf-8')
+    except UnicodeDecodeError as e:
+        e.reason += ' in the entry at line {}'.format(line)
+        raise
+    return start_offset, start_offset + len(raw_bytes), line, raw_data
+
+def create_reference(bib_id, source, raw_entry):
+    '''
+    Input: the id of the reference, the name of its source (e.g. the
+           BibTeX filename), and the raw entry yielded by
+           read_bibtex_entries()
+    Output: an unparsed reference (see the class Reference)
+    '''
+    start_offset, end_offset, line, raw_data = raw_entry
+    return Reference(bib_id, source, (start_offset, end_offset - start_offset),
+                     hashlib.sha1(raw_data.encode('utf-8')).hexdigest(), line)
+
+def parse_bibtex_entries(raw_entries, source, venue_index=None,
+                         entry_cache=None, cited_base_keys=None, first_id=0,
+                         symbol_table=None, venue_match_threshold=None):
+    '''
+    Input: the contents of a BibTeX file as bytes (e.g. BibTeX text
+           encoded in UTF-8), or the raw entries yielded by
+           read_bibtex_entries() or split_bibtex_entries(), the name of
+           their source, optionally the venue index (default: that of
+           the default venue list; see find_venue()), the entry cache
+           (see load_entry_cache(); it has to be loaded for the same
+           venue index and threshold), the cited base keys (see
+           parse_reference()), the id of the first reference, the symbol
+           table (see create_symbol_table(); default: a new one), and
+           the venue match threshold (see find_venue())
+    Output: a generator yielding the parsed reference of each entry
+
+    Notes:
+    This is the serial version of process_bibtex_into_reference_list()
+    for a single source, for using this script as a library; the entries
+    are parsed one at a time, as they are consumed.
+
+    The contents given as bytes are split with split_bibtex_entries(),
+    and put into symbol_table['open_sources'] under the name of the
+    source, so that the crossref entries can read their parent entries
+    from them. The raw entries of a source which is not a file have to
+    be put there by the caller.
+
+    The entries with a "crossref" field are yielded after all the other
+    entries, since their parent entry usually comes after them. Pass the
+    same symbol table when parsing several sources that share macros or
+    crossref entries, and close it (see close_symbol_table()) once they
+    are parsed.
+    '''
+    if venue_index is None:
+        venue_index = load_venue_index(venue_filename)
+    if symbol_table is None:
+        symbol_table = create_symbol_table()
+    if isinstance(raw_entries, (bytes, bytearray)):
+        symbol_table['open_sources'][source] = raw_entries
+        raw_entries = split_bibtex_entries(raw_entries)
+    crossref_children = []
+    for reference, raw_data in read_references(raw_entries, source,
+                                               symbol_table, first_id):
+        if bibtex_crossref_regex.search(raw_data):
+            crossref_children.append((reference, raw_data))
+            continue
+        if not restore_from_entry_cache(reference, entry_cache,
+                                        symbol_table, cited_base_keys,
+                                        venue_index, venue_match_threshold,
+                                        raw_data):
+            parse_reference(reference, raw_data, cited_base_keys,
+                            venue_index, symbol_table, venue_match_threshold)
+        yield reference
+
+    for reference, raw_data in crossref_children:
+        if not restore_from_entry_cache(reference, entry_cache,
+                                        symbol_table, cited_base_keys,
+                                        venue_index, venue_match_threshold,
+                                        raw_data):
+            parse_reference(reference, raw_data, cited_base_keys,
+                            venue_index, symbol_table, venue_match_threshold)
+        yield reference
+
+def read_raw_data(reference, open_sources):
+    '''
+    Input: a reference, and a dictionary of the already memory-mapped
+           source files (which is updated by this function); it can also
+           contain the contents (as bytes, as a list of blocks, see
+           append_to_blocks(), or as a temporary file, see
+           read_bibtex_entries()) of the sources which are not files
+    Output: the raw BibTeX text of the reference
+
+    Note: The caller is responsible for closing the memory maps in
+    "open_sources" once it is done.
+    '''
+    return read_span(reference.source, reference.span, open_sources)
+
+def read_span(source, span, open_sources):
+    '''
+    Input: the source, the (offset, length) span of an entry in it, and
+           the open sources (see read_raw_data())
+    Output: the raw BibTeX text of the entry
+
+    Note: The compressed files and the standard input are read from
+    their decompressed contents in "open_sources" (see
+    read_bibtex_entries()), which are stored as a list of blocks (see
+    append_to_blocks()), or written into a temporary file.
+    '''
+    data = open_sources.get(source)
+    if data is None:
+        with open(source, 'rb') as f:
+            data = open_sources[source] = mmap.mmap(
+                f.fileno(), 0, access=mmap.ACCESS_READ)
+    offset, length = span
+    if isinstance(data, (bytes, bytearray, mmap.mmap)):
+        return data[offset:offset+length].decode('utf-8')
+    if not isinstance(data, list): # a temporary file
+        end_offset = data.tell()
+        data.seek(offset)
+        raw_bytes = data.read(length)
+        data.seek(end_offset) # it may still be written into
+        return raw_bytes.decode('utf-8')
+    # the entry can span several blocks
+    block_index, offset = divmod(offset, SOURCE_BLOCK_SIZE)
+    pieces = []
+    while length > 0:
+        pieces.append(data[block_index][offset:offset+length])
+        length -= len(pieces[-1])
+        block_index += 1
+        offset = 0
+    return b''.join(pieces).decode('utf-8')
+
+def parse_reference(reference, raw_data, cited_base_keys=None,
+                    venue_index=None, symbol_table=None,
+                    venue_match_threshold=None):
+    '''
+    Input: a reference, its raw BibTeX text, optionally the set of the
+           base keys (i.e. without the year index) of all the cited
+           references (see read_cited_keys()), the venue index, the
+           symbol table (see create_symbol_table()), and the venue match
+           threshold (see find_venue())
+    Output: the reference, with all the fields filled in by the find_*
+            functions
+
+    Notes:
+    If cited_base_keys is given, the venue is not processed for the
+    references that cannot possibly be cited, since their key (which
+    only depends on the author list and the year) was not cited; these
+    references are marked with reference.cited = False, and their venue
+    is only processed if they are cited later (see complete_reference()).
+
+    The undefined macros and the missing crossref entries met while
+    reading the fields are reported as warnings. If the fields cannot be
+    read at all, the other find_* functions are skipped, since they
+    would only report the same problem again.
+    '''
+    find_fields(reference, raw_data, symbol_table)
+    if reference.fields is None:
+        return reference
+    find_bibliography_type(reference)
+    find_author_list(reference, None if symbol_table is None
+                     else symbol_table['author_names'])
+    find_year(reference)
+    find_title(reference)
+    if reference.author_list is not None:
+        create_collation_key(reference)
+    if reference.INCLUDE_FLAG:
+        create_author_strings(reference)
+    if is_possibly_cited(reference, cited_base_keys):
+        find_venue(reference, venue_index, venue_match_threshold)
+    else:
+        reference.cited = False
+    reference.dependencies = tuple(reference.fields.dependencies)
+    if reference.cited is False:
+        # added to the warnings after those of the venue, as in a full
+        # parse (see complete_reference())
+        reference.pending_problems = tuple(reference.fields.problems)
+    else:
+        for problem in reference.fields.problems:
+            reference.warning_message += '\n- ' + problem
+    reference.fields = None # only needed while parsing
+    return reference
+
+def is_possibly_cited(reference, cited_base_keys):
+    '''
+    Input: a parsed reference (whose venue may be pending), and the cited
+           base keys (see parse_reference())
+    Output: False if the key of the reference cannot have been cited
+    '''
+    return cited_base_keys is None or not reference.INCLUDE_FLAG \
+        or reference.author_strings[1] in cited_base_keys
+
+def complete_reference(reference, raw_data, venue_index=None,
+                       symbol_table=None, venue_match_threshold=None):
+    '''
+    Input: a reference whose venue was skipped by parse_reference()
+           (i.e. with reference.cited = False), its raw BibTeX text, the
+           venue index, the symbol table, and the venue match threshold
+           (see parse_reference())
+    Output: the reference, with its venue (and all its messages) as if
+            it had been fully parsed by parse_reference()
+
+    Note: Only find_venue() is run (on the fields read again from the raw
+    text); the author list, the year and the title are kept, so that an
+    uncited entry from the entry cache which is cited later is not
+    parsed again from scratch.
+    '''
+    dependencies = dict.fromkeys(reference.dependencies)
+    problems = dict.fromkeys(reference.pending_problems)
+    find_fields(reference, raw_data, symbol_table)
+    if reference.fields is None:
+        return reference
+    find_venue(reference, venue_index, venue_match_threshold)
+    dependencies.update(reference.fields.dependencies)
+    problems.update(reference.fields.problems)
+    reference.dependencies = tuple(dependencies)
+    for problem in problems:
+        reference.warning_message += '\n- ' + problem
+    reference.cited = None
+    reference.pending_problems = ()
+    reference.fields = None
+    return reference
+
+#--------------------------------------------------------------------
+# parallel parsing (see the "jobs" argument of
+# process_bibtex_into_reference_list())
+#--------------------------------------------------------------------
+def parse_entry_spans(share, worker_symbol_table, cited_base_keys,
+                      venue_index, venue_match_threshold=None):
+    '''
+    Input: the share of the entries of a worker, i.e. a list of tuples
+           (<BibTeX filename>, <list of tuples (<(offset, length) span of
+           an entry in this file>, <number of macro definitions before
+           the entry>, <raw text of the entry, or None>)>), the macro
+           definitions, the key index, and the author names of the
+           symbol table (under the keys 'macro_definitions', 'entries'
+           and 'author_names'), the cited base keys (see
+           parse_reference()), and the venue index and the venue match
+           threshold (see find_venue())
+    Output: for each file of the share, a list of tuples containing the
+            parsed fields of each entry (see get_cached_fields())
+
+    Notes:
+    This function runs in the worker processes; only the spans are sent
+    to the workers (which read the entries from the files themselves)
+    and only the parsed fields are sent back. The compressed files and
+    the standard input cannot be read by the workers, so the raw text of
+    their entries is sent instead. Everything else the worker needs is
+    in the arguments, so the worker keeps no state between the builds.
+
+    Each entry is parsed with the macros as they were when it was read,
+    i.e. with the first <number> definitions of
+    worker_symbol_table['macro_definitions'], so that a macro which is
+    redefined (or defined after being used) gives the same result as in
+    a serial run. The entries of a file are in the order of the file, so
+    the definitions are replayed only once per file.
+
+    The files memory-mapped by the worker (its BibTeX files, and those
+    of the parent entries of its crossref entries) are closed once its
+    share is parsed.
+    '''
+    symbol_table = create_symbol_table(
+        author_name_cache=create_author_name_cache(
+            worker_symbol_table['author_names']))
+    symbol_table['entries'] = worker_symbol_table['entries']
+    macro_definitions = worker_symbol_table['macro_definitions']
+    parsed_share = []
+    try:
+        for bibtex_filename, spans in share:
+            parsed_entries = []
+            num_macros = None
+            for span, macro_version, raw_data in spans:
+                if num_macros is None or macro_version < num_macros:
+                    symbol_table['macros'] = dict(bibtex_month_macros)
+                    num_macros = 0
+                for name, value in macro_definitions[num_macros:
+                                                     macro_version]:
+                    symbol_table['macros'][name] = value
+                num_macros = macro_version
+                reference = Reference(None, bibtex_filename, span, None)
+                if raw_data is None:
+                    raw_data = read_raw_data(reference,
+                                             symbol_table['open_sources'])
+                parse_reference(reference, raw_data, cited_base_keys,
+                                venue_index, symbol_table,
+                                venue_match_threshold)
+                parsed_entries.append(get_cached_fields(reference))
+            parsed_share.append(parsed_entries)
+    finally:
+        close_symbol_table(symbol_table)
+    return parsed_share
+
+def sort_and_create_keys_for_references(reference_list,
+                                        duplicate_cache=None):
+    '''
+    Input: the parsed references (a list or any other iterable), and
+           optionally the duplicate cache (see find_duplicate_references())
+    Output: the list of references sorted by their collation keys, with
+            the LaTeX keys and the formatted author strings, titles and
+            venues
+
+    Note: The references are modified in place.
+    '''
+    reference_list = sort_references(reference_list)
+
     #-----------------------------------------------------------------
-    # concatenate the authors into a single string
+    # check for any duplicate references (see find_duplicate_references)
+    # and repeated BibTeX keys (see find_repeated_bibtex_keys)
     #-----------------------------------------------------------------
-    for reference in reference_list:
-        if not reference['INCLUDE_FLAG']:
-            continue  # skip this reference; it had some error
-        
-        author_string = ''
-        for authors in reference['author_list']:
-            author_string += '{} {}, '.format(authors['last_name'],
-                                              authors['first_names'])
+    find_duplicate_references(reference_list, duplicate_cache)
+    find_repeated_bibtex_keys(reference_list)
+
+    create_keys_for_references(reference_list)
+    return reference_list
 
-        author_string = author_string[:-2]
-        if author_string[-1] != '.':
-            author_string += '.'
-            
-        reference['author_string'] = author_string
+def sort_references(reference_list):
+    '''
+    Input: the parsed references (a list or any other iterable)
+    Output: the list of references sorted by their collation keys, with
+            the author strings
+    '''
+    reference_list = list(reference_list)
 
     #-----------------------------------------------------------------
-    # sort the references using the authors list, breaking ties using
-    # the year of publication, and then the title
+    # concatenate the authors into a single string (see
+    # create_author_strings())
     #-----------------------------------------------------------------
-    reference_list.sort(key=lambda reference: (reference['author_string'],
-                                               int(reference['year']),
-                                               reference['title']))
+    for reference in reference_list:
+        if not reference.INCLUDE_FLAG:
+            continue  # skip this reference; it had some error
+        reference.author_string = reference.author_strings[0]
 
     #-----------------------------------------------------------------
-    # check for any duplicate references
+    # sort the references using the authors list, breaking ties using
+    # the year of publication, and then the title (i.e. using their
+    # collation keys; see create_collation_key()); the references of
+    # each BibTeX file are sorted on their own, and the sorted files are
+    # then merged (ties keep the order of the files)
     #-----------------------------------------------------------------
-    for i in range(len(reference_list) - 1):
-        ref1 = reference_list[i]
-        ref2 = reference_list[i+1]
-
-        if not ref1['INCLUDE_FLAG'] or not ref2['INCLUDE_FLAG'] :
-            continue  # skip this reference pair; it had some error
-        
-        if ref1['author_string'].lower() == ref2['author_string'].lower():
-            if ref1['title'].lower() == ref2['title'].lower():
-                ref2['error_message'] += \
-                    '\n- The following are duplicate entries: references'\
-                    + ' #{} and #{}.'.format(ref1['id'], ref2['id'])\
-                    + ' Please remove one of the duplicate entries from' \
-                    + ' the .bibtex file.'
-                ref2['duplicate'] = True
-                ref2['INCLUDE_FLAG'] = False
-            else:
-                ref2['warning_message'] += \
-                    '\n- The following are possibly duplicate entries: '\
-                    + '# {} and #{}.'.format(ref1['id'], ref2['id'])\
-                    + ' Consider checking them manually.'
-                ref2['possible_duplicate'] = True
+    references_by_source = {}
+    for reference in reference_list:
+        references_by_source.setdefault(reference.source, []).append(
+            reference)
+    return list(heapq.merge(
+        *[sorted(references, key=get_sort_key)
+          for references in references_by_source.values()],
+        key=get_sort_key))
 
+def create_keys_for_references(reference_list):
+    '''
+    Input: the sorted list of references, once the duplicates have been
+           found
+    Output: None; the LaTeX keys and the formatted author strings,
+            titles and venues are set in place
+    '''
     #-----------------------------------------------------------------
     # create LaTeX reference keys and the 'print_author_string'
-    # for the non-duplicate entries
-    # - single author: "<last_name><year>"
-    # - two authors  : "<last_name1>_<last_name2><year>"
-    # - three or more: "<last_name1>_etal<year>"
+    # for the non-duplicate entries (see
+    # create_key_and_print_author_string())
     #-----------------------------------------------------------------
     for reference in reference_list:
-        if not reference['INCLUDE_FLAG']:
+        if not reference.INCLUDE_FLAG:
             continue # skip this reference; it had some error
         
-        num_authors = len(reference['author_list'])
-        if num_authors == 0:
-            reference['warning_message'] += \
+        if len(reference.author_list) == 0:
+            reference.warning_message += \
                 '\n- This entry has zero authors.'
-            key_string = '???{}'.format(reference['year'])
-            print_author_string = '???'
-        if num_authors == 1:
-            key_string = '{}{}'.format(
-                reference['author_list'][0]['last_name'],
-                reference['year'])
-            print_author_string = '{}'.format(
-                reference['author_list'][0]['last_name'])
-        elif num_authors == 2:
-            key_string = '{}_{}{}'.format(
-                reference['author_list'][0]['last_name'],
-                reference['author_list'][1]['last_name'],
-                reference['year'])
-            print_author_string = '{} and {}'.format(
-                reference['author_list'][0]['last_name'],
-                reference['author_list'][1]['last_name'])
-        else:
-            key_string = '{}_etal{}'.format(
-                reference['author_list'][0]['last_name'],
-                reference['year'])
-            print_author_string = '{} et al.'.format(
-                reference['author_list'][0]['last_name'])
-            
-        # remove any special characters (except '-' and '_')
-        # and make everything lower case
-        reference['key'] = re.sub('[^A-Za-z0-9_-]+', '', key_string).lower()
-        reference['print_author_string'] = print_author_string
+        reference.key, reference.print_author_string = \
+            reference.author_strings[1:3]
 
     #-----------------------------------------------------------------
-    # if two references have the same key, then add year index, i.e.
-    # to have something like (Feynman, 1960a, 1960b, 1960c)
+    # if several references have the same key, then add year index, i.e.
+    # to have something like (Feynman, 1960a, 1960b, 1960c) (see
+    # create_year_indices())
     #-----------------------------------------------------------------
-    letters = 'abcdefghijklmnopqrstuvwxyz'
-    year_index_integer = 0
-    for i in range(len(reference_list) - 1):
-        ref1 = reference_list[i]
-        ref2 = reference_list[i+1]
-
-        if year_index_integer > 25:
-            raise ValueError('Year index went beyond z! Please modify'\
-                             ' the code before proceeding.')
-
-        if not ref2['duplicate'] and ref1['key'] == ref2['key']:
-            ref1['year_index'] = letters[year_index_integer]
-            ref2['year_index'] = letters[year_index_integer + 1]
-            year_index_integer += 1
-        else:
-            year_index_integer = 0
+    create_year_indices(reference_list)
 
     #-----------------------------------------------------------------
     # create the [XYZ+2025] style of author list
     #-----------------------------------------------------------------
     for reference in reference_list:
-        xyz_author_str = ''
-        num_authors = len(reference['author_list'])
-        if len(reference['author_list']) == 1:
-            author = reference['author_list'][0]
-            xyz_author_str += author['last_name'][:3]
-        else:
-            for authors in reference['author_list']:
-                xyz_author_str += authors['last_name'][0]
-            if len(xyz_author_str) > 4:
-                xyz_author_str = xyz_author_str[:4] + '+'
-        xyz_author_str += reference['year'] + reference['year_index']
-        reference['xyz_print_author_string'] = xyz_author_str
+        if not reference.INCLUDE_FLAG:
+            continue # skip this reference; it had some error
+        reference.xyz_print_author_string = reference.author_strings[3] \
+            + reference.year + reference.year_index
         
     for reference in reference_list:
-        if reference['INCLUDE_FLAG']:
-            reference['key'] += reference['year_index']
+        if reference.INCLUDE_FLAG:
+            reference.key += reference.year_index
 
             # if it is a paper, make the publisher italic
             # if it is a book, make the title italic
-            style = bib_entry_types[reference['type']]['style']
+            style = bib_entry_types[reference.type]['style']
             if style == 'paper_like':
-                reference['venue'] = '\\textit{{{}}}'.format(
-                    reference['venue'])
+                reference.venue = '\\textit{{{}}}'.format(
+                    reference.venue)
             elif style == 'book_like':
-                reference['title'] = '\\textit{{{}}}'.format(
-                    reference['title'])
+                reference.title = '\\textit{{{}}}'.format(
+                    reference.title)
             else:
                 # This branch shouldn't have been invoked! There must be
                 # some error in the program.
                 raise ValueError('Unknown bibliography entry type:'\
-                                 ' {}'.format(reference['type']))
-    return reference_list
+                                 ' {}'.format(reference.type))
 
-def layout_latex_references(reference_list, dumbib_database_filename):
-    if dumbib_database_filename[-4:] == '.tex':
-        output_filename = dumbib_database_filename
-        log_filename = dumbib_database_filename[:-4] + '.log'
+def create_author_strings(reference):
+    '''
+    Input: a reference with the author list, the year, and the collation
+           key
+    Output: None; reference.author_strings is set to a tuple (<author
+            string>, <LaTeX reference key>, <author string that is
+            printed in-text>, <XYZ+ style of the author list>), without
+            the year index (which depends on the other references)
+
+    Note: These only depend on the entry itself, so they are computed
+    once per entry (and stored in the entry cache, like the collation
+    key), rather than on every build; sort_and_create_keys_for_references()
+    then only adds the year indices.
+    '''
+    # concatenate the authors into a single string
+    author_string = ''
+    for authors in reference.author_list:
+        author_string += '{} {}, '.format(authors['last_name'],
+                                          authors['first_names'])
+
+    author_string = author_string[:-2]
+    if author_string[-1] != '.':
+        author_string += '.'
+
+    # the [XYZ+2025] style of author list (the LaTeX markup is converted
+    # to Unicode first, so that "{\\"O}ber" gives "Öbe" rather than
+    # '{\\"')
+    xyz_author_str = ''
+    if len(reference.author_list) == 1:
+        author = reference.author_list[0]
+        xyz_author_str += latex_to_unicode(author['last_name'])[:3]
     else:
-        output_filename = dumbib_database_filename + '.tex'
-        log_filename = dumbib_database_filename + '.log'
+        for authors in reference.author_list:
+            xyz_author_str += latex_to_unicode(authors['last_name'])[:1]
+        if len(xyz_author_str) > 4:
+            xyz_author_str = xyz_author_str[:4] + '+'
 
-    # create a dumbib database
-    with open(output_filename, 'w') as f:
-        for reference in reference_list:
-            if reference['INCLUDE_FLAG']:
-                print('\\dumbibReferenceEntry[{optional}]{{{key}}}'\
-                      '{{{print_author}}}{{{year}{year_index}}}%\n'\
-                      '{{{author_list} ({year}{year_index}).'\
-                      ' {title}. {venue}.}}\n'.format(
-                          key = reference['key'],
-                          optional = reference['xyz_print_author_string'],
-                          print_author = reference['print_author_string'],
-                          year = reference['year'],
-                          year_index = reference['year_index'],
-                          author_list = reference['author_string'],
-                          title = reference['title'],
-                          venue = reference['venue']), file=f)
-
-    # print the error and warning messages into a log file
-    with open(log_filename, 'w') as f:
-        reference_list.sort(key = lambda reference: (reference['id']))
-        for reference in reference_list:
-            PRINT_ON_TERMINAL_FLAG = False
-            
-            print_string = '=' * 64 + '\n'\
-                + 'Reference id: {}  (key generated: {})\n'.format(
-                    reference['id'], reference['key'])\
-                + '-' * 64 + '\n~~~~~~~~~~~~~~~~~~\n'\
-                + 'Raw .bibtex input:\n~~~~~~~~~~~~~~~~~~\n'\
-                + '{}\n'.format(reference['raw_data']) + '\n'
-            
-            if reference['INCLUDE_FLAG']:
-                print_string += '~~~~~~~~~~~~~~~~~~~~~\n'\
-                    + 'The processed output:\n'\
-                    + '~~~~~~~~~~~~~~~~~~~~~\n'\
-                    +'{} ({}{}). {}. {}.'.format(
-                        reference['author_string'],
-                        reference['year'],
-                        reference['year_index'],
-                        reference['title'],
-                        reference['venue'])
-            else:
-                PRINT_ON_TERMINAL_FLAG = True
-                print_string += '~' * 59 + '\n'\
-                    'No output was generated! Following errors were'\
-                    + ' encountered:\n'\
-                    + '~' * 59 + reference['error_message']
-                
-            if len(reference['warning_message']) > 0:
-                print_string += '\n\n'\
-                    + '~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~\n'\
-                    + 'There are some warnings for this entry:\n'\
-                    + '~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~'\
-                    + reference['warning_message']
-            print_string += '\n' + '=' * 64 + '\n\n\n'
-                
-            print(print_string, file=f)
-            
-            if PRINT_ON_TERMINAL_FLAG:
-                print(print_string)
-
-def extract_text_in_braces(temp_string):
-    string_len = len(temp_string)
-    start_idx = None
-    end_idx = None
-    braces_stack = []
-
-    i = 0
-    while start_idx is None and i < string_len:
-        if temp_string[i] == '{':
-            start_idx = i+1
-            braces_stack.append('{')
-            break
-        i += 1
-        
-    if start_idx is None:
-        raise ValueError('String does not have an opening brace:'\
-                         '\n{}'.format(string_len))
-
-    i = start_idx
-    while end_idx is None and i < string_len:
-        if temp_string[i] == '{':
-            braces_stack.append('{')
-        elif temp_string[i] == '}':
-            if braces_stack.pop() != '{':
-                raise ValueError('String does not have matching braces:'\
-                                 '\n{}'.format(string_len))
-            if len(braces_stack) == 0:
-                end_idx = i
-                break                
-        i += 1
-
-    if end_idx is None:
-        raise ValueError('String does not have a closing brace:'\
-                         '\n{}'.format(string_len))
+    reference.author_strings = (author_string,) \
+        + create_key_and_print_author_string(reference) + (xyz_author_str,)
+
+def create_year_indices(reference_list):
+    '''
+    Input: the sorted list of references, with their keys without the
+           year index
+    Output: None; the year indices of the included references are set
+            in place
+
+    Note: The references are grouped by their key (wherever they are in
+    the sorted list), and the year indices follow the sorted order; the
+    references with a key of their own have no year index.
+    '''
+    references_by_key = {}
+    for reference in reference_list:
+        if reference.INCLUDE_FLAG:
+            references_by_key.setdefault(reference.key, []).append(
+                reference)
+    for references in references_by_key.values():
+        for i, reference in enumerate(references):
+            reference.year_index = get_year_index(i) \
+                if len(references) > 1 else ''
+
+def get_year_index(index):
+    '''
+    Input: the position (starting from 0) of a reference among the
+           references with the same key
+    Output: its year index, i.e. 'a', 'b', ..., 'z', 'aa', 'ab', ...
+    '''
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    year_index = ''
+    index += 1
+    while index > 0:
+        index, remainder = divmod(index - 1, len(letters))
+        year_index = letters[remainder] + year_index
+    return year_index
+
+# the references which are left out sort first
+empty_collation_key = ((), 0, '')
+
+def get_sort_key(reference):
+    if not reference.INCLUDE_FLAG:
+        return empty_collation_key
+    return reference.collation_key
+
+def create_key_and_print_author_string(reference):
+    '''
+    Input: a reference with the author list, the year, and the collation
+           key
+    Output: a tuple (<LaTeX reference key without the year index>,
+            <author string that is printed in-text>)
+
+    Notes:
+    The LaTeX reference keys are
+    - single author: "<last_name><year>"
+    - two authors  : "<last_name1>_<last_name2><year>"
+    - three or more: "<last_name1>_etal<year>"
+
+    The key is created from the collated last names, so that, e.g.,
+    "M{\\"u}ller", "M\\"{u}ller", and "Müller" all give "muller".
+    '''
+    num_authors = len(reference.author_list)
+    last_names = [last_name for last_name, _ in reference.collation_key[0]]
+    if num_authors == 0:
+        key_string = '???{}'.format(reference.year)
+        print_author_string = '???'
+    elif num_authors == 1:
+        key_string = '{}{}'.format(last_names[0], reference.year)
+        print_author_string = '{}'.format(
+            reference.author_list[0]['last_name'])
+    elif num_authors == 2:
+        key_string = '{}_{}{}'.format(last_names[0], last_names[1],
+                                      reference.year)
+        print_author_string = '{} and {}'.format(
+            reference.author_list[0]['last_name'],
+            reference.author_list[1]['last_name'])
+    else:
+        key_string = '{}_etal{}'.format(last_names[0], reference.year)
+        print_author_string = '{} et al.'.format(
+            reference.author_list[0]['last_name'])
         
-    return temp_string[start_idx:end_idx]
+    # remove any special characters (except '-' and '_')
+    # and make everything lower case
+    key = re.sub('[^A-Za-z0-9_-]+', '', key_string).lower()
+    return key, print_author_string
 
+def layout_latex_references(reference_list, dumbib_database_filename,
+                            log_level='full', log_format='text', file=None,
+                            shard_prefix_length=None, log_fd=None,
+                            sources=None, latex_records=None,
+                            log_records=None, written_files=None):
+    '''
+    Input: the sorted list of references, the dumbib database filename
+           ('-' for the standard output), the log level ('none' for no
+           log) and format, the text stream for the summary of the
+           errors (default: the terminal), the length of the key
+           prefixes of the shards (see write_dumbib_database()), the
+           file descriptor to write the log into (default: the .log file
+           next to the dumbib database), the contents of the sources
+           which are not files (see write_log()), and the entries of the
+           dumbib database, the log records, and the files of a previous
+           build to reuse (see write_latex_references(), write_log() and
+           write_file_if_changed())
+    Output: None
 
-#======================================================================
-# The main() code
-#======================================================================
-if __name__ == "__main__":
-    # read command line arguments to get parameter configurations
-    parser = argparse.ArgumentParser()
-    parser.add_argument('-in', '--input_filename', required=True,
-                        type=str)
-    parser.add_argument('-out', '--output_filename', required=True,
-                        type=str)
-    
-    args = parser.parse_args()
-    bibtex_filename = args.input_filename
-    dumbib_database_filename = args.output_filename
-    
-    reference_list = process_bibtex_into_reference_list(bibtex_filename)
-    reference_list = sort_and_create_keys_for_references(reference_list)
-    layout_latex_references(reference_list, dumbib_database_filename)
+    Note: If the dumbib database goes to the standard output, the log is
+    only written if log_fd is given.
+    '''
+    output_filename, log_filename, _ = get_output_filenames(
+        dumbib_database_filename)
+
+    # create a dumbib database
+    write_dumbib_database(reference_list, output_filename,
+                          shard_prefix_length, latex_records, written_files)
+
+    # print the error and warning messages into a log file, and a
+    # summary of the errors on the terminal
+    reference_list.sort(key = lambda reference: (reference.id))
+    if log_level == 'none':
+        log_filename = None
+    elif log_fd is not None:
+        with open(log_fd, 'w', closefd=False) as f:
+            write_log(reference_list, f, log_level, log_format, sources,
+                      log_records)
+        log_filename = 'file descriptor {}'.format(log_fd)
+    elif log_filename is not None:
+        with io.StringIO() as f:
+            write_log(reference_list, f, log_level, log_format, sources,
+                      log_records)
+            write_file_if_changed(log_filename, f.getvalue(), written_files)
+    print_error_summary(reference_list, log_filename, file)
+
+def write_latex_references(reference_list, f, latex_records=None):
+    '''
+    Input: the sorted list of references (only those with INCLUDE_FLAG
+           are written), a text stream (e.g. an open file or an
+           io.StringIO), and optionally a dictionary {<reference>: <its
+           entry in the dumbib database>} of the entries of a previous
+           build to reuse (which is updated by this function; see
+           update_dumbib_database())
+    Output: None; the dumbib database is written into the stream
+    '''
+    for reference in reference_list:
+        if not reference.INCLUDE_FLAG:
+            continue
+        record = None if latex_records is None \
+            else latex_records.get(reference)
+        if record is None:
+            record = format_latex_reference(reference)
+            if latex_records is not None:
+                latex_records[reference] = record
+        f.write(record)
+
+def format_latex_reference(reference):
+    return '\\dumbibReferenceEntry[{optional}]{{{key}}}'\
+        '{{{print_author}}}{{{year}{year_index}}}%\n'\
+        '{{{author_list} ({year}{year_index}).'\
+        ' {title}. {venue}.}}\n\n'.format(
+            key = reference.key,
+            optional = reference.xyz_print_author_string,
+            print_author = reference.print_author_string,
+            year = reference.year,
+            year_index = reference.year_index,
+            author_list = reference.author_string,
+            title = reference.title,
+            venue = reference.venue)
+
+def write_dumbib_database(reference_list, output_filename,
+                          shard_prefix_length=None, latex_records=None,
+                          written_files=None):
+    '''
+    Input: the sorted list of references, the .tex file of the dumbib
+           database ('-' for the standard output), the number of
+           characters of the key prefixes used for splitting the
+           database into shards (default: write a single file), and the
+           entries of a previous build to reuse (see
+           write_latex_references()) and the files it wrote (see
+           write_file_if_changed())
+    Output: None; the dumbib database is written (see
+            write_file_if_changed())
+
+    Notes:
+    With shard_prefix_length, the references are split by the first
+    shard_prefix_length characters of their keys into the shards
+    "<dumbib database>-<prefix>.tex" (e.g. "dumbib_database-do.tex"
+    holds the keys starting with "do"), and the .tex file of the
+    database becomes an index with one line
+    "\\dumbibShard{<shard>}{<comma separated keys>}" per shard. LaTeX then
+    only inputs the shards containing a key that was cited in the
+    previous run (see dumbib.sty), instead of storing every reference
+    of a large database.
+
+    The shards are written in the order of their prefixes, and each
+    shard in the usual order, so the bibliography is in the same order
+    as with a single file (except for the rare names that start with
+    punctuation, such as "'t Hooft"). The shards are named relative to
+    the directory LaTeX runs in, i.e. the script is assumed to run in
+    the same directory as LaTeX. The shards of a previous run whose
+    prefix no longer exists are not deleted, but are not input either.
+    '''
+    if output_filename == '-':
+        write_latex_references(reference_list, sys.stdout, latex_records)
+        sys.stdout.flush()
+        return
+    if shard_prefix_length is None:
+        with io.StringIO() as f:
+            write_latex_references(reference_list, f, latex_records)
+            write_file_if_changed(output_filename, f.getvalue(),
+                                  written_files)
+        return
+
+    shards = {}
+    for reference in reference_list:
+        if reference.INCLUDE_FLAG:
+            shards.setdefault(reference.key[:shard_prefix_length],
+                              []).append(reference)
+    with io.StringIO() as index:
+        print('% The references are in the shards listed below (see the'\
+              ' --shard_prefix_length\n% option of'\
+              ' create_dumbib_database.py).', file=index)
+        for prefix in sorted(shards):
+            shard_filename = '{}-{}'.format(output_filename[:-4], prefix)
+            with io.StringIO() as f:
+                write_latex_references(shards[prefix], f, latex_records)
+                write_file_if_changed(shard_filename + '.tex', f.getvalue(),
+                                      written_files)
+            print('\\dumbibShard{{{}}}{{{}}}%'.format(
+                shard_filename.replace(os.sep, '/'),
+                ','.join(reference.key for reference in shards[prefix])),
+                  file=index)
+        write_file_if_changed(output_filename, index.getvalue(),
+                              written_files)
+
+def get_output_filenames(dumbib_database_filename):
+    '''
+    Input: the dumbib database filename given on the command line
+    Output: a tuple with the names of the .tex, the .log, and the entry
+            cache file; for '-' (the standard output), this is ('-', None,
+            None), i.e. there is no default log or entry cache file
+    '''
+    if dumbib_database_filename == '-':
+        return '-', None, None
+    if dumbib_database_filename[-4:] == '.tex':
+        base_filename = dumbib_database_filename[:-4]
+    else:
+        base_filename = dumbib_database_filename
+    return (base_filename + '.tex', base_filename + '.log',
+            base_filename + '.cache')
+
+def write_file_if_changed(filename, text, written_files=None):
+    '''
+    Input: the filename, the new contents of the file, and optionally a
+           dictionary {<filename>: (<contents>, <file signature (see
+           get_file_signature())>)} of the files written before (which is
+           updated by this function)
+    Output: True if the file was written, and False if it already had
+            exactly the same contents
+
+    Notes:
+    Leaving an unchanged file untouched keeps its modification time, so
+    that tools such as latexmk do not trigger an extra LaTeX pass.
+
+    The new contents are written into a temporary file which then
+    replaces the old file, so that LaTeX (or an editor) never sees a
+    half-written file, e.g. while the script is running with --watch.
+
+    With written_files, the new contents are compared with the ones
+    written before, instead of reading the file again, unless the file
+    changed since (e.g. a large log, which --watch rewrites often).
+    '''
+    old_text, signature = (written_files or {}).get(filename, (None, None))
+    if signature is None or signature != get_file_signature(filename):
+        try:
+            with open(filename) as f:
+                old_text = f.read()
+        except OSError:
+            old_text = None # the file does not exist yet
+    FLAG_CHANGED = old_text != text
+    if FLAG_CHANGED:
+        temporary_filename = filename + '.tmp'
+        with open(temporary_filename, 'w') as f:
+            f.write(text)
+        os.replace(temporary_filename, filename)
+    if written_files is not None:
+        written_files[filename] = (text, get_file_signature(filename))
+    return FLAG_CHANGED
+
+#--------------------------------------------------------------------
+# log writer (see the --log_level and --log_format options)
+#--------------------------------------------------------------------
+# the entries written into the log at each level: 'errors' only lists
+# the entries that were left out of the dumbib database, 'warnings' also
+# lists the entries with warnings, and 'full' lists all the entries
+log_levels = ['errors', 'warnings', 'full']
+log_formats = ['text', 'json']
+
+# at most these many entries with errors are printed on the terminal;
+# the rest are only in the log file
+MAX_ERRORS_ON_TERMINAL = 20
+
+def get_log_status(reference):
+    '''
+    Output: 'error' if the reference was left out of the dumbib database,
+            'warning' if it has warnings, and 'ok' otherwise
+    '''
+    if not reference.INCLUDE_FLAG:
+        return 'error'
+    elif len(reference.warning_message) > 0:
+        return 'warning'
+    else:
+        return 'ok'
+
+def split_messages(message):
+    '''
+    Input: an error or warning message of a reference, i.e. a string of
+           the form "\n- <message 1>\n- <message 2>..."
+    Output: the list of the individual messages
+    '''
+    return message.split('\n- ')[1:]
+
+def write_log(reference_list, f, log_level='full', log_format='text',
+              sources=None, log_records=None):
+    '''
+    Input: the list of references, a text stream, the log level (see
+           "log_levels" above), the log format ('text' or 'json'),
+           optionally the contents (as bytes) of the sources which are
+           not files, e.g. {'paper.bib': <bytes>}, and a dictionary
+           {<reference>: (<id>, <line number>, <head of its log record>,
+           <rest of the record>)} of the records of a previous build to
+           reuse (which is updated by this function; see
+           update_dumbib_database())
+    Output: None; the log is written into the stream
+
+    Notes:
+    The records are written with writelines(); the script writes into an
+    io.StringIO and then writes the file in one go (see
+    write_file_if_changed()). The raw BibTeX text is only included for
+    the entries that have errors or warnings; the processed output is
+    included for all the entries in the dumbib database.
+
+    In the 'json' format, the log has one JSON object per line (JSON
+    Lines), with the keys "id", "source", "line", "bib_key", "key",
+    "status" (see get_log_status()), "errors", "warnings", and, where
+    applicable, "output" and "raw".
+    '''
+    minimum_level = {'error': 'errors', 'warning': 'warnings', 'ok': 'full'}
+    logged_statuses = {status for status, level in minimum_level.items()
+                       if log_levels.index(level)
+                       <= log_levels.index(log_level)}
+    sources = sources or {}
+    open_sources = dict(sources)
+    for reference in reference_list:
+        status = get_log_status(reference)
+        if status not in logged_statuses:
+            continue
+        record = None if log_records is None \
+            else log_records.get(reference)
+        if record is None:
+            raw_data = None if status == 'ok' \
+                else read_raw_data(reference, open_sources)
+            if log_format == 'json':
+                body = format_json_log_record(reference, status, raw_data)
+            else:
+                body = ''.join(format_text_log_record(reference, raw_data))
+            record = (reference.id, reference.line,
+                      format_log_record_head(reference, log_format), body)
+        elif record[:2] != (reference.id, reference.line):
+            record = (reference.id, reference.line,
+                      format_log_record_head(reference, log_format),
+                      record[3])
+        if log_records is not None:
+            log_records[reference] = record
+        f.write(record[2])
+        f.write(record[3])
+    for source, data in open_sources.items():
+        if source not in sources:
+            data.close()
+
+def format_processed_output(reference):
+    return '{} ({}{}). {}. {}.'.format(
+        reference.author_string, reference.year, reference.year_index,
+        reference.title, reference.venue)
+
+def format_log_record_head(reference, log_format='text'):
+    '''
+    Output: the start of the log record of the reference, with its id,
+            source, and line number (and, in the 'text' format, its key)
+
+    Note: The rest of the record (see format_text_log_record() and
+    format_json_log_record()) does not depend on these, so that it can
+    be reused when only the position of the entry changed (see
+    write_log()).
+    '''
+    if log_format == 'json':
+        return '{{"id": {}, "source": {}, "line": {}, '.format(
+            reference.id, json.dumps(reference.source, ensure_ascii=False),
+            reference.line)
+    return '{}\nReference id: {}  (key generated: {})\n'\
+        'Source: {}, line {}\n{}\n'.format(
+            '=' * 64, reference.id, reference.key, reference.source,
+            reference.line, '-' * 64)
+
+def format_text_log_record(reference, raw_data):
+    '''
+    Output: a list of the strings making up the log record of the
+            reference, after its head (see format_log_record_head())
+    '''
+    record = []
+    if raw_data is not None:
+        record += ['~~~~~~~~~~~~~~~~~~\n',
+                   'Raw .bibtex input:\n',
+                   '~~~~~~~~~~~~~~~~~~\n',
+                   raw_data, '\n\n']
+
+    if reference.INCLUDE_FLAG:
+        record += ['~~~~~~~~~~~~~~~~~~~~~\n',
+                   'The processed output:\n',
+                   '~~~~~~~~~~~~~~~~~~~~~\n',
+                   format_processed_output(reference)]
+    else:
+        record += ['~' * 59, '\n',
+                   'No output was generated! Following errors were'\
+                   ' encountered:\n',
+                   '~' * 59, reference.error_message]
+
+    if len(reference.warning_message) > 0:
+        record += ['\n\n',
+                   '~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~\n',
+                   'There are some warnings for this entry:\n',
+                   '~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~',
+                   reference.warning_message]
+    record += ['\n', '=' * 64, '\n\n\n\n']
+    return record
+
+def format_json_log_record(reference, status, raw_data):
+    '''
+    Output: the JSON object of the log record of the reference, without
+            its opening brace and its head (see format_log_record_head())
+    '''
+    record = {'bib_key': reference.bib_key,
+              'key': reference.key if reference.INCLUDE_FLAG else None,
+              'status': status,
+              'errors': split_messages(reference.error_message),
+              'warnings': split_messages(reference.warning_message)}
+    if reference.INCLUDE_FLAG:
+        record['output'] = format_processed_output(reference)
+    if raw_data is not None:
+        record['raw'] = raw_data
+    return json.dumps(record, ensure_ascii=False)[1:] + '\n'
+
+def print_error_summary(reference_list, log_filename, file=None):
+    '''
+    Prints the errors of (at most MAX_ERRORS_ON_TERMINAL of) the entries
+    that were left out of the dumbib database, with their file and line
+    number, followed by the number of entries with errors and warnings.
+    '''
+    failed_references = [reference for reference in reference_list
+                         if not reference.INCLUDE_FLAG]
+    num_warnings = sum(1 for reference in reference_list
+                       if reference.INCLUDE_FLAG
+                       and len(reference.warning_message) > 0)
+    lines = []
+    for reference in failed_references[:MAX_ERRORS_ON_TERMINAL]:
+        lines.append('{}:{}: entry "{}" (reference id {}) was left out:\n'\
+                     .format(reference.source, reference.line,
+                             reference.bib_key, reference.id))
+        lines += ['    - {}\n'.format(message) for message in
+                  split_messages(reference.error_message)]
+    if len(failed_references) > MAX_ERRORS_ON_TERMINAL:
+        lines.append('... and {} more entries with errors.\n'.format(
+            len(failed_references) - MAX_ERRORS_ON_TERMINAL))
+    if len(failed_references) + num_warnings > 0:
+        lines.append('{} entries had errors and {} had warnings{}.\n'.format(
+            len(failed_references), num_warnings,
+            '' if log_filename is None
+            else '; see {} for the details'.format(log_filename)))
+    (sys.stdout if file is None else file).writelines(lines)
+
+#--------------------------------------------------------------------
+# incremental rebuild cache
+#--------------------------------------------------------------------
+ENTRY_CACHE_VERSION = 9
+
+# the attributes of a reference which are filled in by the find_*
+# functions; only these are stored in the entry cache
+cached_reference_keys = ['INCLUDE_FLAG', 'author_list', 'author_strings',
+                         'bib_key', 'cited', 'collation_key', 'dependencies',
+                         'entry_type', 'type', 'title', 'venue', 'year',
+                         'error_message', 'warning_message',
+                         'pending_problems']
+
+def load_entry_cache(cache_filename, venue_index=None,
+                     venue_match_threshold=None, author_name_cache=None):
+    '''
+    Input: the filename of the entry cache, and optionally the venue
+           index (default: that of the default venue list) and the venue
+           match threshold that the entries will be parsed with (see
+           find_venue()), and the author name cache into which to put
+           the author names of the cache (see create_author_name_cache())
+    Output: a dictionary mapping the hash of each raw BibTeX entry to its
+            parsed fields, or an empty dictionary if there is no usable
+            cache
+
+    Notes:
+    The whole cache is discarded if it was created by a different version
+    of this script, with a different venue list, or with a different
+    --venue_match_threshold, since the parsed venues (and error messages)
+    depend on them; a venue index which was not loaded from a file (see
+    load_venue_index()) has no version, so the cache is never reused with
+    it. The parsed author names stored in the cache do not depend on the
+    venue list, and are put into the author name cache (if given) in
+    either case.
+    '''
+    if venue_index is None:
+        venue_index = load_venue_index(venue_filename)
+    try:
+        with open(cache_filename, 'rb') as f:
+            cache = pickle.load(f)
+        if cache['version'] == ENTRY_CACHE_VERSION:
+            if author_name_cache is not None:
+                author_name_cache['names'].update(cache['author_names'])
+            if cache['venue_sha1'] is not None \
+               and cache['venue_sha1'] == venue_index.get('sha1') \
+               and cache['venue_match_threshold'] == venue_match_threshold:
+                return cache['entries']
+    except Exception:
+        pass
+    return {}
+
+def create_entry_cache(reference_list):
+    '''
+    Input: the reference list returned by
+           process_bibtex_into_reference_list()
+    Output: a dictionary mapping the hash of each raw BibTeX entry to its
+            parsed fields
+
+    Note: This has to be called before sort_and_create_keys_for_references()
+    since that function modifies the references in place. The references
+    whose venue was skipped (see parse_reference()) are cached too, with
+    their venue pending, so that they only need their venue to be found
+    if they are cited later (see restore_from_entry_cache()).
+    '''
+    return {reference.hash: get_cached_fields(reference)
+            for reference in reference_list}
+
+def get_cached_fields(reference):
+    return tuple(getattr(reference, key) for key in cached_reference_keys)
+
+def restore_cached_fields(reference, cached_fields):
+    for key, value in zip(cached_reference_keys, cached_fields):
+        setattr(reference, key, value)
+
+def get_parsed_fields(reference_list, entry_cache):
+    '''
+    Input: the parsed references, and the entry cache created from them
+           (see create_entry_cache())
+    Output: a dictionary {<reference>: <its parsed fields (see
+            get_cached_fields())>}
+
+    Note: The fields are those of the entry cache, except for the entries
+    whose raw text appears more than once, which may have been parsed
+    with different macros.
+    '''
+    parsed_fields = {reference: entry_cache[reference.hash]
+                     for reference in reference_list}
+    if len(entry_cache) < len(parsed_fields):
+        hash_counts = collections.Counter(reference.hash
+                                          for reference in reference_list)
+        for reference in reference_list:
+            if hash_counts[reference.hash] > 1:
+                parsed_fields[reference] = get_cached_fields(reference)
+    return parsed_fields
+
+def restore_parsed_reference(reference, parsed_fields):
+    '''
+    Input: a reference after sort_and_create_keys_for_references(), and
+           its parsed fields (see get_parsed_fields())
+    Output: None; the reference is restored in place to what it was right
+            after being parsed
+    '''
+    reference.author_string = ''
+    reference.duplicate = False
+    reference.duplicate_of = None
+    reference.possible_duplicate = False
+    reference.key = 'None'
+    reference.print_author_string = None
+    reference.xyz_print_author_string = None
+    reference.year_index = ''
+    restore_cached_fields(reference, parsed_fields)
+
+def restore_from_entry_cache(reference, entry_cache, symbol_table,
+                             cited_base_keys=None, venue_index=None,
+                             venue_match_threshold=None, raw_data=None):
+    '''
+    Input: an unparsed reference, the entry cache (or None), the symbol
+           table (see create_symbol_table()), and optionally the cited
+           base keys, the venue index and the venue match threshold (see
+           parse_reference()), and the raw text of the reference
+           (default: it is read again if need be, see read_raw_data())
+    Output: True if the parsed fields of the reference were restored from
+            the entry cache, and False if it has to be parsed
+
+    Notes:
+    An entry with the same raw text is only reused if the macros and the
+    crossref entries that it used (see BibtexFields) are the same as in
+    the symbol table, i.e. if parsing it again would give the same
+    result.
+
+    If the venue of the cached entry is pending (since it was not cited
+    in a previous run) but the entry may be cited now, only its venue is
+    found (see complete_reference()).
+    '''
+    cached_fields = None if entry_cache is None \
+        else entry_cache.get(reference.hash)
+    if cached_fields is None:
+        return False
+    for kind, name, value in cached_fields[
+            cached_reference_keys.index('dependencies')]:
+        if kind == '@string':
+            current_value = symbol_table['macros'].get(name)
+        else: # 'crossref'
+            entry = symbol_table['entries'].get(name)
+            current_value = None if entry is None else entry[2]
+        if current_value != value:
+            return False
+    restore_cached_fields(reference, cached_fields)
+    if reference.cited is False \
+       and is_possibly_cited(reference, cited_base_keys):
+        if raw_data is None:
+            raw_data = read_raw_data(reference, symbol_table['open_sources'])
+        complete_reference(reference, raw_data, venue_index, symbol_table,
+                           venue_match_threshold)
+    return True
+
+def save_entry_cache(cache_filename, entry_cache, venue_index=None,
+                     venue_match_threshold=None, author_name_cache=None):
+    '''
+    Input: the filename of the entry cache, the entry cache (see
+           create_entry_cache()), the venue index and the venue match
+           threshold that its entries were parsed with (see
+           load_entry_cache()), and the author name cache whose names to
+           save with it (see create_author_name_cache())
+    '''
+    if venue_index is None:
+        venue_index = load_venue_index(venue_filename)
+    try:
+        with open(cache_filename, 'wb') as f:
+            pickle.dump({'version': ENTRY_CACHE_VERSION,
+                         'venue_sha1': venue_index.get('sha1'),
+                         'venue_match_threshold': venue_match_threshold,
+                         'entries': entry_cache,
+                         'author_names': [] if author_name_cache is None
+                                         else list(
+                                             author_name_cache['names']
+                                             .items())},
+                        f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+    except OSError:
+        pass # e.g. the directory is read-only; just skip the cache
+
+#--------------------------------------------------------------------
+# collation keys
+#--------------------------------------------------------------------
+# the combining characters for the LaTeX accent macros, e.g. \"{o}
+latex_accents = {'`': '\u0300', "'": '\u0301', '^': '\u0302', '~': '\u0303',
+                 '=': '\u0304', 'u': '\u0306', '.': '\u0307', '"': '\u0308',
+                 'r': '\u030A', 'H': '\u030B', 'v': '\u030C', 'd': '\u0323',
+                 'c': '\u0327', 'k': '\u0328', 'b': '\u0331'}
+# the LaTeX macros for special letters, e.g. \ss
+latex_letters = {'ss': 'ß', 'ae': 'æ', 'AE': 'Æ', 'oe': 'œ', 'OE': 'Œ',
+                 'aa': 'å', 'AA': 'Å', 'o': 'ø', 'O': 'Ø', 'l': 'ł',
+                 'L': 'Ł', 'i': 'ı', 'j': 'ȷ'}
+latex_accent_regex = re.compile(
+    r'\\(?:([`\'^~=."])|([uvHrdckb])(?=[\s{]))\s*'\
+    r'(?:{\s*(\\[ij]|[A-Za-z])\s*}|(\\[ij]|[A-Za-z]))')
+latex_letter_regex = re.compile(r'\\(ss|ae|AE|oe|OE|aa|AA|o|O|l|L|i|j)'\
+                                r'(?![A-Za-z])\s*')
+latex_markup_regex = re.compile(r'\\[A-Za-z]+\s*|\\|[{}]')
+# the letters that do not decompose into a base letter and an accent
+collation_translation_table = str.maketrans({
+    'ß': 'ss', 'æ': 'ae', 'Æ': 'AE', 'œ': 'oe', 'Œ': 'OE', 'ø': 'o',
+    'Ø': 'O', 'ł': 'l', 'Ł': 'L', 'đ': 'd', 'Đ': 'D', 'ð': 'd',
+    'Ð': 'D', 'þ': 'th', 'Þ': 'Th', 'ı': 'i', 'ȷ': 'j', '\u2010': '-',
+    '\u2011': '-', '\u2013': '-', '\u2019': "'"})
+
+def latex_to_unicode(text):
+    '''
+    Input: a string with LaTeX markup, e.g. 'Erd{\\H{o}}s'
+    Output: the string with the accents and special letters converted to
+            Unicode and the remaining markup (other macros and braces)
+            removed, e.g. 'Erdős'
+    '''
+    def replace_accent(match):
+        letter = match.group(3) or match.group(4)
+        letter = {'\\i': 'i', '\\j': 'j'}.get(letter, letter)
+        return letter + latex_accents[match.group(1) or match.group(2)]
+    text = latex_accent_regex.sub(replace_accent, text)
+    text = latex_letter_regex.sub(
+        lambda match: latex_letters[match.group(1)], text)
+    text = latex_markup_regex.sub('', text)
+    return unicodedata.normalize('NFC', text)
+
+def get_collation_string(text):
+    '''
+    Input: a string with LaTeX markup, such as a name or a title
+    Output: the string folded for comparisons: without markup, accents,
+            and punctuation (except '-' and "'"), in lower case, and with
+            single spaces, e.g. 'Erd{\\H{o}}s' and 'Erdős' both give
+            'erdos'
+    '''
+    text = unicodedata.normalize('NFKD', latex_to_unicode(text))
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    text = text.translate(collation_translation_table).casefold()
+    return ' '.join(re.sub(r"[^\w\s'-]|_", ' ', text).split())
+
+def create_collation_key(reference):
+    '''
+    Input: a reference with the author list, the year, and the title
+    Output: None; reference.collation_key is set to a tuple
+            (<tuple of the collated (last name, first names) of each
+            author>, <year as an integer>, <collated title>)
+
+    Notes:
+    The collation key is computed once per entry (and stored in the entry
+    cache), and is used for sorting the references, for detecting
+    duplicates, and for creating the LaTeX keys, so that the entries
+    which only differ in their LaTeX markup (e.g. '{\\"o}', '\\"{o}', or
+    'ö') are treated the same. An invalid year is treated as 0.
+    '''
+    year = str(reference.year)
+    reference.collation_key = (
+        tuple((get_collation_string(author['last_name']),
+               get_collation_string(author['first_names']))
+              for author in reference.author_list),
+        int(year) if year.isdigit() else 0,
+        get_collation_string(reference.title))
+
+#--------------------------------------------------------------------
+# duplicate detection
+#--------------------------------------------------------------------
+# two titles whose word sets have a Jaccard similarity of at least this
+# much are reported as possible duplicates, if at least this fraction of
+# the authors of the entry with fewer authors are authors of the other
+# entry too (e.g. the arXiv and the conference version of a paper)
+NEAR_DUPLICATE_THRESHOLD = 0.7
+NEAR_DUPLICATE_MIN_AUTHOR_OVERLAP = 0.5
+
+# MinHash signatures have MINHASH_BANDS * MINHASH_ROWS values; two titles
+# become candidates if all the rows of any band agree, i.e. with
+# probability 1 - (1 - J^4)^8 for titles with Jaccard similarity J
+# (0.89 for J = 0.7, and 0.99 for J = 0.8)
+MINHASH_BANDS = 8
+MINHASH_ROWS = 4
+# buckets with more than these many titles are skipped; such buckets
+# only arise when a band consists of very common words (e.g. "learning"
+# or "the"), whereas real near duplicates also agree on other bands
+MINHASH_MAX_BUCKET_SIZE = 100
+# the hash functions h(x) = (a * x + b) mod p of the signatures, with a
+# Mersenne prime p and fixed (seeded) random coefficients (a, b), so
+# that the output of the program is reproducible
+MINHASH_PRIME = 2**61 - 1
+minhash_coefficients = [
+    (minhash_random.randrange(1, MINHASH_PRIME),
+     minhash_random.randrange(MINHASH_PRIME))
+    for minhash_random in [random.Random(2023)]
+    for _ in range(MINHASH_BANDS * MINHASH_ROWS)]
+
+collation_word_regex = re.compile(r'[^\W_]+')
+
+def get_collation_words(text):
+    '''
+    Input: a collated string (see get_collation_string())
+    Output: the list of the alphanumeric words in the string
+    '''
+    return collation_word_regex.findall(text)
+
+def find_repeated_bibtex_keys(reference_list):
+    '''
+    Input: the list of references
+    Output: None; the references with a repeated BibTeX key are marked
+            in place
+
+    Note: As in BibTeX, the keys are compared irrespective of case, and
+    only the first entry with a given key is used (e.g. for resolving
+    the crossrefs; see read_references()); the later ones get an error
+    and are excluded, even if they are otherwise fine. The duplicates
+    found by find_duplicate_references() already have an error telling
+    to remove them, so they do not get another one.
+    '''
+    first_references = {}
+    for reference in sorted(reference_list,
+                            key=lambda reference: reference.id):
+        if not reference.bib_key or reference.duplicate:
+            continue
+        original = first_references.setdefault(reference.bib_key.lower(),
+                                               reference)
+        if original is not reference:
+            reference.error_message += \
+                '\n- The BibTeX key "{}" is already used by reference'\
+                ' #{}.'.format(reference.bib_key, original.id)\
+                + ' Please rename one of the two entries in the .bibtex'\
+                + ' file.'
+            reference.INCLUDE_FLAG = False
+
+def find_duplicate_references(reference_list, duplicate_cache=None):
+    '''
+    Input: the list of references (only those with INCLUDE_FLAG are
+           checked), and optionally the duplicate cache of a previous
+           build (a dictionary, which is updated by this function)
+    Output: None; the duplicates are marked in place
+
+    Notes:
+    Exact duplicates are found using a dictionary keyed on the collated
+    title, the year, and the collated last name of the first author (see
+    create_collation_key());
+    this works irrespective of how the author names are written (e.g.
+    "Feynman, Richard" and "R. P. Feynman" are the same). The entry that
+    appears later in the BibTeX file is marked as a duplicate and
+    excluded; the error names the fields that matched.
+
+    Near duplicates (e.g. the arXiv and the conference version of a
+    paper, or titles with slightly different wording) are found using
+    MinHash signatures of the title words with locality sensitive
+    hashing, so that only the pairs of titles that share a bucket are
+    compared. Pairs with a Jaccard similarity of at least
+    NEAR_DUPLICATE_THRESHOLD get a warning, with the similarity of the
+    titles and the number of shared authors, unless they share too few
+    authors (see NEAR_DUPLICATE_MIN_AUTHOR_OVERLAP; the authors are
+    compared by their collated last names, and an entry without authors
+    is compared by its title only).
+
+    The duplicate cache keeps the title words and the LSH buckets of
+    each title (see get_title_features()), as well as the contents of the
+    buckets and the near duplicates, so that a build with the cache of
+    the previous one (e.g. with --watch) only computes them for the
+    entries that were added or removed (see update_duplicate_buckets()).
+    It also keeps the fingerprint of every reference that was checked
+    (under the key 'fingerprints'; see update_dumbib_database()).
+    '''
+    if duplicate_cache is None:
+        duplicate_cache = {}
+    references = sorted([reference for reference in reference_list
+                         if reference.INCLUDE_FLAG],
+                        key=lambda reference: reference.id)
+    titles = {}
+    old_titles = duplicate_cache.get('titles', {})
+    fingerprints = duplicate_cache['fingerprints'] = {
+        reference: get_duplicate_fingerprint(reference, titles, old_titles)
+        for reference in references}
+    duplicate_cache['titles'] = titles
+    first_references = mark_exact_duplicates(references, fingerprints)
+
+    # near duplicates; the buckets only depend on the titles, so the
+    # authors are checked here (they may have changed since the
+    # previous build)
+    update_duplicate_buckets(duplicate_cache, {
+        fingerprint: fingerprints[reference][1]
+        for fingerprint, reference in first_references.items()})
+    mark_near_duplicates(duplicate_cache['near_duplicates'],
+                         first_references, fingerprints)
+
+def get_duplicate_fingerprint(reference, titles, old_titles=None):
+    '''
+    Input: a parsed reference, the title features of the titles seen so
+           far ({<collated title>: <title features (see
+           get_title_features())>}, which is updated), and optionally
+           those of a previous build, to reuse
+    Output: a tuple (<fingerprint>, <title features>, <set of the
+            collated last names of the authors>); the references with
+            the same fingerprint are exact duplicates
+    '''
+    author_keys, year, title = reference.collation_key
+    title_features = titles.get(title)
+    if title_features is None:
+        title_features = titles[title] = old_titles[title] \
+            if old_titles is not None and title in old_titles \
+            else get_title_features(title)
+    author_last_names = [''.join(get_collation_words(last_name))
+                         for last_name, _ in author_keys]
+    fingerprint = (title_features[1], year,
+                   author_last_names[0] if len(author_keys) > 0 else '')
+    return fingerprint, title_features, frozenset(author_last_names)
+
+def mark_exact_duplicates(references, fingerprints):
+    '''
+    Input: the references to check, sorted by their ids, and their
+           fingerprints ({<reference>: <tuple returned by
+           get_duplicate_fingerprint()>})
+    Output: a dictionary {<fingerprint>: <first reference with it>}; the
+            later references with the same fingerprint are marked as
+            duplicates in place
+    '''
+    first_references = {}
+    for reference in references:
+        fingerprint = fingerprints[reference][0]
+        original = first_references.setdefault(fingerprint, reference)
+        if original is reference:
+            continue
+        reference.error_message += \
+            '\n- The following are duplicate entries: references'\
+            + ' #{} and #{} (same title, year, and {}).'.format(
+                original.id, reference.id,
+                'first author ({})'.format(
+                    reference.author_list[0]['last_name'])
+                if len(reference.collation_key[0]) > 0 else 'no authors')\
+            + ' Please remove one of the duplicate entries from' \
+            + ' the .bibtex file.'
+        reference.duplicate = True
+        reference.duplicate_of = original.id
+        reference.INCLUDE_FLAG = False
+    return first_references
+
+def mark_near_duplicates(near_duplicates, first_references, fingerprints,
+                         marked_references=None):
+    '''
+    Input: the near duplicates (see update_duplicate_buckets()), the
+           first reference of every fingerprint (see
+           mark_exact_duplicates()), the fingerprints of the references,
+           and optionally the set of the references to mark (default:
+           all of them)
+    Output: None; the later reference of each pair of near duplicates
+            which share enough authors gets a warning
+    '''
+    near_duplicate_pairs = []
+    for pair, similarity in near_duplicates.items():
+        original, reference = sorted(
+            [first_references[fingerprint] for fingerprint in pair],
+            key=lambda reference: reference.id)
+        if marked_references is not None \
+           and reference not in marked_references:
+            continue
+        authors1 = fingerprints[original][2]
+        authors2 = fingerprints[reference][2]
+        num_shared_authors = len(authors1 & authors2)
+        if num_shared_authors < NEAR_DUPLICATE_MIN_AUTHOR_OVERLAP \
+           * min(len(authors1), len(authors2)):
+            continue
+        near_duplicate_pairs.append((original.id, reference.id, similarity,
+                                     num_shared_authors, reference))
+    for original_id, _, similarity, num_shared_authors, reference in sorted(
+            near_duplicate_pairs, key=lambda item: item[:2]):
+        reference.warning_message += \
+            '\n- The following are possibly duplicate entries: '\
+            + '#{} and #{} (title similarity: {:.2f}, shared authors:'\
+            ' {}).'.format(original_id, reference.id, similarity,
+                           num_shared_authors)\
+            + ' Consider checking them manually.'
+        reference.possible_duplicate = True
+
+def get_title_features(title):
+    '''
+    Input: a collated title (see create_collation_key())
+    Output: a tuple (<set of the title words>, <the title words joined
+            with spaces>, <tuple of the keys of the LSH buckets of the
+            title>)
+    '''
+    title_words = get_collation_words(title)
+    words = frozenset(title_words)
+    if len(words) == 0:
+        return words, ' '.join(title_words), ()
+    signature = compute_minhash_signature(words)
+    return words, ' '.join(title_words), tuple([
+        (band, signature[band*MINHASH_ROWS:(band+1)*MINHASH_ROWS])
+        for band in range(MINHASH_BANDS)])
+
+def update_duplicate_buckets(duplicate_cache, members,
+                             changed_fingerprints=None):
+    '''
+    Input: the duplicate cache (see find_duplicate_references()), the
+           entries to check for near duplicates, as a dictionary
+           {<fingerprint>: <title features (see get_title_features())>},
+           and optionally the fingerprints that may have been added or
+           removed since the previous call (default: any of them)
+    Output: None; duplicate_cache['buckets'] ({<bucket key>: <list of
+            fingerprints>}) and duplicate_cache['near_duplicates']
+            ({frozenset({<fingerprint>, <fingerprint>}): <similarity>},
+            the pairs that share a bucket of at most
+            MINHASH_MAX_BUCKET_SIZE entries and are similar enough) are
+            updated for these entries
+
+    Notes:
+    If most of the entries changed since the previous build (or there is
+    none), the buckets are filled from scratch, and the pairs sharing a
+    bucket are compared. Otherwise, the entries which were removed are
+    taken out of their buckets along with their pairs, and the entries
+    which were added are compared with the other entries of their
+    buckets. A bucket which grows past the maximum size (or shrinks back
+    to it) removes (or adds) the pairs of its entries that do not share
+    another bucket; this only happens for the buckets of very common
+    words (see MINHASH_MAX_BUCKET_SIZE).
+    '''
+    old_members = duplicate_cache.get('members', {})
+    if changed_fingerprints is None:
+        removed = [fingerprint for fingerprint in old_members
+                   if fingerprint not in members]
+        added = [fingerprint for fingerprint in members
+                 if fingerprint not in old_members]
+    else:
+        removed = [fingerprint for fingerprint in changed_fingerprints
+                   if fingerprint in old_members
+                   and fingerprint not in members]
+        added = [fingerprint for fingerprint in changed_fingerprints
+                 if fingerprint in members
+                 and fingerprint not in old_members]
+    if 'buckets' not in duplicate_cache \
+       or len(removed) + len(added) > len(members) // 2:
+        duplicate_cache['members'] = members
+        buckets = duplicate_cache['buckets'] = {}
+        for fingerprint, (_, _, bucket_keys) in members.items():
+            for bucket_key in bucket_keys:
+                buckets.setdefault(bucket_key, []).append(fingerprint)
+        # (the pairs are in the order of the entries, whatever bucket
+        # they come from)
+        candidate_pairs = set()
+        for bucket in buckets.values():
+            if len(bucket) <= MINHASH_MAX_BUCKET_SIZE:
+                candidate_pairs.update(itertools.combinations(bucket, 2))
+        near_duplicates = duplicate_cache['near_duplicates'] = {}
+        for fingerprint1, fingerprint2 in candidate_pairs:
+            similarity = jaccard_similarity(members[fingerprint1][0],
+                                            members[fingerprint2][0])
+            if similarity >= NEAR_DUPLICATE_THRESHOLD:
+                near_duplicates[frozenset((fingerprint1, fingerprint2))] = \
+                    similarity
+        return
+
+    buckets = duplicate_cache['buckets']
+    near_duplicates = duplicate_cache['near_duplicates']
+    for fingerprint in removed:
+        for bucket_key in old_members[fingerprint][2]:
+            bucket = buckets[bucket_key]
+            for other in bucket:
+                near_duplicates.pop(frozenset((fingerprint, other)), None)
+        for bucket_key in old_members[fingerprint][2]:
+            bucket = buckets[bucket_key]
+            bucket.remove(fingerprint)
+            if len(bucket) == MINHASH_MAX_BUCKET_SIZE:
+                for pair in itertools.combinations(bucket, 2):
+                    if frozenset(pair) not in near_duplicates:
+                        add_near_duplicate(duplicate_cache, pair)
+            elif len(bucket) == 0:
+                del buckets[bucket_key]
+
+    duplicate_cache['members'] = members
+    for fingerprint in added:
+        others = set()
+        full_buckets = []
+        for bucket_key in members[fingerprint][2]:
+            bucket = buckets.setdefault(bucket_key, [])
+            bucket.append(fingerprint)
+            if len(bucket) <= MINHASH_MAX_BUCKET_SIZE:
+                others.update(bucket)
+            elif len(bucket) == MINHASH_MAX_BUCKET_SIZE + 1:
+                full_buckets.append(bucket[:-1])
+        others.discard(fingerprint)
+        for other in others:
+            add_near_duplicate(duplicate_cache, (fingerprint, other))
+        for bucket in full_buckets:
+            for pair in itertools.combinations(bucket, 2):
+                if frozenset(pair) in near_duplicates \
+                   and not share_small_bucket(duplicate_cache, *pair):
+                    del near_duplicates[frozenset(pair)]
+
+def add_near_duplicate(duplicate_cache, pair):
+    # (duplicate_cache['members'] holds the entries of the buckets)
+    members = duplicate_cache['members']
+    similarity = jaccard_similarity(members[pair[0]][0],
+                                    members[pair[1]][0])
+    if similarity >= NEAR_DUPLICATE_THRESHOLD:
+        duplicate_cache['near_duplicates'][frozenset(pair)] = similarity
+
+def share_small_bucket(duplicate_cache, fingerprint1, fingerprint2):
+    members = duplicate_cache['members']
+    buckets = duplicate_cache['buckets']
+    return any(len(buckets[bucket_key]) <= MINHASH_MAX_BUCKET_SIZE
+               for bucket_key in set(members[fingerprint1][2])
+               & set(members[fingerprint2][2]))
+
+def compute_minhash_signature(words):
+    '''
+    Input: a non-empty set of words
+    Output: a tuple with the MinHash signature of the set, i.e. the
+            element-wise minimum of the signatures of the words
+    '''
+    return tuple(map(min, zip(*map(compute_word_minhash, words))))
+
+@functools.lru_cache(maxsize=2**17)
+def compute_word_minhash(word):
+    '''
+    Input: a word
+    Output: a tuple with the hash value of the word for each seed
+
+    Notes:
+    The words are hashed with CRC-32 (rather than hash(), which is
+    randomized for every Python process) so that the output of the
+    program is reproducible, and each hash function of the signature is
+    then a random member of the universal family (a * x + b) mod p (see
+    "minhash_coefficients"), so that the rows of the signature are
+    independent of each other. (XOR-ing a single hash value with
+    different seeds does not give independent rows: the words which are
+    the minimum for one seed tend to be the minimum for the others too,
+    so the LSH recall is much lower than the figures above.)
+
+    The hashes are memoized, since titles share most of their words (and,
+    with --watch, the same titles are seen again on every rebuild).
+    '''
+    value = zlib.crc32(word.encode('utf-8'))
+    return tuple((a * value + b) % MINHASH_PRIME
+                 for a, b in minhash_coefficients)
+
+def jaccard_similarity(set1, set2):
+    if len(set1) == 0 and len(set2) == 0:
+        return 1.0
+    return len(set1 & set2) / len(set1 | set2)
+
+#--------------------------------------------------------------------
+# venue matcher
+#--------------------------------------------------------------------
+VENUE_INDEX_CACHE_VERSION = 6
+
+def load_venue_index(csv_filename):
+    '''
+    Input: the path of the venue list CSV file
+    Output: the venue index (see build_venue_index())
+
+    Notes:
+    The index is pickled into "<csv_filename>.pickle" and reused as long
+    as the CSV file is unchanged. The cache is first validated using the
+    modification time and size of the CSV file; if these differ, the
+    SHA-1 hash of its contents is compared before rebuilding the index
+    (so that, e.g., a fresh git checkout does not invalidate the cache).
+    If the cache cannot be read or written, the index is simply built
+    from the CSV file.
+    '''
+    cache_filename = csv_filename + '.pickle'
+    csv_stat = os.stat(csv_filename)
+
+    cache = None
+    try:
+        with open(cache_filename, 'rb') as f:
+            cache = pickle.load(f)
+        if cache['version'] != VENUE_INDEX_CACHE_VERSION:
+            cache = None
+    except Exception:
+        cache = None
+
+    if cache is not None and cache['mtime_ns'] == csv_stat.st_mtime_ns \
+       and cache['size'] == csv_stat.st_size:
+        return cache['index']
+
+    with open(csv_filename, 'rb') as f:
+        csv_bytes = f.read()
+    csv_hash = hashlib.sha1(csv_bytes).hexdigest()
+
+    if cache is not None and cache['sha1'] == csv_hash:
+        index = cache['index']
+    else:
+        venue_rows = list(csv.DictReader(
+            csv_bytes.decode('utf-8').splitlines()))
+        index = build_venue_index(venue_rows)
+        index['sha1'] = csv_hash # identifies the version of the venue list
+
+    try:
+        with open(cache_filename, 'wb') as f:
+            pickle.dump({'version': VENUE_INDEX_CACHE_VERSION,
+                         'mtime_ns': csv_stat.st_mtime_ns,
+                         'size': csv_stat.st_size,
+                         'sha1': csv_hash,
+                         'index': index}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+    except OSError:
+        pass # e.g. the directory is read-only; just skip the cache
+
+    return index
+
+def build_venue_index(venue_rows):
+    '''
+    Input: a list of dictionaries, one per row of "venue_list.csv"
+    Output: a dictionary containing an Aho-Corasick automaton over the
+            "search_string" field of all the venues
+
+    Notes:
+    The automaton is stored as three lists indexed by the state number:
+    'goto' (the trie edges of each state), 'fail' (the state to fall back
+    to when there is no edge for the next character), and 'output' (the
+    indices of the venues whose search string ends at this state). It is
+    built once, and each lookup then costs a single pass over the venue
+    text, irrespective of the number of venues.
+    '''
+    goto = [{}]
+    fail = [0]
+    output = [[]]
+    for idx, row in enumerate(venue_rows):
+        state = 0
+        for char in row['search_string']:
+            next_state = goto[state].get(char)
+            if next_state is None:
+                goto.append({})
+                fail.append(0)
+                output.append([])
+                next_state = len(goto) - 1
+                goto[state][char] = next_state
+            state = next_state
+        output[state].append(idx)
+
+    # breadth first traversal for setting the failure links
+    queue = collections.deque(goto[0].values())
+    while queue:
+        state = queue.popleft()
+        for char, next_state in goto[state].items():
+            queue.append(next_state)
+            fail_state = fail[state]
+            while fail_state and char not in goto[fail_state]:
+                fail_state = fail[fail_state]
+            fail[next_state] = goto[fail_state].get(char, 0)
+            output[next_state] = output[next_state] \
+                + output[fail[next_state]]
+
+    index = {'venues': venue_rows, 'goto': goto, 'fail': fail,
+             'output': output}
+    index.update(build_venue_trigram_index(venue_rows))
+    return index
+
+def find_matching_venues(venue_index, text):
+    '''
+    Input: the venue index created by build_venue_index() and the
+           (lower case) venue text from the BibTeX entry
+    Output: a sorted list of the indices of all the venues whose search
+            string occurs in the text
+    '''
+    goto = venue_index['goto']
+    fail = venue_index['fail']
+    output = venue_index['output']
+
+    state = 0
+    matches = set()
+    for char in text:
+        while state and char not in goto[state]:
+            state = fail[state]
+        state = goto[state].get(char, 0)
+        matches.update(output[state])
+    return sorted(matches)
+
+def format_venue_name(row):
+    '''
+    Input: a row of "venue_list.csv"
+    Output: the string "<venue_name> (<abbreviation>)", or just
+            "<venue_name>" if the venue has no abbreviation
+    '''
+    if row['abbreviation'] == '??':
+        return row['venue_name']
+    return '{} ({})'.format(row['venue_name'], row['abbreviation'])
+
+#--------------------------------------------------------------------
+# fuzzy venue matcher (see find_similar_venues())
+#--------------------------------------------------------------------
+# the number of similar venues suggested for an unknown venue, and the
+# minimum similarity of a suggestion
+VENUE_SUGGESTION_COUNT = 3
+VENUE_SUGGESTION_MIN_SIMILARITY = 0.3
+# only the venue names (and abbreviations) with at least
+# VENUE_MIN_SHARED_TRIGRAMS of their VENUE_RARE_TRIGRAM_COUNT rarest
+# trigrams in the venue text are scored (see find_similar_venues())
+VENUE_RARE_TRIGRAM_COUNT = 3
+VENUE_MIN_SHARED_TRIGRAMS = 2
+
+def get_venue_trigrams(text):
+    '''
+    Input: a venue name (possibly with LaTeX markup)
+    Output: the set of the character trigrams of its words, e.g.
+            'Proc. of ICML' gives {' pr', 'pro', 'roc', 'oc ', ' of', ...}
+
+    Note: Only the letters are kept (see get_collation_string()), since
+    the numbers in venue names are volumes, years, or ordinals.
+    '''
+    text = ' {} '.format(' '.join(
+        re.sub(r'[^a-z]', ' ', get_collation_string(text)).split()))
+    return {text[i:i+3] for i in range(len(text) - 2)}
+
+def build_venue_trigram_index(venue_rows):
+    '''
+    Input: a list of dictionaries, one per row of "venue_list.csv"
+    Output: a dictionary with the inverted index of the character
+            trigrams of the venue names, search strings, and
+            abbreviations (see find_similar_venues())
+
+    Notes:
+    Each of the three strings of a venue is a separate document, so that
+    e.g. "NeurIPS 2021" is as close to the abbreviation of NeurIPS as
+    "Neural Information Processing Systems" is to its name. Each trigram
+    is weighted by its inverse document frequency, so that the trigrams
+    shared by many venues (such as those of "conference") count less.
+
+    'trigram_postings' maps each trigram to a tuple (<weight>, <list of
+    the documents of which it is one of the VENUE_RARE_TRIGRAM_COUNT
+    rarest trigrams>), and 'trigram_documents' lists the tuples (<index
+    of the venue>, <total weight of the trigrams of the document>, <set
+    of the trigrams of the document>); see find_similar_venues(). The
+    ties between equally rare trigrams are broken by the trigrams
+    themselves, so that the postings do not depend on the hash seed.
+    '''
+    documents = []
+    for idx, row in enumerate(venue_rows):
+        names = {row['venue_name'], row['search_string']}
+        if row['abbreviation'] != '??':
+            names.add(row['abbreviation'])
+        # the trigrams are interned so that the pickled index stores each
+        # of them once
+        for trigrams in {frozenset(map(sys.intern, get_venue_trigrams(name)))
+                         for name in names}:
+            documents.append((idx, trigrams))
+
+    document_counts = collections.Counter(
+        trigram for _, trigrams in documents for trigram in trigrams)
+    weights = {trigram: math.log((len(documents) + 1) / (count + 1)) + 1
+               for trigram, count in document_counts.items()}
+    postings = {trigram: [] for trigram in weights}
+    for doc, (_, trigrams) in enumerate(documents):
+        if len(trigrams) < VENUE_MIN_SHARED_TRIGRAMS:
+            continue # e.g. a one-letter abbreviation; never suggested
+        for trigram in heapq.nsmallest(
+                VENUE_RARE_TRIGRAM_COUNT, trigrams,
+                key=lambda trigram: (-weights[trigram], trigram)):
+            postings[trigram].append(doc)
+
+    return {'trigram_postings': {trigram: (weights[trigram], docs)
+                                 for trigram, docs in postings.items()},
+            'trigram_documents': [
+                (idx, math.fsum(weights[trigram] for trigram in trigrams),
+                 trigrams)
+                for idx, trigrams in documents]}
+
+def find_similar_venues(venue_index, text, k=VENUE_SUGGESTION_COUNT,
+                        min_similarity=VENUE_SUGGESTION_MIN_SIMILARITY):
+    '''
+    Input: the venue index created by build_venue_index(), the venue text
+           from the BibTeX entry, the number of venues to return, and the
+           minimum similarity of a returned venue
+    Output: a list of up to k tuples (<index of the venue>, <similarity>),
+            from the most to the least similar, with similarities between
+            min_similarity and 1
+
+    Notes:
+    The similarity is the cosine similarity of the weighted trigram sets
+    of the text and of the closest name of the venue (see
+    build_venue_trigram_index()). The trigrams that no venue contains
+    (e.g. those of "proceedings" or of a year) are ignored, since they
+    say nothing about which venue is meant; thus "Proc. of NeurIPS" is
+    as similar to NeurIPS as "NeurIPS" is.
+
+    Scoring every document sharing a trigram with the text is slow with
+    thousands of venues, since the trigrams of e.g. "conference" are
+    shared by most of them. Instead, only the documents with at least
+    VENUE_MIN_SHARED_TRIGRAMS of their VENUE_RARE_TRIGRAM_COUNT rarest
+    trigrams in the text are scored (so one-letter names never are).
+    The postings of the trigrams of the text list just these documents,
+    and are short, since the common trigrams are rarely among the rarest
+    ones of a document. A venue name that is in the text is thus always
+    scored, and so is one with a typo in most cases, whereas the venues
+    sharing only common words (such as "International Conference on")
+    with the text are not. The rarest trigrams of the text are not used
+    for this, since they often come from the words that are not part of
+    the venue name (e.g. a city).
+
+    The documents sharing the most of their rarest trigrams are scored
+    first; a document is skipped when its weight is too low or too high
+    for its similarity to reach the k-th best one found so far (the
+    similarity is at most sqrt(<its weight> / <weight of the text>), and
+    at most the inverse of that). The weights are added up with
+    math.fsum(), so that the similarities do not depend on the order of
+    the trigram sets (which changes with the hash seed).
+    '''
+    postings = venue_index['trigram_postings']
+    documents = venue_index['trigram_documents']
+
+    text_weights = {}
+    counts = collections.Counter()
+    for trigram in get_venue_trigrams(text):
+        posting = postings.get(trigram)
+        if posting is not None:
+            text_weights[trigram] = posting[0]
+            counts.update(posting[1])
+    text_weight = math.fsum(text_weights.values())
+    if text_weight == 0:
+        return []
+    text_trigrams = frozenset(text_weights)
+
+    similarities = {}
+    threshold = min_similarity # the similarity to reach to be returned
+    for doc, count in counts.most_common():
+        if count < VENUE_MIN_SHARED_TRIGRAMS:
+            break
+        idx, doc_weight, trigrams = documents[doc]
+        if doc_weight < threshold ** 2 * text_weight \
+           or doc_weight * threshold ** 2 > text_weight:
+            continue
+        overlap = math.fsum(map(text_weights.__getitem__,
+                                trigrams & text_trigrams))
+        similarity = overlap / math.sqrt(text_weight * doc_weight)
+        if similarity >= threshold \
+           and similarity > similarities.get(idx, 0):
+            similarities[idx] = similarity
+            if len(similarities) >= k:
+                threshold = max(threshold, heapq.nlargest(
+                    k, similarities.values())[-1])
+    return heapq.nsmallest(k, similarities.items(),
+                           key=lambda item: (-item[1], item[0]))
+
+#--------------------------------------------------------------------
+# BibTeX tokenizer
+#--------------------------------------------------------------------
+bibtex_entry_head_regex = re.compile(r'\s*@\s*([A-Za-z]+)\s*([{(])\s*')
+bibtex_key_regex = re.compile(r'([^,\s]*)\s*')
+bibtex_name_regex = re.compile(r'\s*([^\s"#%\'(),={}]+)\s*')
+bibtex_whitespace_regex = re.compile(r'[\s,]*')
+bibtex_space_regex = re.compile(r'\s*')
+bibtex_braces_regex = re.compile(r'[{}]')
+bibtex_quotes_regex = re.compile(r'[{}"]')
+
+def tokenize_bibtex_entry(raw_data, has_key=True):
+    '''
+    Input: a string containing the individual bibtex entry, and whether
+           the entry starts with a key (which @string entries do not)
+    Output: a tuple (<entry type>, <BibTeX key>, <dictionary of fields>)
+
+    Notes:
+    The entry is read in a single pass from left to right. The entry
+    type and the field names are converted to lower case. The values
+    are stored without the outermost braces or quotes, but any nested
+    braces are kept verbatim, i.e. "title = {The {MIT} Press}" is
+    stored as {'title': 'The {MIT} Press'}. Values concatenated with
+    "#" are joined together, and bare numbers (such as "year = 2023")
+    are stored as they are.
+
+    Bare names (such as "journal = jmlr") are @string macros, which are
+    not expanded here: a value containing a macro is stored as a tuple
+    of its parts, with the macros as BibtexMacro strings (e.g.
+    "month = jul # {~13}" gives (BibtexMacro('jul'), '~13')), and is
+    resolved by BibtexFields when it is read. Joining the parts gives
+    the value with the macro names verbatim.
+
+    Raises a ValueError if the entry is malformed, e.g. if it has
+    unbalanced braces or quotes.
+    '''
+    match = bibtex_entry_head_regex.match(raw_data)
+    if match is None:
+        raise ValueError('Entry does not start with "@<type>{{":'\
+                         '\n{}'.format(raw_data[:64]))
+    bib_type = match.group(1).lower()
+    closing_char = '}' if match.group(2) == '{' else ')'
+
+    if has_key:
+        match = bibtex_key_regex.match(raw_data, match.end())
+        bib_key = match.group(1).rstrip(closing_char)
+    else:
+        bib_key = None
+    pos = match.end()
+
+    fields = {}
+    data_len = len(raw_data)
+    while True:
+        pos = bibtex_whitespace_regex.match(raw_data, pos).end()
+        if pos >= data_len or raw_data[pos] == closing_char:
+            break
+
+        match = bibtex_name_regex.match(raw_data, pos)
+        if match is None or match.end() >= data_len \
+           or raw_data[match.end()] != '=':
+            raise ValueError('Expected "<field> = <value>" at position'\
+                             ' {}:\n{}'.format(pos, raw_data[pos:pos+64]))
+        field_name = match.group(1).lower()
+        pos = match.end() + 1
+
+        # read the (possibly "#"-concatenated) value of the field
+        value_parts = []
+        FLAG_MACRO = False
+        while True:
+            pos = bibtex_space_regex.match(raw_data, pos).end()
+            if pos >= data_len:
+                raise ValueError('Field "{}" does not have a'\
+                                 ' value.'.format(field_name))
+            char = raw_data[pos]
+            if char == '{':
+                value, pos = read_delimited_value(
+                    raw_data, pos, bibtex_braces_regex)
+            elif char == '"':
+                value, pos = read_delimited_value(
+                    raw_data, pos, bibtex_quotes_regex)
+            else:
+                match = bibtex_name_regex.match(raw_data, pos)
+                if match is None:
+                    raise ValueError('Field "{}" does not have a'\
+                                     ' value.'.format(field_name))
+                value = match.group(1)
+                if not value.isdigit():
+                    value = BibtexMacro(value)
+                    FLAG_MACRO = True
+                pos = match.end()
+            value_parts.append(value)
+
+            pos = bibtex_space_regex.match(raw_data, pos).end()
+            if pos < data_len and raw_data[pos] == '#':
+                pos += 1
+            else:
+                break
+
+        fields[field_name] = tuple(value_parts) if FLAG_MACRO \
+            else ''.join(value_parts)
+
+    if pos >= data_len:
+        raise ValueError('Entry does not have a closing "{}".'.format(
+            closing_char))
+
+    return bib_type, bib_key, fields
+
+def read_delimited_value(raw_data, start_idx, delimiter_regex):
+    '''
+    Input: the raw text, the index of the opening brace or quote, and the
+           regex matching the characters that can open or close the value
+    Output: a tuple (<text without the outer delimiters>, <end index>)
+    '''
+    depth = 0
+    for match in delimiter_regex.finditer(raw_data, start_idx + 1):
+        char = match.group()
+        if char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth < 0:
+                if raw_data[start_idx] == '"':
+                    raise ValueError('String does not have matching'\
+                                     ' braces.')
+                return raw_data[start_idx+1:match.start()], match.end()
+        elif depth == 0: # closing quote outside any braces
+            return raw_data[start_idx+1:match.start()], match.end()
+
+    raise ValueError('String does not have a closing brace or quote.')
+
+#--------------------------------------------------------------------
+# @string macros and crossref entries
+#--------------------------------------------------------------------
+bibtex_crossref_regex = re.compile(r'[\s,]crossref\s*=', re.IGNORECASE)
+
+# the entries that are not references
+bibtex_skipped_entry_types = ['comment', 'preamble']
+
+# the macros predefined by BibTeX
+bibtex_month_macros = {
+    'jan': 'January', 'feb': 'February', 'mar': 'March', 'apr': 'April',
+    'may': 'May', 'jun': 'June', 'jul': 'July', 'aug': 'August',
+    'sep': 'September', 'oct': 'October', 'nov': 'November',
+    'dec': 'December'}
+
+class BibtexMacro(str):
+    '''
+    The name of a @string macro in a field value (see
+    tokenize_bibtex_entry()).
+    '''
+    __slots__ = ()
+
+class BibtexFields(collections.abc.Mapping):
+    '''
+    The fields of a BibTeX entry (see tokenize_bibtex_entry()), with the
+    @string macros and the crossref inheritance resolved only when a
+    field is read.
+
+    A field that the entry does not have is read from its crossref
+    entry, if any ("booktitle" falls back to the "title" of the parent,
+    i.e. of the proceedings); the parent is tokenized only once and
+    shared by all its children (see get_crossref_parent()), rather than
+    being copied into each of them. Iterating over the fields only gives
+    the fields of the entry itself.
+
+    "dependencies" records the macros and the crossref entries that were
+    used, as tuples ('@string', <name>, <value or None>) and ('crossref',
+    <key>, <hash of the parent or None>), so that the entry cache can
+    tell whether the parsed entry is out of date (see
+    restore_from_entry_cache()); "problems" collects the undefined
+    macros and the missing crossref entries. Both are dictionaries used
+    as ordered sets.
+    '''
+    __slots__ = ('raw_fields', 'symbol_table', 'dependencies', 'problems')
+
+    def __init__(self, raw_fields, symbol_table=None):
+        self.raw_fields = raw_fields
+        self.symbol_table = symbol_table
+        self.dependencies = {}
+        self.problems = {}
+
+    def __getitem__(self, name):
+        if name in self.raw_fields:
+            value = self.raw_fields[name]
+            if not isinstance(value, str):
+                value = self.raw_fields[name] = resolve_bibtex_value(value,
+                                                                     self)
+            return value
+        parent = get_crossref_parent(self)
+        if parent is None:
+            raise KeyError(name)
+        if name == 'booktitle' and name not in parent.raw_fields:
+            name = 'title'
+        value = parent[name]
+        self.dependencies.update(parent.dependencies)
+        self.problems.update(parent.problems)
+        return value
+
+    def __iter__(self):
+        return iter(self.raw_fields)
+
+    def __len__(self):
+        return len(self.raw_fields)
+
+def create_symbol_table(sources=None, author_name_cache=None):
+    '''
+    Input: optionally, a dictionary with the contents (as bytes) of the
+           sources which are not files (see read_raw_data()), and the
+           author name cache to use (see create_author_name_cache();
+           default: a new one)
+    Output: an empty symbol table, i.e. a dictionary with the keys
+            'macros' ({<name>: <text>}, with the month macros of BibTeX
+            predefined), 'macro_definitions' (the list of the (<name>,
+            <text>) of every macro definition, in the order they were
+            read), 'entries' ({<lower case BibTeX key>: (<source>,
+            <span>, <hash>)}), 'parents' (the crossref entries read so
+            far, see get_crossref_parent()), 'open_sources', and
+            'author_names' (the author name cache)
+
+    Note: The symbol table holds all the state of parsing the entries of
+    a build, so the builds that run in the same process (e.g. with
+    --manifest) do not share anything but what they are given.
+    '''
+    return {'macros': dict(bibtex_month_macros), 'macro_definitions': [],
+            'entries': {}, 'parents': {},
+            'open_sources': dict(sources or {}),
+            'author_names': create_author_name_cache()
+                            if author_name_cache is None
+                            else author_name_cache}
+
+def close_symbol_table(symbol_table):
+    for data in symbol_table['open_sources'].values():
+        if hasattr(data, 'close'): # a memory map, or a temporary file
+            data.close()
+    symbol_table['open_sources'].clear()
+    symbol_table['parents'].clear()
+
+def read_references(raw_entries, source, symbol_table, first_id=0):
+    '''
+    Input: the raw entries yielded by read_bibtex_entries() or
+           split_bibtex_entries(), the name of their source, the symbol
+           table (see create_symbol_table()), and the id of the first
+           reference
+    Output: a generator yielding a tuple (<unparsed reference>, <raw
+            text>) for each entry which is a reference
+
+    Notes:
+    The macros of the @string entries are added to the symbol table as
+    they are read, and the @comment and @preamble entries are skipped;
+    none of them becomes a reference (except a malformed @string entry,
+    so that it is reported as an error). The key of every reference is
+    added to the key index of the symbol table, for resolving the
+    crossrefs; if a key is repeated, the first entry wins.
+    '''
+    bib_id = first_id
+    for raw_entry in raw_entries:
+        raw_data = raw_entry[3]
+        entry_type, bib_key = read_entry_head(raw_data)
+        if entry_type in bibtex_skipped_entry_types:
+            continue
+        if entry_type == 'string':
+            try:
+                define_bibtex_macros(raw_data, symbol_table)
+                continue
+            except ValueError:
+                pass # reported as an error by parse_reference()
+
+        reference = create_reference(bib_id, source, raw_entry)
+        if bib_key:
+            symbol_table['entries'].setdefault(
+                bib_key.lower(), (source, reference.span, reference.hash))
+        bib_id += 1
+        yield reference, raw_data
+
+def read_entry_head(raw_data):
+    '''
+    Input: the raw text of a BibTeX entry
+    Output: a tuple (<entry type in lower case>, <BibTeX key>), or (None,
+            None) if the head of the entry cannot be read
+    '''
+    match = bibtex_entry_head_regex.match(raw_data)
+    if match is None:
+        return None, None
+    return match.group(1).lower(), bibtex_key_regex.match(
+        raw_data, match.end()).group(1).rstrip('})')
+
+def define_bibtex_macros(raw_data, symbol_table):
+    '''
+    Input: the raw text of a @string entry, and the symbol table
+    Output: None; the macros of the entry are added to the symbol table
+
+    Note: As in BibTeX, the macros used in the definition are expanded
+    right away, so redefining them later does not change this macro.
+    Raises a ValueError if the entry is malformed.
+    '''
+    fields = BibtexFields(tokenize_bibtex_entry(raw_data, has_key=False)[2],
+                          symbol_table)
+    for name in fields:
+        symbol_table['macros'][name] = fields[name]
+        symbol_table['macro_definitions'].append((name, fields[name]))
+
+def resolve_bibtex_value(value_parts, fields):
+    '''
+    Input: the parts of a value containing macros (see
+           tokenize_bibtex_entry()), and the fields of the entry (see
+           BibtexFields), whose dependencies and problems are updated
+    Output: the value, with the macros replaced by their text
+
+    Note: An undefined macro is replaced by its name (which is what this
+    script did before it knew about macros).
+    '''
+    macros = bibtex_month_macros if fields.symbol_table is None \
+        else fields.symbol_table['macros']
+    value = ''
+    for part in value_parts:
+        if isinstance(part, BibtexMacro):
+            name = part.lower()
+            text = macros.get(name)
+            fields.dependencies[('@string', name, text)] = None
+            if text is None:
+                fields.problems['The @string macro "{}" is not defined, so'\
+                                ' its name was used instead.'.format(
+                                    part)] = None
+                text = str(part)
+            part = text
+        value += part
+    return value
+
+def get_crossref_parent(fields):
+    '''
+    Input: the fields of an entry (see BibtexFields)
+    Output: the fields of the entry named in its "crossref" field, or None
+            if it does not have one (or if that entry cannot be read)
+
+    Notes:
+    The parent is found using the key index of the symbol table, and is
+    tokenized the first time one of its children asks for it. As in
+    BibTeX, the crossref field of the parent itself is not followed.
+    '''
+    if fields.symbol_table is None or 'crossref' not in fields.raw_fields:
+        return None
+    key = fields['crossref'].strip().lower()
+    entry = fields.symbol_table['entries'].get(key)
+    fields.dependencies[('crossref', key,
+                         None if entry is None else entry[2])] = None
+
+    parents = fields.symbol_table['parents']
+    if key not in parents:
+        parents[key] = None
+        if entry is not None:
+            try:
+                source, span, _ = entry
+                raw_fields = tokenize_bibtex_entry(read_span(
+                    source, span, fields.symbol_table['open_sources']))[2]
+                raw_fields.pop('crossref', None)
+                parents[key] = BibtexFields(raw_fields, fields.symbol_table)
+            except (OSError, ValueError):
+                pass
+    if parents[key] is None:
+        fields.problems['The crossref entry "{}" was not found, or could'\
+                        ' not be read.'.format(fields['crossref'])] = None
+    return parents[key]
+
+
+#--------------------------------------------------------------------
+# citation-driven pruning (see the --aux option)
+#--------------------------------------------------------------------
+aux_citation_regex = re.compile(
+    r'\\dumbib@citation@count\s*{([^{}]*)}\s*{\s*([0-9]+)\s*}'\
+    r'|\\dumbib@missing@citation\s*{([^{}]*)}'\
+    r'|\\@input\s*{([^{}]*)}')
+
+def read_cited_keys(aux_filenames):
+    '''
+    Input: a list of the .aux files of the LaTeX documents
+    Output: the set of the keys cited in these documents, or None if
+            none of the .aux files exist
+
+    Notes:
+    A key counts as cited if dumbib recorded a positive citation count
+    for it ("\\dumbib@citation@count{<key>}{<count>}", written for every
+    key in the dumbib database), or if it was cited without being in the
+    database ("\\dumbib@missing@citation{<key>}"). The .aux files of
+    the \\include'd files (i.e. "\\@input{<file>.aux}") are read as well.
+    A missing .aux file (e.g. before the first LaTeX run) is ignored.
+    '''
+    cited_keys = set()
+    FLAG_FOUND_AUX = False
+    pending_filenames = list(aux_filenames)
+    seen_filenames = set()
+    while pending_filenames:
+        aux_filename = pending_filenames.pop()
+        if aux_filename in seen_filenames:
+            continue
+        seen_filenames.add(aux_filename)
+        try:
+            with open(aux_filename, encoding='utf-8',
+                      errors='replace') as f:
+                aux_data = f.read()
+        except OSError:
+            continue
+        FLAG_FOUND_AUX = True
+        for match in aux_citation_regex.finditer(aux_data):
+            counted_key, count, missing_key, input_filename = match.groups()
+            if counted_key is not None and int(count) > 0:
+                cited_keys.add(counted_key.strip())
+            elif missing_key is not None:
+                cited_keys.add(missing_key.strip())
+            elif input_filename is not None:
+                pending_filenames.append(os.path.join(
+                    os.path.dirname(aux_filename), input_filename))
+    return cited_keys if FLAG_FOUND_AUX else None
+
+def get_base_key(key):
+    '''
+    Input: a LaTeX reference key created by this script
+    Output: the key without the year index, e.g. "feynman1960b" becomes
+            "feynman1960"
+    '''
+    return re.sub(r'(?<=[0-9])[a-z]+$', '', key)
+
+def prune_uncited_references(reference_list, cited_keys):
+    '''
+    Input: the list of references after sort_and_create_keys_for_references()
+           and the set of cited keys
+    Output: a tuple (<list of the cited references>, <sorted list of the
+            cited keys which are not in the reference list>)
+
+    Notes:
+    The keys (and in particular the year indices) are created using all
+    the references, so they do not change when the pruning is turned on
+    or off.
+
+    The references that had errors are kept if they could have been
+    cited (i.e. if their author list and year give a cited base key), so
+    that their errors still appear in the log; duplicates are dropped.
+    '''
+    cited_base_keys = {get_base_key(key) for key in cited_keys}
+    cited_references = []
+    for reference in reference_list:
+        if reference.INCLUDE_FLAG:
+            if reference.key in cited_keys:
+                cited_references.append(reference)
+        elif not reference.duplicate and reference.author_list is not None \
+             and reference.year != 0 \
+             and create_key_and_print_author_string(reference)[0] \
+             in cited_base_keys:
+            cited_references.append(reference)
+    missing_keys = cited_keys - {reference.key
+                                 for reference in cited_references}
+    return cited_references, sorted(missing_keys)
+
+#--------------------------------------------------------------------
+# reference store (see the --store and --export options)
+#--------------------------------------------------------------------
+STORE_VERSION = 1
+
+# one row per BibTeX entry (identified by the hash of its raw text) in
+# "entries", and one row per author of each entry in "authors"; the
+# "first_author" and "surname" columns hold the collated last names (see
+# get_collation_string()), and "venue_name" the venue without markup
+store_schema = '''
+CREATE TABLE IF NOT EXISTS entries (
+    hash TEXT PRIMARY KEY,
+    source TEXT,
+    line INTEGER,
+    bib_key TEXT,
+    entry_type TEXT,
+    type TEXT,
+    fields TEXT,
+    raw TEXT,
+    included INTEGER,
+    key TEXT,
+    year INTEGER,
+    year_index TEXT,
+    title TEXT,
+    venue TEXT,
+    venue_name TEXT,
+    author_string TEXT,
+    print_author_string TEXT,
+    xyz_print_author_string TEXT,
+    first_author TEXT,
+    collation_key TEXT,
+    error_message TEXT,
+    warning_message TEXT
+);
+CREATE TABLE IF NOT EXISTS authors (
+    hash TEXT,
+    position INTEGER,
+    last_name TEXT,
+    first_names TEXT,
+    surname TEXT,
+    PRIMARY KEY (hash, position)
+);
+CREATE INDEX IF NOT EXISTS entries_key ON entries (key);
+CREATE INDEX IF NOT EXISTS entries_first_author ON entries (first_author);
+CREATE INDEX IF NOT EXISTS entries_year ON entries (year);
+CREATE INDEX IF NOT EXISTS entries_venue_name
+    ON entries (venue_name COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS authors_surname ON authors (surname);
+'''
+
+# the columns which are updated for the entries already in the store
+# (the others only depend on the raw text of the entry)
+store_updated_columns = [
+    'source', 'line', 'included', 'key', 'year_index', 'title', 'venue',
+    'venue_name', 'author_string', 'print_author_string',
+    'xyz_print_author_string', 'error_message', 'warning_message']
+
+def open_store(store_filename):
+    '''
+    Input: the filename of the SQLite reference store
+    Output: a connection to the store, with the tables created if needed
+
+    Note: The store only holds information derived from the BibTeX
+    files, so a store created by a different version of this script is
+    simply emptied.
+    '''
+    connection = sqlite3.connect(store_filename)
+    connection.row_factory = sqlite3.Row
+    if connection.execute('PRAGMA user_version').fetchone()[0] \
+       != STORE_VERSION:
+        connection.executescript('DROP TABLE IF EXISTS entries;'\
+                                 ' DROP TABLE IF EXISTS authors;')
+        connection.execute('PRAGMA user_version = {}'.format(STORE_VERSION))
+    connection.executescript(store_schema)
+    return connection
+
+def save_references_to_store(store_filename, reference_list, sources=None):
+    '''
+    Input: the filename of the SQLite reference store, the list of
+           references after sort_and_create_keys_for_references(), and
+           the contents of the sources which are not files (see
+           write_log())
+    Output: None
+
+    Notes:
+    The entries are upserted using their hash: the entries that are new
+    to the store are inserted with all their fields, their raw text, and
+    their authors, whereas for the entries already in the store only the
+    columns that can change between runs (e.g. the key, which depends on
+    the other entries) are updated. The entries of the same BibTeX files
+    which are no longer there (e.g. because they were edited) are
+    deleted; the entries of other BibTeX files are kept.
+
+    The references whose venue was skipped (see parse_reference()) are
+    not stored, since they are incomplete.
+    '''
+    references = {}
+    for reference in sorted(reference_list,
+                            key=lambda reference: reference.id):
+        if reference.cited is not False:
+            references.setdefault(reference.hash, reference)
+    stored_sources = {reference.source for reference in reference_list}
+    current_hashes = {reference.hash for reference in reference_list}
+
+    connection = open_store(store_filename)
+    with connection:
+        stored_hashes = set()
+        stale_hashes = []
+        for row in connection.execute('SELECT hash, source FROM entries'):
+            stored_hashes.add(row['hash'])
+            if row['source'] in stored_sources \
+               and row['hash'] not in current_hashes:
+                stale_hashes.append((row['hash'],))
+        connection.executemany('DELETE FROM entries WHERE hash = ?',
+                               stale_hashes)
+        connection.executemany('DELETE FROM authors WHERE hash = ?',
+                               stale_hashes)
+
+        open_sources = dict(sources or {})
+        new_rows = []
+        new_author_rows = []
+        updated_rows = []
+        for entry_hash, reference in references.items():
+            row = get_store_row(reference)
+            if entry_hash in stored_hashes:
+                updated_rows.append([row[column]
+                                     for column in store_updated_columns]
+                                    + [entry_hash])
+                continue
+            raw_data = read_raw_data(reference, open_sources)
+            try:
+                row['fields'] = json.dumps(
+                    {name: value if isinstance(value, str) else ''.join(value)
+                     for name, value in
+                     tokenize_bibtex_entry(raw_data)[2].items()},
+                    ensure_ascii=False)
+            except ValueError:
+                row['fields'] = None
+            row['raw'] = raw_data
+            new_rows.append(row)
+            if reference.author_list is not None:
+                new_author_rows += [
+                    (entry_hash, position, author['last_name'],
+                     author['first_names'], get_collation_string(
+                         author['last_name']))
+                    for position, author in enumerate(
+                        reference.author_list)]
+        for data in open_sources.values():
+            if isinstance(data, mmap.mmap):
+                data.close()
+
+        if len(new_rows) > 0:
+            columns = list(new_rows[0].keys())
+            connection.executemany(
+                'INSERT INTO entries ({}) VALUES ({})'.format(
+                    ', '.join(columns), ', '.join('?' * len(columns))),
+                [[row[column] for column in columns] for row in new_rows])
+        connection.executemany(
+            'INSERT OR REPLACE INTO authors VALUES (?, ?, ?, ?, ?)',
+            new_author_rows)
+        connection.executemany(
+            'UPDATE entries SET {} WHERE hash = ?'.format(', '.join(
+                '{} = ?'.format(column) for column in store_updated_columns)),
+            updated_rows)
+    connection.close()
+
+def get_store_row(reference):
+    '''
+    Output: a dictionary with the values of the columns of the "entries"
+            table for the reference (except "fields" and "raw")
+    '''
+    # remove the italics added by sort_and_create_keys_for_references()
+    venue_name = reference.venue
+    if reference.INCLUDE_FLAG and venue_name is not None \
+       and bib_entry_types[reference.type]['style'] == 'paper_like':
+        venue_name = venue_name[len('\\textit{'):-1]
+    collation_key = reference.collation_key
+    return {'hash': reference.hash,
+            'source': reference.source,
+            'line': reference.line,
+            'bib_key': reference.bib_key,
+            'entry_type': reference.entry_type,
+            'type': reference.type,
+            'included': int(reference.INCLUDE_FLAG),
+            'key': reference.key if reference.INCLUDE_FLAG else None,
+            'year': None if collation_key is None else collation_key[1],
+            'year_index': reference.year_index,
+            'title': reference.title,
+            'venue': reference.venue,
+            'venue_name': venue_name,
+            'author_string': reference.author_string,
+            'print_author_string': reference.print_author_string,
+            'xyz_print_author_string': reference.xyz_print_author_string,
+            'first_author': None if collation_key is None
+                            or len(collation_key[0]) == 0
+                            else collation_key[0][0][0],
+            'collation_key': None if collation_key is None
+                             else json.dumps(collation_key),
+            'error_message': reference.error_message,
+            'warning_message': reference.warning_message}
+
+def load_references_from_store(store_filename, keys=None, author=None,
+                               years=None, venue=None):
+    '''
+    Input: the filename of the SQLite reference store, and optionally the
+           query: a list of keys, the last name of an author (any author
+           of the entry), a tuple (<first year>, <last year>), and (a part
+           of) the venue name (case-insensitive)
+    Output: a tuple (<the sorted list of the references in the dumbib
+            database which match all the given conditions, ready for
+            write_latex_references()>, <a list of tuples (<reference>,
+            <the reference it duplicates>) for the references left out
+            as duplicates of other entries in the store>)
+
+    Notes:
+    Nothing is parsed; the references are created from the formatted
+    fields in the store.
+
+    The store can hold the entries of several BibTeX files (e.g. saved
+    by different runs), whose keys and duplicates were found separately.
+    So the duplicates are found again (see find_duplicate_references();
+    the entries are taken in the order of their files and lines), and
+    the year indices are allocated again (see create_year_indices()),
+    among all the entries in the store; the query is then applied, so
+    that the keys of an entry do not depend on the query.
+    '''
+    conditions = ['included = 1']
+    parameters = []
+    if author is not None:
+        conditions.append('hash IN (SELECT hash FROM authors'\
+                          ' WHERE surname = ?)')
+        parameters.append(get_collation_string(author))
+    if years is not None:
+        conditions.append('year BETWEEN ? AND ?')
+        parameters += list(years)
+    if venue is not None:
+        conditions.append('venue_name LIKE ?')
+        parameters.append('%{}%'.format(venue))
+
+    connection = open_store(store_filename)
+    matching_hashes = {row['hash'] for row in connection.execute(
+        'SELECT hash FROM entries WHERE {}'.format(' AND '.join(conditions)),
+        parameters)}
+    author_lists = {}
+    for row in connection.execute(
+            'SELECT * FROM authors ORDER BY hash, position'):
+        author_lists.setdefault(row['hash'], []).append(
+            {'last_name': row['last_name'],
+             'first_names': row['first_names']})
+    reference_list = []
+    for row in connection.execute('SELECT * FROM entries WHERE included = 1'\
+                                  ' ORDER BY source, line'):
+        reference = Reference(len(reference_list), row['source'], None,
+                              row['hash'], row['line'])
+        for column in ['bib_key', 'entry_type', 'type', 'title', 'venue',
+                       'author_string',
+                       'print_author_string', 'error_message',
+                       'warning_message']:
+            setattr(reference, column, row[column])
+        reference.author_list = author_lists.get(row['hash'], [])
+        reference.year = str(row['year'])
+        author_keys, year, title = json.loads(row['collation_key'])
+        reference.collation_key = (tuple(map(tuple, author_keys)), year,
+                                   title)
+        # the key and the XYZ+ author string without the year index of
+        # the run that saved the entry
+        year_index_length = len(row['year_index'])
+        reference.key = row['key'][:len(row['key']) - year_index_length]
+        reference.xyz_print_author_string = row['xyz_print_author_string'][
+            :len(row['xyz_print_author_string']) - year_index_length]
+        reference_list.append(reference)
+    connection.close()
+
+    reference_list.sort(key=get_sort_key)
+    find_duplicate_references(reference_list)
+    create_year_indices(reference_list)
+    references_by_id = {reference.id: reference
+                        for reference in reference_list}
+    duplicates = []
+    exported_references = []
+    for reference in reference_list:
+        if reference.duplicate:
+            duplicates.append(
+                (reference, references_by_id[reference.duplicate_of]))
+            continue
+        reference.key += reference.year_index
+        reference.xyz_print_author_string += reference.year_index
+        if reference.hash in matching_hashes \
+           and (keys is None or reference.key in keys):
+            exported_references.append(reference)
+    return exported_references, duplicates
+
+#--------------------------------------------------------------------
+# building the dumbib database, once or repeatedly (see the --watch
+# option)
+#--------------------------------------------------------------------
+def create_dumbib_database(bibtex_filenames, dumbib_database_filename,
+                           entry_cache=None, jobs=1, aux_filenames=None,
+                           log_level='full', log_format='text',
+                           store_filename=None, file=None,
+                           shard_prefix_length=None, log_fd=None,
+                           duplicate_cache=None, venue_index=None,
+                           venue_match_threshold=None,
+                           author_name_cache=None, watch_state=None):
+    '''
+    Input: the BibTeX files, the dumbib database file to write, and the
+           entry cache, the number of worker processes, the .aux files,
+           the log level and format, and the reference store given on
+           the command line (see process_bibtex_into_reference_list(),
+           read_cited_keys(), write_log(), and
+           save_references_to_store()), the text stream for the
+           messages (default: the terminal), the length of the key
+           prefixes of the shards (see write_dumbib_database()), the
+           file descriptor for the log (see layout_latex_references()),
+           the duplicate cache (see find_duplicate_references()), the
+           venue index and the venue match threshold (see find_venue()),
+           the author name cache (see create_author_name_cache()), and
+           an empty dictionary to fill with the state needed for
+           updating the dumbib database after an edit (see
+           create_watch_state())
+    Output: a tuple (<entry cache for the next run (see
+            create_entry_cache())>, <list of the references written into
+            the dumbib database and the log>)
+    '''
+    cited_keys = None if aux_filenames is None \
+        else read_cited_keys(aux_filenames)
+    cited_base_keys = None if cited_keys is None \
+        else {get_base_key(key) for key in cited_keys}
+    # the decompressed contents of the compressed files and of the standard
+    # input, which are only kept during this run, and only if the log or
+    # the reference store needs the raw text of their entries
+    FLAG_LOG = log_level != 'none' and (
+        log_fd is not None
+        or get_output_filenames(dumbib_database_filename)[1] is not None)
+    sources = {} if FLAG_LOG or store_filename is not None else None
+    reference_list = process_bibtex_into_reference_list(
+        bibtex_filenames, entry_cache, jobs, cited_base_keys, venue_index,
+        venue_match_threshold, sources, author_name_cache)
+    new_entry_cache = create_entry_cache(reference_list)
+    if watch_state is not None:
+        if duplicate_cache is None:
+            duplicate_cache = {}
+        # (before sort_and_create_keys_for_references() modifies them)
+        parsed_fields = get_parsed_fields(reference_list, new_entry_cache)
+    reference_list = sort_and_create_keys_for_references(reference_list,
+                                                         duplicate_cache)
+    if watch_state is not None:
+        create_watch_state(watch_state, bibtex_filenames, reference_list,
+                           parsed_fields, duplicate_cache, cited_keys)
+    if store_filename is not None:
+        save_references_to_store(store_filename, reference_list, sources)
+    prune_and_layout_references(
+        reference_list, aux_filenames, cited_keys, dumbib_database_filename,
+        log_level,
+        log_format, file, shard_prefix_length, log_fd, sources,
+        watch_state)
+    return new_entry_cache, reference_list
+
+def prune_and_layout_references(reference_list, aux_filenames, cited_keys,
+                                dumbib_database_filename, log_level='full',
+                                log_format='text', file=None,
+                                shard_prefix_length=None, log_fd=None,
+                                sources=None, watch_state=None):
+    '''
+    Input: the sorted list of references, the .aux files given on the
+           command line and the keys cited in them (see
+           read_cited_keys()), the arguments of
+           layout_latex_references(), and the watch state whose entries
+           of the dumbib database, log records and written files to reuse
+           (see create_watch_state())
+    Output: None; the cited references (or all of them, if there are no
+            .aux files) are written into the dumbib database and the log
+    '''
+    if aux_filenames is not None and cited_keys is None:
+        print('None of the .aux files exist yet; writing all the'\
+              ' references.', file=file)
+    if cited_keys is not None:
+        reference_list, missing_keys = prune_uncited_references(
+            reference_list, cited_keys)
+        if len(missing_keys) > 0:
+            print('The following cited keys were not found (or had errors)'\
+                  ' in the BibTeX file: {}'.format(', '.join(missing_keys)),
+                  file=file)
+    layout_latex_references(reference_list, dumbib_database_filename,
+                            log_level, log_format, file, shard_prefix_length,
+                            log_fd, sources,
+                            None if not watch_state
+                            else watch_state['latex_records'],
+                            None if not watch_state
+                            else watch_state['log_records'],
+                            None if not watch_state
+                            else watch_state['written_files'])
+
+def get_file_signature(filename):
+    '''
+    Output: a tuple (<modification time>, <size>) of the file, or None if
+            the file does not exist
+    '''
+    try:
+        file_stat = os.stat(filename)
+    except OSError:
+        return None
+    return file_stat.st_mtime_ns, file_stat.st_size
+
+def watch_and_rebuild(bibtex_filenames, dumbib_database_filename,
+                      entry_cache, aux_filenames=None, log_level='full',
+                      log_format='text', store_filename=None,
+                      poll_interval=0.05, shard_prefix_length=None,
+                      log_fd=None, venue_list_filename=venue_filename,
+                      venue_match_threshold=None, author_name_cache=None,
+                      watch_state=None):
+    '''
+    Input: the same as for create_dumbib_database(), with the entry cache
+           (and optionally the watch state) of the first build, the
+           number of seconds between two checks of the files, and the
+           venue list CSV file instead of its index
+    Output: the entry cache of the last build, once the user stops
+            watching with Ctrl+C
+
+    Notes:
+    The BibTeX files, the venue list, and the .aux files are polled for
+    changes, and the dumbib database is updated whenever any of them
+    changes. The state of the previous build stays in memory (see
+    create_watch_state()), so that an edit of a few entries only splits,
+    parses and sorts these entries again, and only rewrites their
+    entries in the dumbib database and the log (see
+    update_dumbib_database()); the time taken does not grow with the
+    size of the BibTeX files.
+
+    The dumbib database is rebuilt from scratch if the update cannot be
+    applied, if the venue list changed, or with a reference store; the
+    parsed entries (in the entry cache), the data for finding the
+    duplicates (see find_duplicate_references()), and the venue index
+    still stay in memory, so only the entries that changed are parsed
+    again and added to (or removed from) the duplicate detection; the
+    entry cache is only thrown away if the contents of the venue list
+    changed.
+
+    The entries are parsed serially, since an edit usually changes only a
+    few entries, for which starting a pool of worker processes would take
+    longer than parsing them. An error during a build (e.g. when the file
+    disappears while an editor saves it) is printed, and the next change
+    triggers a new build from scratch.
+
+    The entry cache keeps the entries that were removed by the updates
+    until the user stops watching.
+    '''
+    venue_index = load_venue_index(venue_list_filename)
+    watched_filenames = bibtex_filenames + [venue_list_filename] \
+        + (aux_filenames or [])
+    file_signatures = {filename: get_file_signature(filename)
+                       for filename in watched_filenames}
+    print('Watching {} for changes (press Ctrl+C to stop).'.format(
+        ', '.join(watched_filenames)))
+    duplicate_cache = watch_state['duplicate_cache'] if watch_state else {}
+
+    try:
+        while True:
+            time.sleep(poll_interval)
+            new_file_signatures = {filename: get_file_signature(filename)
+                                   for filename in watched_filenames}
+            if new_file_signatures == file_signatures:
+                continue
+            FLAG_VENUES_CHANGED = \
+                new_file_signatures[venue_list_filename] \
+                != file_signatures[venue_list_filename]
+            file_signatures = new_file_signatures
+
+            start = time.perf_counter()
+            try:
+                num_parsed = None
+                if FLAG_VENUES_CHANGED:
+                    venue_sha1 = venue_index['sha1']
+                    venue_index = load_venue_index(venue_list_filename)
+                    if venue_index['sha1'] != venue_sha1:
+                        entry_cache = {}
+                elif watch_state:
+                    num_parsed = update_dumbib_database(
+                        watch_state, bibtex_filenames,
+                        dumbib_database_filename, entry_cache,
+                        aux_filenames, log_level, log_format,
+                        shard_prefix_length=shard_prefix_length,
+                        log_fd=log_fd, venue_index=venue_index,
+                        venue_match_threshold=venue_match_threshold,
+                        author_name_cache=author_name_cache)
+                if num_parsed is None:
+                    watch_state = {} if store_filename is None else None
+                    new_entry_cache, _ = create_dumbib_database(
+                        bibtex_filenames, dumbib_database_filename,
+                        entry_cache, 1, aux_filenames, log_level,
+                        log_format, store_filename,
+                        shard_prefix_length=shard_prefix_length,
+                        log_fd=log_fd, duplicate_cache=duplicate_cache,
+                        venue_index=venue_index,
+                        venue_match_threshold=venue_match_threshold,
+                        author_name_cache=author_name_cache,
+                        watch_state=watch_state)
+                    num_parsed = len(new_entry_cache.keys()
+                                     - entry_cache.keys())
+                    entry_cache = new_entry_cache
+            except Exception as e:
+                print('Could not update the dumbib database: {}'.format(e))
+                duplicate_cache.clear() # it may be half-updated
+                watch_state = None
+                continue
+            print('Updated {} in {:.0f} ms ({} entries parsed).'.format(
+                get_output_filenames(dumbib_database_filename)[0],
+                1000 * (time.perf_counter() - start), num_parsed))
+    except KeyboardInterrupt:
+        pass
+    if watch_state:
+        entry_cache = {reference.hash: entry_cache[reference.hash]
+                       for reference in watch_state['references']}
+    return entry_cache
+
+# an edit which changes more entries than this (e.g. checking out another
+# version of the BibTeX file) is rebuilt from scratch (see
+# update_dumbib_database())
+WATCH_MAX_CHANGED_ENTRIES = 100
+
+def create_watch_state(watch_state, bibtex_filenames, reference_list,
+                       parsed_fields, duplicate_cache, cited_keys):
+    '''
+    Input: an empty dictionary, the BibTeX files of a build, its sorted
+           list of references (see sort_and_create_keys_for_references()),
+           their parsed fields (see get_parsed_fields()), and its
+           duplicate cache and cited keys
+    Output: None; the dictionary is filled with the state that
+            update_dumbib_database() needs, i.e.
+            - 'files': {<BibTeX filename>: [<contents>, <list of tuples
+              (<start offset>, <end offset>, <line number>, <reference,
+              'string' for a @string entry, or None for a skipped
+              entry>) for each entry>]}
+            - 'references': the references in the order of their ids
+            - 'sorted_references': the sorted list of references
+            - 'parsed_fields', 'duplicate_cache', and 'cited_keys'
+            - 'groups': {'fingerprint' | 'bib_key' | 'base_key': {<key>:
+              <list of the references in the group, in the order of
+              their ids>}} (see get_watch_group_keys())
+            - 'first_references': {<fingerprint>: <first reference with
+              it>} (see mark_exact_duplicates())
+            - 'crossref_keys': the keys of the entries named in a
+              "crossref" field
+            - 'latex_records', 'log_records' and 'written_files': the
+              entries of the dumbib database, the log records, and the
+              files written by the build (see write_latex_references(),
+              write_log() and write_file_if_changed())
+
+    Note: The BibTeX files are read and split into entries again, so the
+    state is left empty (and the next change rebuilds the dumbib database
+    from scratch) if they changed in the meantime, or if one of them is
+    compressed (or is the standard input).
+    '''
+    references = sorted(reference_list, key=lambda reference: reference.id)
+    references_by_source = {}
+    for reference in references:
+        references_by_source.setdefault(reference.source, []).append(
+            reference)
+    files = {}
+    for bibtex_filename in bibtex_filenames:
+        if bibtex_filename == '-':
+            return
+        with open(bibtex_filename, 'rb') as f:
+            data = f.read()
+        if get_decompressor(data[:6]) is not None:
+            return
+        entries = []
+        file_references = iter(references_by_source.get(bibtex_filename, []))
+        reference = next(file_references, None)
+        for start_offset, end_offset, line, raw_data in \
+                split_bibtex_entries(data):
+            if reference is not None and reference.span \
+               == (start_offset, end_offset - start_offset):
+                if reference.line != line or reference.hash != hashlib.sha1(
+                        raw_data.encode('utf-8')).hexdigest():
+                    return
+                entries.append((start_offset, end_offset, line, reference))
+                reference = next(file_references, None)
+                continue
+            entry_type = read_entry_head(raw_data)[0]
+            if entry_type == 'string':
+                entries.append((start_offset, end_offset, line, 'string'))
+            elif entry_type in bibtex_skipped_entry_types:
+                entries.append((start_offset, end_offset, line, None))
+            else:
+                return
+        if reference is not None:
+            return
+        files[bibtex_filename] = [data, entries]
+
+    fingerprints = duplicate_cache['fingerprints']
+    groups = {'fingerprint': {}, 'bib_key': {}, 'base_key': {}}
+    for reference in references:
+        for kind, key in get_watch_group_keys(reference, parsed_fields,
+                                              fingerprints):
+            groups[kind].setdefault(key, []).append(reference)
+    watch_state.update({
+        'files': files, 'references': references,
+        'sorted_references': list(reference_list),
+        'parsed_fields': parsed_fields, 'duplicate_cache': duplicate_cache,
+        'cited_keys': cited_keys, 'groups': groups,
+        'first_references': {
+            fingerprint: group[0]
+            for fingerprint, group in groups['fingerprint'].items()},
+        'crossref_keys': {key for reference in references
+                          for kind, key, _ in reference.dependencies
+                          if kind == 'crossref'},
+        'latex_records': {}, 'log_records': {}, 'written_files': {}})
+
+def get_watch_group_keys(reference, parsed_fields, fingerprints):
+    '''
+    Input: a reference, and the parsed fields and the fingerprints (see
+           find_duplicate_references()) of the references
+    Output: a list of the (<kind>, <key>) of the groups of the reference
+            (see create_watch_state())
+
+    Note: The keys and the messages created by
+    sort_and_create_keys_for_references() for a reference only depend on
+    the other references of its groups, i.e. those with the same
+    fingerprint (the exact duplicates), the same BibTeX key (in lower
+    case; see find_repeated_bibtex_keys()), and the same key without the
+    year index (see create_year_indices()), except for the near
+    duplicates, and for the ids in the messages.
+    '''
+    group_keys = []
+    if reference in fingerprints:
+        group_keys.append(('fingerprint', fingerprints[reference][0]))
+    if reference.bib_key:
+        group_keys.append(('bib_key', reference.bib_key.lower()))
+    if parsed_fields[reference][cached_reference_keys.index('INCLUDE_FLAG')]:
+        group_keys.append(('base_key', reference.author_strings[1]))
+    return group_keys
+
+def get_watch_sort_key(reference, parsed_fields):
+    '''
+    Output: the position of the reference in the sorted list of
+            references (see sort_references()), which is sorted by the
+            collation keys the references had when they were parsed,
+            and then by their ids
+    '''
+    if not parsed_fields[reference][
+            cached_reference_keys.index('INCLUDE_FLAG')]:
+        return empty_collation_key, reference.id
+    return reference.collation_key, reference.id
+
+def update_dumbib_database(watch_state, bibtex_filenames,
+                           dumbib_database_filename, entry_cache,
+                           aux_filenames=None, log_level='full',
+                           log_format='text', file=None,
+                           shard_prefix_length=None, log_fd=None,
+                           venue_index=None, venue_match_threshold=None,
+                           author_name_cache=None):
+    '''
+    Input: the state of the previous build (see create_watch_state()),
+           and the same arguments as for create_dumbib_database()
+    Output: the number of entries that were parsed, or None if the
+            changes since the previous build cannot be applied to it, in
+            which case nothing was changed (and the dumbib database has
+            to be rebuilt from scratch)
+
+    Notes:
+    The new contents of each BibTeX file are compared with the previous
+    ones, and only the entries around the bytes that changed are split
+    and parsed again (see split_changed_entries()); the later entries
+    only have their offsets, line numbers and ids shifted. The entries
+    that changed are then taken out of (or put into) the sorted list of
+    references, the groups of the references (see
+    get_watch_group_keys()) and the duplicate cache (see
+    update_duplicate_buckets()), and
+    sort_and_create_keys_for_references() is only run again for the
+    references of their groups, i.e. for the references whose keys or
+    messages may have changed. These are restored to what they were
+    right after being parsed (see restore_parsed_reference()) and go
+    through the same steps as in a full build, so the output is exactly
+    the same.
+
+    Finally, the dumbib database and the log are written from the
+    entries and the log records of the previous build (see
+    write_latex_references() and write_log()), except for those of the
+    references that were processed again; the log records of the other
+    references only get a new head if their id or line number changed.
+    The entry cache is updated with the new entries, but keeps the
+    entries that were removed (see watch_and_rebuild()).
+
+    The changes cannot be applied if a @string entry, an entry with a
+    crossref field, or an entry named in a crossref field changed (they
+    change how the other entries are parsed), if too many entries
+    changed (see WATCH_MAX_CHANGED_ENTRIES), if a file cannot be split
+    into entries, or if the cited keys changed.
+    '''
+    cited_keys = None if aux_filenames is None \
+        else read_cited_keys(aux_filenames)
+    if cited_keys != watch_state['cited_keys']:
+        return None
+    if venue_index is None:
+        venue_index = load_venue_index(venue_filename)
+    files = watch_state['files']
+    parsed_fields = watch_state['parsed_fields']
+    duplicate_cache = watch_state['duplicate_cache']
+    fingerprints = duplicate_cache['fingerprints']
+    groups = watch_state['groups']
+    first_references = watch_state['first_references']
+    sorted_references = watch_state['sorted_references']
+
+    # find the changes of all the files before changing anything
+    changes = {}
+    num_changed_entries = 0
+    for bibtex_filename in bibtex_filenames:
+        old_data, entries = files[bibtex_filename]
+        with open(bibtex_filename, 'rb') as f:
+            data = f.read()
+        if data == old_data:
+            continue
+        if get_decompressor(data[:6]) is not None:
+            return None
+        try:
+            first, last, raw_entries, offset_shift, line_shift = \
+                split_changed_entries(entries, old_data, data)
+        except UnicodeDecodeError:
+            return None # reported (with the right line) by a full build
+        # the entries at both ends of the range that did not change are
+        # kept, at their new position
+        num_kept_before = 0
+        while num_kept_before < min(last - first, len(raw_entries)) \
+              and old_data[entries[first+num_kept_before][0]:
+                           entries[first+num_kept_before][1]] \
+              == data[raw_entries[num_kept_before][0]:
+                      raw_entries[num_kept_before][1]]:
+            num_kept_before += 1
+        num_kept_after = 0
+        while num_kept_after < min(last - first, len(raw_entries)) \
+              - num_kept_before \
+              and old_data[entries[last-1-num_kept_after][0]:
+                           entries[last-1-num_kept_after][1]] \
+              == data[raw_entries[-1-num_kept_after][0]:
+                      raw_entries[-1-num_kept_after][1]]:
+            num_kept_after += 1
+        removed_entries = entries[first+num_kept_before:
+                                  last-num_kept_after]
+        added_entries = raw_entries[num_kept_before:
+                                    len(raw_entries)-num_kept_after]
+        num_changed_entries += len(removed_entries) + len(added_entries)
+        if num_changed_entries > WATCH_MAX_CHANGED_ENTRIES:
+            return None
+        for raw_data in [old_data[start_offset:end_offset].decode('utf-8')
+                         for start_offset, end_offset, _, _
+                         in removed_entries] \
+                        + [raw_entry[3] for raw_entry in added_entries]:
+            entry_type, bib_key = read_entry_head(raw_data)
+            if entry_type == 'string' \
+               or bibtex_crossref_regex.search(raw_data) \
+               or (bib_key or '').lower() in watch_state['crossref_keys']:
+                return None
+        changes[bibtex_filename] = (data, first, last, raw_entries,
+                                    num_kept_before, num_kept_after,
+                                    offset_shift, line_shift)
+
+    # take the references that were removed out of the sorted list and
+    # of their groups (while they still have their ids)
+    removed_references = [
+        item for bibtex_filename, change in changes.items()
+        for _, _, _, item in files[bibtex_filename][1][
+            change[1]+change[4]:change[2]-change[5]]
+        if isinstance(item, Reference)]
+    removed_group_keys = []
+    changed_fingerprints = set()
+    for reference in removed_references:
+        del sorted_references[bisect.bisect_left(
+            sorted_references, get_watch_sort_key(reference, parsed_fields),
+            key=lambda other: get_watch_sort_key(other, parsed_fields))]
+        for kind, key in get_watch_group_keys(reference, parsed_fields,
+                                              fingerprints):
+            group = groups[kind][key]
+            group.remove(reference)
+            if len(group) == 0:
+                del groups[kind][key]
+            removed_group_keys.append((kind, key))
+            if kind == 'fingerprint':
+                changed_fingerprints.add(key)
+        fingerprints.pop(reference, None)
+        del parsed_fields[reference]
+
+    # put the new entries in place of the old ones, and shift the later
+    # ones
+    new_references = {}
+    for bibtex_filename, (data, first, last, raw_entries, num_kept_before,
+                          num_kept_after, offset_shift, line_shift) \
+            in changes.items():
+        entries = files[bibtex_filename][1]
+        new_entries = entries[:first]
+        kept_entries = entries[first:first+num_kept_before] \
+            + entries[last-num_kept_after:last]
+        for i, raw_entry in enumerate(raw_entries):
+            start_offset, end_offset, line, raw_data = raw_entry
+            if num_kept_before <= i < len(raw_entries) - num_kept_after:
+                if read_entry_head(raw_data)[0] \
+                   in bibtex_skipped_entry_types:
+                    item = None
+                else:
+                    item = create_reference(None, bibtex_filename,
+                                            raw_entry)
+                    new_references[item] = raw_data
+            else:
+                item = kept_entries[i if i < num_kept_before else
+                                    i - len(raw_entries) + len(kept_entries)
+                                   ][3]
+            new_entries.append((start_offset, end_offset, line, item))
+        for start_offset, end_offset, line, item in entries[last:]:
+            new_entries.append((start_offset + offset_shift,
+                                end_offset + offset_shift, line + line_shift,
+                                item))
+        for start_offset, end_offset, line, item in new_entries[first:]:
+            if isinstance(item, Reference):
+                item.span = (start_offset, end_offset - start_offset)
+                item.line = line
+        files[bibtex_filename] = [data, new_entries]
+
+    # renumber the references; the messages naming the ids from
+    # "first_shifted_id" on may have changed
+    references = watch_state['references'] = [
+        item for bibtex_filename in bibtex_filenames
+        for _, _, _, item in files[bibtex_filename][1]
+        if isinstance(item, Reference)]
+    first_shifted_id = None
+    for bib_id, reference in enumerate(references):
+        if reference.id != bib_id:
+            if first_shifted_id is None and reference.id is not None:
+                first_shifted_id = bib_id
+            reference.id = bib_id
+
+    # parse the new entries, with the macros defined before them
+    num_parsed = 0
+    cited_base_keys = None if cited_keys is None \
+        else {get_base_key(key) for key in cited_keys}
+    symbol_table = create_symbol_table(author_name_cache=author_name_cache)
+    for bibtex_filename in bibtex_filenames:
+        data, entries = files[bibtex_filename]
+        for start_offset, end_offset, _, item in entries:
+            if item == 'string':
+                define_bibtex_macros(
+                    data[start_offset:end_offset].decode('utf-8'),
+                    symbol_table)
+            elif item in new_references:
+                if not restore_from_entry_cache(
+                        item, entry_cache, symbol_table, cited_base_keys,
+                        venue_index, venue_match_threshold,
+                        new_references[item]):
+                    parse_reference(item, new_references[item],
+                                    cited_base_keys, venue_index,
+                                    symbol_table, venue_match_threshold)
+                    num_parsed += 1
+    close_symbol_table(symbol_table)
+
+    # put the new references into the sorted list and into their groups
+    for reference in new_references:
+        parsed_fields[reference] = entry_cache[reference.hash] = \
+            get_cached_fields(reference)
+        if reference.INCLUDE_FLAG:
+            fingerprints[reference] = get_duplicate_fingerprint(
+                reference, duplicate_cache['titles'])
+        bisect.insort(sorted_references, reference,
+                      key=lambda other: get_watch_sort_key(other,
+                                                           parsed_fields))
+        for kind, key in get_watch_group_keys(reference, parsed_fields,
+                                              fingerprints):
+            bisect.insort(groups[kind].setdefault(key, []), reference,
+                          key=lambda other: other.id)
+            if kind == 'fingerprint':
+                changed_fingerprints.add(key)
+
+    # update the near duplicates of the fingerprints whose first
+    # reference changed; the references paired with them (before or
+    # after) may gain or lose a warning
+    paired_fingerprints = set()
+    for pair in duplicate_cache['near_duplicates']:
+        if not pair.isdisjoint(changed_fingerprints):
+            paired_fingerprints.update(pair)
+    members = dict(duplicate_cache['members'])
+    for fingerprint in changed_fingerprints:
+        group = groups['fingerprint'].get(fingerprint)
+        if group is None:
+            del members[fingerprint], first_references[fingerprint]
+        else:
+            first_references[fingerprint] = group[0]
+            members[fingerprint] = fingerprints[group[0]][1]
+    update_duplicate_buckets(duplicate_cache, members, changed_fingerprints)
+    near_duplicates = duplicate_cache['near_duplicates']
+    for pair in near_duplicates:
+        if not pair.isdisjoint(changed_fingerprints):
+            paired_fingerprints.update(pair)
+
+    # the references to process again: the new ones, those of the groups
+    # of the new and the removed ones and of their near duplicates, and
+    # those with an id in their messages that changed, along with all
+    # the references of their groups
+    marked_references = set()
+    pending_references = []
+    def mark(references):
+        for reference in references:
+            if reference not in marked_references:
+                marked_references.add(reference)
+                pending_references.append(reference)
+    mark(new_references)
+    for kind, key in removed_group_keys:
+        mark(groups[kind].get(key, ()))
+    mark(first_references[fingerprint] for fingerprint in paired_fingerprints
+         if fingerprint in first_references)
+    if first_shifted_id is not None:
+        for kind in ['fingerprint', 'bib_key']:
+            for group in groups[kind].values():
+                if len(group) > 1 and group[-1].id >= first_shifted_id:
+                    mark(group)
+        for pair in near_duplicates:
+            reference = max([first_references[fingerprint]
+                             for fingerprint in pair],
+                            key=lambda reference: reference.id)
+            if reference.id >= first_shifted_id:
+                mark([reference])
+    while len(pending_references) > 0:
+        reference = pending_references.pop()
+        for kind, key in get_watch_group_keys(reference, parsed_fields,
+                                              fingerprints):
+            mark(groups[kind][key])
+
+    # process them as in sort_and_create_keys_for_references()
+    for reference in marked_references:
+        if reference not in new_references:
+            restore_parsed_reference(reference, parsed_fields[reference])
+    marked_list = sorted(marked_references,
+                         key=lambda reference: reference.id)
+    marked_sorted_list = sort_references(marked_list)
+    mark_exact_duplicates([reference for reference in marked_list
+                           if reference.INCLUDE_FLAG], fingerprints)
+    mark_near_duplicates(near_duplicates, first_references, fingerprints,
+                         marked_references)
+    find_repeated_bibtex_keys(marked_list)
+    create_keys_for_references(marked_sorted_list)
+
+    for reference in removed_references + marked_list:
+        watch_state['latex_records'].pop(reference, None)
+        watch_state['log_records'].pop(reference, None)
+    prune_and_layout_references(
+        list(sorted_references), aux_filenames, cited_keys,
+        dumbib_database_filename, log_level, log_format, file,
+        shard_prefix_length, log_fd,
+        {bibtex_filename: files[bibtex_filename][0]
+         for bibtex_filename in bibtex_filenames}, watch_state)
+    return num_parsed
+
+def split_changed_entries(entries, old_data, data):
+    '''
+    Input: the entries of a BibTeX file (see create_watch_state()), and
+           its previous and its current contents
+    Output: a tuple (<index of the first entry that may have changed>,
+            <index after the last one>, <list of the raw entries (see
+            split_bibtex_entries()) replacing them>, <shift of the
+            offsets of the later entries>, <shift of their line
+            numbers>)
+
+    Notes:
+    Only the bytes between the common prefix and the common suffix of the
+    two contents changed. The entries are split again from the start of
+    the entry before the one where the change starts (a change at the
+    start of an entry can move the end of the previous one), up to the
+    first entry that starts on a line which is entirely in the common
+    suffix, i.e. which is still found at the same place (shifted by the
+    change in length) by bibtex_entry_start_regex; the entries from
+    there on are the same as before.
+    '''
+    prefix_length = get_common_prefix_length(old_data, data)
+    suffix_length = get_common_prefix_length(
+        old_data, data, min(len(old_data), len(data)) - prefix_length,
+        from_end=True)
+    first = bisect.bisect_right(entries, prefix_length,
+                                key=lambda entry: entry[0]) - 2
+    if first < 0:
+        first, region_start, first_line = 0, 0, 1
+    else:
+        region_start, first_line = entries[first][0], entries[first][2]
+    suffix_start = len(old_data) - suffix_length
+    last = bisect.bisect_left(entries, suffix_start, lo=first,
+                              key=lambda entry: entry[0])
+    while last < len(entries) \
+          and old_data.rfind(b'\n', 0, entries[last][0]) < suffix_start:
+        last += 1
+    offset_shift = len(data) - len(old_data)
+    region_end = len(old_data) if last == len(entries) \
+        else entries[last][0]
+    raw_entries = [
+        (start_offset + region_start, end_offset + region_start,
+         line + first_line - 1, raw_data)
+        for start_offset, end_offset, line, raw_data in split_bibtex_entries(
+            data[region_start:region_end+offset_shift])]
+    line_shift = data.count(b'\n', region_start, region_end + offset_shift) \
+        - old_data.count(b'\n', region_start, region_end)
+    return first, last, raw_entries, offset_shift, line_shift
+
+def get_common_prefix_length(data1, data2, max_length=None, from_end=False):
+    '''
+    Input: two bytes objects, optionally the maximum length to compare,
+           and whether to compare their ends instead of their starts
+    Output: the length of their longest common prefix (or suffix, if
+            from_end is True)
+
+    Note: The bytes are compared in chunks of READ_CHUNK_SIZE bytes, and
+    the chunk with the first difference is then bisected, so comparing
+    two large files costs little more than comparing their bytes once.
+    '''
+    length = min(len(data1), len(data2))
+    if max_length is not None:
+        length = min(length, max_length)
+    start = 0
+    while start < length:
+        end = min(start + READ_CHUNK_SIZE, length)
+        if get_bytes(data1, start, end, from_end) \
+           != get_bytes(data2, start, end, from_end):
+            break
+        start = end
+    else:
+        return length
+    # the first difference is in the chunk; bisect it
+    end -= 1
+    while start < end:
+        middle = (start + end + 1) // 2
+        if get_bytes(data1, start, middle, from_end) \
+           == get_bytes(data2, start, middle, from_end):
+            start = middle
+        else:
+            end = middle - 1
+    return start
+
+def get_bytes(data, start, end, from_end=False):
+    '''
+    Output: the bytes from start to end, counted from the end of the data
+            if from_end is True
+    '''
+    if from_end:
+        return data[len(data)-end:len(data)-start]
+    return data[start:end]
+
+#--------------------------------------------------------------------
+# lint mode (see the --check option)
+#--------------------------------------------------------------------
+def parse_line_ranges(specs):
+    '''
+    Input: a list of line ranges of the form "[<file>:]<first>[-<last>]",
+           e.g. "refs.bib:10-25" or "40" (for all the files)
+    Output: a dictionary {<real path of the file (see
+            os.path.realpath()), or None for all the files>: [(<first
+            line>, <last line>), ...]}
+
+    Note: A ValueError is raised for an invalid range. The files are
+    identified by their real paths, so that e.g. "./refs.bib" and the
+    absolute path of "refs.bib" are the same file.
+    '''
+    line_ranges = {}
+    for spec in specs:
+        filename, _, lines = spec.rpartition(':')
+        first, _, last = lines.partition('-')
+        try:
+            first = int(first)
+            last = int(last) if last else first
+        except ValueError:
+            raise ValueError('invalid line range: {}'.format(spec))
+        if first < 1 or last < first:
+            raise ValueError('invalid line range: {}'.format(spec))
+        line_ranges.setdefault(os.path.realpath(filename) if filename
+                               else None, []).append((first, last))
+    return line_ranges
+
+def get_file_line_ranges(line_ranges, bibtex_filename):
+    '''
+    Input: the line ranges (see parse_line_ranges(); None means all the
+           lines), and a BibTeX filename
+    Output: the list of the line ranges of this file, or None for all
+            its lines
+    '''
+    if line_ranges is None:
+        return None
+    return line_ranges.get(None, []) \
+        + line_ranges.get(os.path.realpath(bibtex_filename), [])
+
+def is_in_line_ranges(reference, raw_data, file_line_ranges):
+    '''
+    Input: a reference, its raw BibTeX text, and the line ranges of its
+           file (see get_file_line_ranges())
+    Output: True if any line of the entry is in the line ranges
+    '''
+    if file_line_ranges is None:
+        return True
+    last_line = reference.line + raw_data.count('\n')
+    return any(first <= last_line and reference.line <= last
+               for first, last in file_line_ranges)
+
+def check_bibtex_files(bibtex_filenames, entry_cache=None, line_ranges=None,
+                       max_errors=None, file=None, venue_index=None,
+                       venue_match_threshold=None, author_name_cache=None):
+    '''
+    Input: a list of BibTeX filenames, optionally the entry cache from a
+           previous run (see load_entry_cache(); it is only read), the
+           changed line ranges (see parse_line_ranges(); default: check
+           all the entries), the number of entries with errors after
+           which to stop, the text stream for the messages (default:
+           the terminal), the venue index (default: that of the default
+           venue list) and the venue match threshold (see find_venue()),
+           and the author name cache (see create_author_name_cache())
+    Output: the list of the checked references, sorted by their ids
+
+    Notes:
+    This runs the parsing and the checks of
+    process_bibtex_into_reference_list() and
+    sort_and_create_keys_for_references() (unknown venues, malformed
+    authors and years, duplicates, etc.), but writes no files at all;
+    the errors of the checked references are printed as by
+    print_error_summary().
+
+    All the entries are read, since the @string macros, the crossref
+    entries, and the duplicate detection depend on them, but only the
+    checked entries (i.e. those overlapping the line ranges) are fully
+    parsed; the venues of the other entries are skipped as for the
+    uncited references (see parse_reference()). An entry outside the
+    line ranges is also checked if it is a duplicate of a checked entry,
+    or if it has the same BibTeX key (see find_repeated_bibtex_keys()).
+
+    The entries are parsed serially and one at a time, so that the check
+    stops as soon as max_errors checked entries have errors; the
+    duplicates are then not looked for.
+    '''
+    file = sys.stdout if file is None else file
+    if venue_index is None:
+        venue_index = load_venue_index(venue_filename)
+    symbol_table = create_symbol_table(author_name_cache=author_name_cache)
+    reference_list = []
+    parsed_references = []
+    checked_ids = set()
+    crossref_children = []
+    num_errors = 0
+    FLAG_STOPPED = False
+
+    def parse_and_count(reference, raw_data):
+        nonlocal num_errors
+        parsed_references.append(reference)
+        cited_base_keys = None if reference.id in checked_ids \
+            else frozenset()
+        if not restore_from_entry_cache(reference, entry_cache,
+                                        symbol_table, cited_base_keys,
+                                        venue_index, venue_match_threshold,
+                                        raw_data):
+            parse_reference(reference, raw_data, cited_base_keys,
+                            venue_index, symbol_table, venue_match_threshold)
+        if reference.id in checked_ids and not reference.INCLUDE_FLAG:
+            num_errors += 1
+        return max_errors is not None and num_errors >= max_errors
+
+    for bibtex_filename in bibtex_filenames:
+        file_line_ranges = get_file_line_ranges(line_ranges, bibtex_filename)
+        raw_entries = read_bibtex_entries(bibtex_filename,
+                                          symbol_table['open_sources'])
+        for reference, raw_data in read_references(
+                raw_entries, bibtex_filename, symbol_table,
+                len(reference_list)):
+            reference_list.append(reference)
+            if is_in_line_ranges(reference, raw_data, file_line_ranges):
+                checked_ids.add(reference.id)
+            if bibtex_crossref_regex.search(raw_data):
+                crossref_children.append(reference) # parsed below
+            elif parse_and_count(reference, raw_data):
+                FLAG_STOPPED = True
+                break
+        raw_entries.close()
+        if FLAG_STOPPED:
+            break
+
+    if not FLAG_STOPPED:
+        for reference in crossref_children:
+            if parse_and_count(reference, read_raw_data(
+                    reference, symbol_table['open_sources'])):
+                FLAG_STOPPED = True
+                break
+    close_symbol_table(symbol_table)
+
+    if not FLAG_STOPPED:
+        sort_and_create_keys_for_references(reference_list)
+    checked_keys = {reference.bib_key.lower()
+                    for reference in parsed_references
+                    if reference.id in checked_ids and reference.bib_key}
+    checked_references = sorted(
+        [reference for reference in parsed_references
+         if reference.id in checked_ids
+         or reference.duplicate_of in checked_ids
+         or (reference.bib_key or '').lower() in checked_keys],
+        key=lambda reference: reference.id)
+
+    print_error_summary(checked_references, None, file)
+    if FLAG_STOPPED:
+        print('Stopped after {} entries with errors.'.format(num_errors),
+              file=file)
+    else:
+        print('Checked {} of the {} entries.'.format(
+            len(checked_references), len(parsed_references)), file=file)
+    return checked_references
+
+#--------------------------------------------------------------------
+# batch mode (see the --manifest option)
+#--------------------------------------------------------------------
+# the options of a job in the manifest, and their default values
+manifest_job_options = {'inputs': None, 'output': None, 'aux': None,
+                        'store': None, 'log_level': 'full',
+                        'log_format': 'text', 'no_cache': False,
+                        'shard_prefix_length': None}
+
+def load_manifest(manifest_filename):
+    '''
+    Input: the filename of the manifest, i.e. a JSON file containing a
+           list of jobs (or an object with the list under "jobs")
+    Output: the list of jobs, as dictionaries with all the keys of
+            "manifest_job_options"
+
+    Notes:
+    Each job is an object like {"inputs": ["paper1/*.bib"], "output":
+    "paper1/dumbib_database.tex"}, with optionally the keys "aux" (a list
+    of .aux files), "store", "log_level", "log_format", "no_cache", and
+    "shard_prefix_length", which have the same meaning as the command
+    line options. The relative paths are relative to the directory of
+    the manifest.
+
+    A ValueError is raised if the manifest is malformed (including a job
+    which is not an object, or an option of the wrong type), so that no
+    job is run in that case.
+    '''
+    with open(manifest_filename) as f:
+        manifest = json.load(f)
+    if isinstance(manifest, dict):
+        manifest = manifest.get('jobs')
+    if not isinstance(manifest, list):
+        raise ValueError('The manifest must contain a list of jobs.')
+
+    base_directory = os.path.dirname(os.path.abspath(manifest_filename))
+    def resolve(filename):
+        return os.path.join(base_directory, filename)
+
+    def is_filename_list(value):
+        return isinstance(value, str) or (
+            isinstance(value, list)
+            and all(isinstance(item, str) for item in value))
+
+    jobs = []
+    for i, job in enumerate(manifest):
+        if not isinstance(job, dict):
+            raise ValueError('Job #{} is not an object.'.format(i))
+        unknown_options = set(job) - set(manifest_job_options)
+        if len(unknown_options) > 0:
+            raise ValueError('Job #{} has unknown options: {}.'.format(
+                i, ', '.join(sorted(unknown_options))))
+        if job.get('inputs') is None or job.get('output') is None:
+            raise ValueError('Job #{} needs both "inputs" and'\
+                             ' "output".'.format(i))
+        if job.get('log_level', 'full') not in log_levels \
+           or job.get('log_format', 'text') not in log_formats:
+            raise ValueError('Job #{} has an invalid log level or'\
+                             ' format.'.format(i))
+        if not is_filename_list(job['inputs']) \
+           or not isinstance(job['output'], str) \
+           or not (job.get('aux') is None or is_filename_list(job['aux'])) \
+           or not isinstance(job.get('store', ''), (str, type(None))) \
+           or not isinstance(job.get('no_cache', False), bool):
+            raise ValueError('Job #{} has an option of the wrong type.'\
+                             .format(i))
+        shard_prefix_length = job.get('shard_prefix_length')
+        if shard_prefix_length is not None \
+           and (not isinstance(shard_prefix_length, int)
+                or isinstance(shard_prefix_length, bool)
+                or shard_prefix_length < 1):
+            raise ValueError('Job #{} has an invalid shard prefix'\
+                             ' length.'.format(i))
+        job = dict(manifest_job_options, **job)
+        if isinstance(job['inputs'], str):
+            job['inputs'] = [job['inputs']]
+        job['inputs'] = [resolve(pattern) for pattern in job['inputs']]
+        job['output'] = resolve(job['output'])
+        if job['aux'] is not None:
+            job['aux'] = [resolve(aux_filename) for aux_filename in
+                          ([job['aux']] if isinstance(job['aux'], str)
+                           else job['aux'])]
+        if job['store'] is not None:
+            job['store'] = resolve(job['store'])
+        jobs.append(job)
+    return jobs
+
+def run_batch_job(job, venue_index=None, venue_match_threshold=None):
+    '''
+    Input: a job returned by load_manifest(), and the venue index
+           (default: that of the default venue list) and the venue match
+           threshold (see find_venue())
+    Output: a dictionary with the output filename, the status ('ok' or
+            'failed'), the numbers of references, errors and warnings,
+            the time taken, and the messages of the job
+
+    Notes:
+    Any exception is caught and reported as a failure of this job only.
+    The messages are collected instead of being printed, so that the
+    messages of the jobs running at the same time do not interleave.
+
+    The job uses the author names of its own entry cache only (see
+    create_author_name_cache()).
+    '''
+    result = {'output': os.path.relpath(job['output']), 'status': 'ok',
+              'num_entries': 0, 'num_errors': 0, 'num_warnings': 0}
+    start = time.perf_counter()
+    with io.StringIO() as messages:
+        try:
+            if venue_index is None:
+                venue_index = load_venue_index(venue_filename)
+            cache_filename = get_output_filenames(job['output'])[2]
+            author_name_cache = create_author_name_cache()
+            entry_cache = None if job['no_cache'] \
+                else load_entry_cache(cache_filename, venue_index,
+                                      venue_match_threshold,
+                                      author_name_cache)
+            new_entry_cache, reference_list = create_dumbib_database(
+                find_bibtex_files(job['inputs']), job['output'],
+                entry_cache, 1, job['aux'], job['log_level'],
+                job['log_format'], job['store'], messages,
+                job['shard_prefix_length'], venue_index=venue_index,
+                venue_match_threshold=venue_match_threshold,
+                author_name_cache=author_name_cache)
+            if not job['no_cache'] and new_entry_cache != entry_cache:
+                save_entry_cache(cache_filename, new_entry_cache,
+                                 venue_index, venue_match_threshold,
+                                 author_name_cache)
+            result['num_entries'] = len(reference_list)
+            result['num_errors'] = sum(
+                get_log_status(reference) == 'error'
+                for reference in reference_list)
+            result['num_warnings'] = sum(
+                get_log_status(reference) == 'warning'
+                for reference in reference_list)
+        except Exception as e:
+            result['status'] = 'failed'
+            print('The job failed: {}: {}'.format(type(e).__name__, e),
+                  file=messages)
+        result['messages'] = messages.getvalue()
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+def run_batch(jobs, concurrency, executor_type='process', venue_index=None,
+              venue_match_threshold=None):
+    '''
+    Input: the jobs returned by load_manifest(), the number of jobs to run
+           at the same time, whether to run them in a pool of 'thread's
+           or 'process'es, and the venue index and the venue match
+           threshold (see find_venue())
+    Output: the list of the results of run_batch_job(), in the order of
+            the jobs
+
+    Notes:
+    The venue index is loaded once, before any job starts; the threads
+    share it, and the worker processes get a copy of it with each job
+    (rather than each job loading the venue list again; the copy is much
+    smaller than a job). With processes, the jobs run truly in parallel;
+    threads avoid copying the venue index but only overlap the file
+    reading and writing. Each job has its own author name cache (see
+    run_batch_job()), so the jobs share nothing else.
+
+    The jobs do not use --jobs style parallel parsing themselves.
+    '''
+    if venue_index is None:
+        venue_index = load_venue_index(venue_filename)
+    executor_class = concurrent.futures.ThreadPoolExecutor \
+        if executor_type == 'thread' \
+        else concurrent.futures.ProcessPoolExecutor
+    with executor_class(max_workers=concurrency) as executor:
+        return list(executor.map(functools.partial(
+            run_batch_job, venue_index=venue_index,
+            venue_match_threshold=venue_match_threshold), jobs))
+
+def print_batch_summary(results, total_seconds, file=None):
+    '''
+    Prints the messages of the failed jobs, followed by a table with the
+    status, the numbers of references, errors and warnings, and the time
+    taken by each job.
+    '''
+    for result in results:
+        if result['status'] != 'ok':
+            print('{}:\n{}'.format(result['output'], result['messages']),
+                  file=file)
+    width = max([len('job')] + [len(result['output'])
+                                for result in results])
+    print('{:<{width}}  {:<7}{:>9}{:>8}{:>10}{:>10}'.format(
+        'job', 'status', 'entries', 'errors', 'warnings', 'time (s)',
+        width=width), file=file)
+    print('-' * (width + 46), file=file)
+    for result in results:
+        print('{:<{width}}  {:<7}{:>9}{:>8}{:>10}{:>10.3f}'.format(
+            result['output'], result['status'], result['num_entries'],
+            result['num_errors'], result['num_warnings'], result['seconds'],
+            width=width), file=file)
+    num_failed = sum(result['status'] != 'ok' for result in results)
+    print('{} jobs: {} succeeded, {} failed ({:.3f} s in total).'.format(
+        len(results), len(results) - num_failed, num_failed,
+        total_seconds), file=file)
+
+#--------------------------------------------------------------------
+# instrumentation (see the --stats and --stats_json options)
+#--------------------------------------------------------------------
+# the functions whose calls are timed; the peak memory is also tracked
+# for the pipeline stages
+instrumented_functions = [
+    'tokenize_bibtex_entry', 'find_fields', 'find_bibliography_type',
+    'find_author_list', 'parse_author_name', 'find_year', 'find_title',
+    'find_venue',
+    'find_matching_venues', 'find_similar_venues',
+    'find_duplicate_references',
+    'write_file_if_changed']
+instrumented_stages = [
+    'load_entry_cache', 'process_bibtex_into_reference_list',
+    'sort_and_create_keys_for_references', 'layout_latex_references',
+    'update_dumbib_database', 'save_entry_cache']
+
+# {<function name>: {'durations': [...], 'peak_memory': <bytes>}}; this
+# stays None unless enable_instrumentation() is called
+instrumentation_stats = None
+
+def enable_instrumentation(trace_memory=False):
+    '''
+    Replaces the functions listed above with wrappers that record the
+    duration of every call, and, if trace_memory is True, the peak memory
+    (traced by tracemalloc) of each pipeline stage.
+
+    Notes:
+    Since the functions are only replaced when the instrumentation is
+    enabled, it costs nothing otherwise. Tracing the memory allocations
+    slows down the program several times, so the times reported with
+    trace_memory are much larger than those of a normal run. With --jobs,
+    the find_* functions run in the worker processes and are not included
+    in the statistics (the pipeline stages still are).
+    '''
+    global instrumentation_stats
+    instrumentation_stats = {}
+    if trace_memory:
+        tracemalloc.start()
+    module_globals = globals()
+    for name in instrumented_functions + instrumented_stages:
+        module_globals[name] = instrument_function(
+            module_globals[name],
+            trace_memory and name in instrumented_stages)
+
+def instrument_function(function, track_memory):
+    stats = instrumentation_stats.setdefault(
+        function.__name__, {'durations': [], 'peak_memory': None})
+    durations = stats['durations']
+
+    @functools.wraps(function)
+    def instrumented_function(*args, **kwargs):
+        if track_memory:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            durations.append(time.perf_counter() - start)
+            if track_memory:
+                stats['peak_memory'] = max(stats['peak_memory'] or 0,
+                                           tracemalloc.get_traced_memory()[1])
+    return instrumented_function
+
+def summarize_instrumentation(author_name_cache):
+    '''
+    Input: the author name cache of the run (see
+           create_author_name_cache())
+    Output: a dictionary with the number of calls, the total time, the
+            95th percentile of the time per call, and the peak memory
+            (only for the pipeline stages) of each instrumented function,
+            and the hits, misses, and size of the author name cache
+            (under the key 'author_name_cache')
+
+    Note: With --jobs, the author names parsed in the worker processes
+    are not included in the cache statistics.
+    '''
+    summary = {}
+    for name, stats in instrumentation_stats.items():
+        if len(stats['durations']) == 0:
+            continue # e.g. the entry cache was not used
+        durations = sorted(stats['durations'])
+        summary[name] = {
+            'calls': len(durations),
+            'total_seconds': sum(durations),
+            'p95_seconds': durations[min(int(0.95 * len(durations)),
+                                         len(durations) - 1)],
+            'peak_memory_bytes': stats['peak_memory']}
+    summary['author_name_cache'] = {
+        'hits': author_name_cache['hits'],
+        'misses': author_name_cache['misses'],
+        'size': len(author_name_cache['names'])}
+    return summary
+
+def print_instrumentation_summary(summary, file=sys.stderr):
+    print('{:<38}{:>8}{:>12}{:>12}{:>12}'.format(
+        'function', 'calls', 'total (s)', 'p95 (ms)', 'peak (MB)'),
+          file=file)
+    print('-' * 82, file=file)
+    for name, stats in summary.items():
+        if name == 'author_name_cache':
+            continue
+        print('{:<38}{:>8}{:>12.3f}{:>12.3f}{:>12}'.format(
+            name, stats['calls'], stats['total_seconds'],
+            1000 * stats['p95_seconds'],
+            '' if stats['peak_memory_bytes'] is None
+            else '{:.1f}'.format(stats['peak_memory_bytes'] / 2**20)),
+              file=file)
+    cache_stats = summary['author_name_cache']
+    lookups = cache_stats['hits'] + cache_stats['misses']
+    print('\nauthor name cache: {} hits, {} misses ({:.0f}% hit rate),'\
+          ' {} names cached'.format(
+              cache_stats['hits'], cache_stats['misses'],
+              100 * cache_stats['hits'] / max(lookups, 1),
+              cache_stats['size']), file=file)
+
+
+#======================================================================
+# The main() code
+#======================================================================
+if __name__ == "__main__":
+    # read command line arguments to get parameter configurations
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-in', '--input_filename', default=None,
+                        nargs='+', type=str,
+                        help='the BibTeX files (or glob patterns such as'\
+                        ' "*.bib"), which can be compressed with gzip, xz,'\
+                        ' or bzip2, or "-" for the standard input; their'\
+                        ' entries are merged (required unless --export is'\
+                        ' given)')
+    parser.add_argument('-out', '--output_filename', default=None,
+                        type=str,
+                        help='the dumbib database file to write, or "-" for'\
+                        ' the standard output (required unless --manifest'\
+                        ' is given)')
+    parser.add_argument('--venues', default=venue_filename, type=str,
+                        help='the venue list CSV file (default: the'\
+                        ' "venue_list.csv" file next to this script)')
+    parser.add_argument('--venue_match_threshold', default=None,
+                        type=float,
+                        help='use the most similar venue of the venue list'\
+                        ' for unknown venues whose similarity (between 0'\
+                        ' and 1) is at least this, with a warning'\
+                        ' (default: report them as errors)')
+    parser.add_argument('-j', '--jobs', default=1, type=int,
+                        help='the number of worker processes to use for'\
+                        ' parsing the BibTeX entries (0: use all cores)')
+    parser.add_argument('--aux', action='append', default=None, type=str,
+                        help='only write the references cited in this .aux'\
+                        ' file (can be repeated for several documents)')
+    parser.add_argument('--log_level', default='full',
+                        choices=log_levels + ['none'],
+                        help='which entries to write into the log file:'\
+                        ' those with errors, those with errors or'\
+                        ' warnings, or all of them, or no log file at all'\
+                        ' (default: full)')
+    parser.add_argument('--log_fd', default=None, type=int,
+                        help='write the log into this (already open) file'\
+                        ' descriptor instead of the .log file, e.g. 3 with'\
+                        ' "3>bibtex.log"')
+    parser.add_argument('--log_format', default='text', choices=log_formats,
+                        help='write the log as text, or as JSON Lines (one'\
+                        ' JSON object per entry) for other tools')
+    parser.add_argument('--shard_prefix_length', default=None, type=int,
+                        help='split the dumbib database into shards by the'\
+                        ' first characters of the keys, so that LaTeX only'\
+                        ' reads the shards with cited keys')
+    parser.add_argument('--store', default=None, type=str,
+                        help='also save the parsed references into this'\
+                        ' SQLite file (updated incrementally)')
+    parser.add_argument('--export', action='store_true',
+                        help='write the dumbib database from the references'\
+                        ' in --store (filtered by the --export_* options)'\
+                        ' instead of parsing BibTeX files')
+    parser.add_argument('--export_keys', default=None, nargs='+', type=str,
+                        help='only export the references with these keys')
+    parser.add_argument('--export_author', default=None, type=str,
+                        help='only export the references having an author'\
+                        ' with this last name')
+    parser.add_argument('--export_years', default=None, nargs=2, type=int,
+                        metavar=('FIRST_YEAR', 'LAST_YEAR'),
+                        help='only export the references published in'\
+                        ' these years')
+    parser.add_argument('--export_venue', default=None, type=str,
+                        help='only export the references whose venue'\
+                        ' contains this text')
+    parser.add_argument('--manifest', default=None, type=str,
+                        help='run all the jobs listed in this JSON file'\
+                        ' (instead of using -in and -out)')
+    parser.add_argument('--concurrency', default=0, type=int,
+                        help='the number of jobs of --manifest to run at'\
+                        ' the same time (default: the number of cores)')
+    parser.add_argument('--executor', default='process',
+                        choices=['process', 'thread'],
+                        help='run the jobs of --manifest in worker'\
+                        ' processes (default) or threads')
+    parser.add_argument('--check', action='store_true',
+                        help='only check the BibTeX files for errors,'\
+                        ' without writing any file; the exit status is 1'\
+                        ' if a checked entry has errors (and 2 for invalid'\
+                        ' arguments or unreadable files)')
+    parser.add_argument('--max_errors', default=None, type=int,
+                        help='with --check, stop after this many entries'\
+                        ' with errors')
+    parser.add_argument('--changed_lines', default=None, nargs='+',
+                        type=str, metavar='[FILE:]FIRST[-LAST]',
+                        help='with --check, only check the entries on these'\
+                        ' lines, e.g. "refs.bib:10-25"')
+    parser.add_argument('--watch', action='store_true',
+                        help='keep running and update the dumbib database'\
+                        ' whenever the BibTeX file, the venue list, or'\
+                        ' the .aux files change')
+    parser.add_argument('--poll_interval', default=0.05, type=float,
+                        help='the number of seconds between two checks'\
+                        ' for changes with --watch')
+    parser.add_argument('--no_cache', action='store_true',
+                        help='parse all the entries from scratch, without'\
+                        ' reading or writing the entry cache')
+    parser.add_argument('--stats', action='store_true',
+                        help='print the number of calls and the time taken'\
+                        ' by each stage on the terminal (stderr)')
+    parser.add_argument('--stats_json', default=None, type=str,
+                        help='write the statistics of --stats into this'\
+                        ' JSON file instead')
+    parser.add_argument('--stats_memory', action='store_true',
+                        help='also trace the peak memory of each stage'\
+                        ' (slows down the run)')
+    parser.add_argument('--profile', action='store_true',
+                        help='run the program under cProfile and write the'\
+                        ' profile into <dumbib_database>.pstats')
+    
+    args = parser.parse_args()
+    if args.shard_prefix_length is not None and args.shard_prefix_length < 1:
+        parser.error('--shard_prefix_length must be at least 1')
+    if args.venue_match_threshold is not None \
+       and not 0 <= args.venue_match_threshold <= 1:
+        parser.error('--venue_match_threshold must be between 0 and 1')
+    if args.output_filename == '-' and args.shard_prefix_length is not None:
+        parser.error('--shard_prefix_length cannot be used with -out -')
+    if args.watch and (args.output_filename == '-'
+                       or '-' in (args.input_filename or [])):
+        parser.error('--watch cannot be used with the standard input or'\
+                     ' output')
+    venue_match_threshold = args.venue_match_threshold
+    if not args.export:
+        try:
+            venue_index = load_venue_index(args.venues)
+        except (OSError, UnicodeDecodeError, csv.Error, KeyError) as e:
+            parser.error('cannot read the venue list: {}'.format(e))
+    if args.manifest is not None:
+        try:
+            batch_jobs = load_manifest(args.manifest)
+        except (OSError, ValueError) as e:
+            parser.error('invalid manifest: {}'.format(e))
+        start = time.perf_counter()
+        batch_results = run_batch(
+            batch_jobs, args.concurrency if args.concurrency > 0
+            else os.cpu_count(), args.executor, venue_index,
+            venue_match_threshold)
+        print_batch_summary(batch_results, time.perf_counter() - start)
+        sys.exit(0 if all(result['status'] == 'ok'
+                          for result in batch_results) else 1)
+    if args.check:
+        if args.watch or args.export:
+            parser.error('--check cannot be used with --watch or --export')
+        if args.input_filename is None:
+            parser.error('the following arguments are required:'\
+                         ' -in/--input_filename')
+        if args.max_errors is not None and args.max_errors < 1:
+            parser.error('--max_errors must be at least 1')
+        bibtex_filenames = find_bibtex_files(args.input_filename)
+        try:
+            line_ranges = None if args.changed_lines is None \
+                else parse_line_ranges(args.changed_lines)
+        except ValueError as e:
+            parser.error(str(e))
+        # a range of a file which is not checked would silently pass
+        unknown_filenames = set(line_ranges or []) - {None} \
+            - {os.path.realpath(filename) for filename in bibtex_filenames}
+        if len(unknown_filenames) > 0:
+            parser.error('--changed_lines names files which are not in'\
+                         ' -in: {}'.format(', '.join(
+                             sorted(unknown_filenames))))
+        # the entry cache of -out (if given) is read, but not updated
+        cache_filename = None if args.output_filename is None \
+            else get_output_filenames(args.output_filename)[2]
+        author_name_cache = create_author_name_cache()
+        entry_cache = None if args.no_cache or cache_filename is None \
+            else load_entry_cache(cache_filename, venue_index,
+                                  venue_match_threshold, author_name_cache)
+        try:
+            checked_references = check_bibtex_files(
+                bibtex_filenames, entry_cache,
+                line_ranges, args.max_errors, None, venue_index,
+                venue_match_threshold, author_name_cache)
+        except (OSError, UnicodeDecodeError) as e:
+            print('Could not read the BibTeX files: {}'.format(e),
+                  file=sys.stderr)
+            sys.exit(2)
+        sys.exit(0 if all(reference.INCLUDE_FLAG
+                          for reference in checked_references) else 1)
+    if args.output_filename is None:
+        parser.error('the following arguments are required:'\
+                     ' -out/--output_filename')
+    if args.export:
+        if args.store is None:
+            parser.error('--export requires --store')
+        reference_list, duplicates = load_references_from_store(
+            args.store, args.export_keys, args.export_author,
+            args.export_years, args.export_venue)
+        output_filename = get_output_filenames(args.output_filename)[0]
+        write_dumbib_database(reference_list, output_filename,
+                              args.shard_prefix_length)
+        # keep the standard output for the dumbib database with -out -
+        message_file = sys.stderr if output_filename == '-' else sys.stdout
+        print('Exported {} references from {} into {}.'.format(
+            len(reference_list), args.store, output_filename),
+              file=message_file)
+        duplicates.sort(key=lambda pair: (pair[0].source, pair[0].line))
+        for reference, original in duplicates[:MAX_ERRORS_ON_TERMINAL]:
+            print('{}:{}: entry "{}" was left out as a duplicate of {}:{}'\
+                  ' (entry "{}").'.format(
+                      reference.source, reference.line, reference.bib_key,
+                      original.source, original.line, original.bib_key),
+                  file=message_file)
+        if len(duplicates) > MAX_ERRORS_ON_TERMINAL:
+            print('... and {} more duplicates.'.format(
+                len(duplicates) - MAX_ERRORS_ON_TERMINAL), file=message_file)
+        if args.export_keys is not None:
+            missing_keys = set(args.export_keys) \
+                - {reference.key for reference in reference_list}
+            if len(missing_keys) > 0:
+                print('The following keys were not found in the store:'\
+                      ' {}'.format(', '.join(sorted(missing_keys))),
+                      file=message_file)
+        sys.exit()
+    if args.input_filename is None:
+        parser.error('the following arguments are required:'\
+                     ' -in/--input_filename')
+    bibtex_filenames = find_bibtex_files(args.input_filename)
+    dumbib_database_filename = args.output_filename
+    output_filename, _, cache_filename = get_output_filenames(
+        dumbib_database_filename)
+    # with -out -, there is no entry cache (and no file to name it after),
+    # and the messages go to stderr to keep the dumbib database intact
+    use_cache = not args.no_cache and cache_filename is not None
+    message_file = sys.stderr if output_filename == '-' else None
+
+    if args.stats or args.stats_json is not None or args.stats_memory:
+        enable_instrumentation(args.stats_memory)
+    if args.profile:
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    author_name_cache = create_author_name_cache()
+    entry_cache = load_entry_cache(
+        cache_filename, venue_index, venue_match_threshold,
+        author_name_cache) if use_cache else None
+    jobs = args.jobs if args.jobs > 0 else os.cpu_count()
+    # the state of the build for updating it after an edit (see
+    # update_dumbib_database())
+    watch_state = {} if args.watch and args.store is None else None
+    new_entry_cache, _ = create_dumbib_database(
+        bibtex_filenames, dumbib_database_filename, entry_cache, jobs,
+        args.aux, args.log_level, args.log_format, args.store,
+        message_file, args.shard_prefix_length, args.log_fd,
+        venue_index=venue_index, venue_match_threshold=venue_match_threshold,
+        author_name_cache=author_name_cache, watch_state=watch_state)
+    if args.watch:
+        new_entry_cache = watch_and_rebuild(
+            bibtex_filenames, dumbib_database_filename, new_entry_cache,
+            args.aux, args.log_level, args.log_format, args.store,
+            args.poll_interval, args.shard_prefix_length, args.log_fd,
+            args.venues, venue_match_threshold, author_name_cache,
+            watch_state)
+        # the venue list may have changed while watching
+        venue_index = load_venue_index(args.venues)
+    # saved whenever an entry was parsed, or its cached fields were
+    # refreshed (e.g. after a @string macro was edited, or since it is
+    # now cited; see restore_from_entry_cache())
+    if use_cache and new_entry_cache != entry_cache:
+        save_entry_cache(cache_filename, new_entry_cache, venue_index,
+                         venue_match_threshold, author_name_cache)
+
+    if args.profile:
+        profiler.disable()
+        profiler.dump_stats('dumbib_database.pstats' if output_filename == '-'
+                            else output_filename[:-4] + '.pstats')
+    if instrumentation_stats is not None:
+        summary = summarize_instrumentation(author_name_cache)
+        if args.stats_json is not None:
+            with open(args.stats_json, 'w') as f:
+                json.dump(summary, f, indent=2)
+        else:
+            print_instrumentation_summary(summary)
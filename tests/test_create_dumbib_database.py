@@ -0,0 +1,1235 @@
+'''
+Tests for create_dumbib_database.py.
+
+Usage:
+$ python -m pytest tests
+$ python -m unittest discover tests
+'''
+import bz2
+import csv
+import gzip
+import io
+import json
+import lzma
+import math
+import mmap
+import os
+import random
+import sys
+import tempfile
+import unittest
+import unittest.mock
+
+tests_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(tests_dir))
+sys.path.insert(0, os.path.join(os.path.dirname(tests_dir), 'benchmarks'))
+
+import create_dumbib_database as cdd
+from generate_bibtex import generate_bibtex
+
+def build_dumbib_database(bibtex_text, tmp_dir, name, jobs=1, **options):
+    '''
+    Input: the contents of a BibTeX file, a temporary directory, the name
+           of the files to create in it, the number of worker processes,
+           and other arguments of create_dumbib_database()
+    Output: a tuple (<contents of the .tex file>, <contents of the .log
+            file>, <terminal messages>)
+    '''
+    bibtex_filename = os.path.join(tmp_dir, name + '.bib')
+    with open(bibtex_filename, 'w', encoding='utf-8') as f:
+        f.write(bibtex_text)
+    output_filename = os.path.join(tmp_dir, name + '.tex')
+    with io.StringIO() as messages:
+        cdd.create_dumbib_database([bibtex_filename], output_filename,
+                                   jobs=jobs, file=messages, **options)
+        terminal = messages.getvalue()
+    with open(output_filename, encoding='utf-8') as f:
+        tex = f.read()
+    with open(os.path.join(tmp_dir, name + '.log'), encoding='utf-8') as f:
+        log = f.read()
+    # the log and the messages name the BibTeX and the log file
+    return tex, log.replace(name + '.', '<name>.'), \
+        terminal.replace(name + '.', '<name>.')
+
+def parse_bibtex_text(bibtex_text, **options):
+    return list(cdd.parse_bibtex_entries(bibtex_text.encode('utf-8'),
+                                         'test.bib', **options))
+
+#======================================================================
+# tokenizer
+#======================================================================
+class TokenizeBibtexEntryTest(unittest.TestCase):
+    def test_braces_and_quotes(self):
+        bib_type, bib_key, fields = cdd.tokenize_bibtex_entry(
+            '@Article{key1,\n  Title = {The {MIT} {P{r}ess}},\n'
+            '  author = "Doe, {J}ane and {\\"O}berg, Karl",\n'
+            '  year = 2023,\n}')
+        self.assertEqual(bib_type, 'article')
+        self.assertEqual(bib_key, 'key1')
+        self.assertEqual(fields, {
+            'title': 'The {MIT} {P{r}ess}',
+            'author': 'Doe, {J}ane and {\\"O}berg, Karl',
+            'year': '2023'})
+
+    def test_quotes_inside_braces(self):
+        fields = cdd.tokenize_bibtex_entry(
+            '@misc{k, note = {a "quoted" word}, title = "a {"} b"}')[2]
+        self.assertEqual(fields, {'note': 'a "quoted" word',
+                                  'title': 'a {"} b'})
+
+    def test_concatenation_and_macros(self):
+        fields = cdd.tokenize_bibtex_entry(
+            '@misc(k, title = {A} # " and " # {B}, month = jul # {~13},'
+            ' journal = jmlr)')[2]
+        self.assertEqual(fields['title'], 'A and B')
+        self.assertEqual(fields['month'], ('jul', '~13'))
+        self.assertIsInstance(fields['month'][0], cdd.BibtexMacro)
+        self.assertNotIsInstance(fields['month'][1], cdd.BibtexMacro)
+        self.assertEqual(fields['journal'], ('jmlr',))
+
+    def test_string_entry(self):
+        symbol_table = cdd.create_symbol_table()
+        cdd.define_bibtex_macros(
+            '@string{jmlr = {Journal of} # " Machine Learning Research"}',
+            symbol_table)
+        self.assertEqual(symbol_table['macros']['jmlr'],
+                         'Journal of Machine Learning Research')
+
+    def test_malformed_entries(self):
+        for raw_data, message in [
+                ('@article{k, title = {unbalanced}',
+                 'Entry does not have a closing "}".'),
+                ('@article{k, title = "no closing quote}',
+                 'String does not have matching braces.'),
+                ('@article{k, title}',
+                 'Expected "<field> = <value>" at position 12:\ntitle}'),
+                ('article{k, title = {a}}',
+                 'Entry does not start with "@<type>{":\n'
+                 'article{k, title = {a}}')]:
+            with self.subTest(raw_data=raw_data):
+                with self.assertRaises(ValueError) as context:
+                    cdd.tokenize_bibtex_entry(raw_data)
+                self.assertEqual(str(context.exception), message)
+
+    def test_at_signs_inside_values(self):
+        bibtex_text = (
+            '@article{a,\n  title = {Training at @scale (a study)},\n'
+            '  note = {bob@example (preferred)}}\n'
+            '  @Book (b, title = {Indented})\n')
+        entries = list(cdd.split_bibtex_entries(bibtex_text.encode('utf-8')))
+        self.assertEqual([(line, raw_data[:9])
+                          for _, _, line, raw_data in entries],
+                         [(1, '@article{'), (4, '@Book (b,')])
+        self.assertEqual(cdd.tokenize_bibtex_entry(entries[0][3])[2]['note'],
+                         'bob@example (preferred)')
+
+    def test_malformed_entry_reports_a_single_error(self):
+        reference, = parse_bibtex_text(
+            '@article{k, author = {A. B. Cee}, title = {unbalanced')
+        self.assertFalse(reference.INCLUDE_FLAG)
+        self.assertEqual(len(cdd.split_messages(reference.error_message)),
+                         1)
+
+    def test_macros_resolved_in_order(self):
+        references = parse_bibtex_text(
+            '@string{j = {Journal of Machine Learning Research}}\n'
+            '@article{a, author = {A. Doe}, title = {One}, journal = j,'
+            ' year = 2001}\n'
+            '@string{j = {Journal of Unknown Stuff}}\n'
+            '@article{b, author = {B. Doe}, title = {Two}, journal = j,'
+            ' year = 2002}\n')
+        self.assertEqual([reference.INCLUDE_FLAG
+                          for reference in references], [True, False])
+
+#======================================================================
+# venue matcher
+#======================================================================
+class VenueMatcherTest(unittest.TestCase):
+    def assert_same_as_brute_force(self, venue_rows, texts):
+        venue_index = cdd.build_venue_index(venue_rows)
+        for text in texts:
+            expected = [idx for idx, row in enumerate(venue_rows)
+                        if row['search_string'] in text]
+            self.assertEqual(cdd.find_matching_venues(venue_index, text),
+                             expected, text)
+
+    def test_overlapping_search_strings(self):
+        venue_rows = [{'venue_name': word, 'abbreviation': '??',
+                       'search_string': word}
+                      for word in ['he', 'she', 'his', 'hers', 'ushers',
+                                   'e', 'sh']]
+        rng = random.Random(0)
+        texts = [''.join(rng.choice('hersu ') for _ in range(20))
+                 for _ in range(500)]
+        self.assert_same_as_brute_force(venue_rows, texts + ['ushers'])
+
+    def test_venue_list(self):
+        with open(cdd.venue_filename, newline='', encoding='utf-8') as f:
+            venue_rows = list(csv.DictReader(f))
+        rng = random.Random(1)
+        texts = []
+        for _ in range(300):
+            words = []
+            for row in rng.sample(venue_rows, rng.randint(0, 3)):
+                words.append(row['search_string'])
+                words.append(rng.choice(['proceedings of the', '2021',
+                                         'in', 'annual']))
+            text = ' '.join(words)
+            if len(text) > 10 and rng.random() < 0.5:
+                # cut a search string in two
+                cut = rng.randrange(len(text))
+                text = text[:cut] + text[cut+1:]
+            texts.append(text)
+        self.assert_same_as_brute_force(venue_rows, texts)
+
+    def test_index_cache(self):
+        # the pickled index is reused until the contents of the CSV file
+        # change; a new modification time alone only rehashes the file
+        def write_venue_list(search_strings):
+            with open(csv_filename, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(['venue_name', 'abbreviation',
+                                 'search_string'])
+                for search_string in search_strings:
+                    writer.writerow([search_string.title(), '??',
+                                     search_string])
+
+        def load_venue_index():
+            with unittest.mock.patch.object(
+                    cdd, 'build_venue_index',
+                    wraps=cdd.build_venue_index) as mock:
+                venue_index = cdd.load_venue_index(csv_filename)
+            return venue_index, mock.call_count
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            csv_filename = os.path.join(tmp_dir, 'venues.csv')
+            write_venue_list(['neural networks'])
+            venue_index, num_builds = load_venue_index()
+            self.assertEqual(num_builds, 1)
+            self.assertTrue(os.path.exists(csv_filename + '.pickle'))
+            self.assertEqual(load_venue_index()[1], 0)
+            os.utime(csv_filename, ns=(0, 0))
+            self.assertEqual(load_venue_index()[1], 0)
+            self.assertEqual(load_venue_index()[0]['sha1'],
+                             venue_index['sha1'])
+
+            write_venue_list(['neural networks', 'robot learning'])
+            venue_index, num_builds = load_venue_index()
+            self.assertEqual(num_builds, 1)
+            self.assertEqual(cdd.find_matching_venues(
+                venue_index, 'conference on robot learning'), [1])
+
+            # an unreadable cache is rebuilt
+            with open(csv_filename + '.pickle', 'wb') as f:
+                f.write(b'not a pickle')
+            venue_index, num_builds = load_venue_index()
+            self.assertEqual(num_builds, 1)
+            self.assertEqual(cdd.find_matching_venues(
+                venue_index, 'conference on robot learning'), [1])
+
+    def test_similar_venues(self):
+        # many venues sharing the words of their names, so that most of
+        # them share a trigram with each text
+        rng = random.Random(2)
+        words = ['learning', 'systems', 'data', 'vision', 'robotics',
+                 'networks', 'theory', 'language', 'security', 'graphics',
+                 'mining', 'control', 'databases', 'algorithms']
+        kinds = ['International Conference on', 'Journal of',
+                 'Transactions on', 'Workshop on', 'Symposium on']
+        venue_rows = []
+        for i in range(500):
+            name = '{} {}'.format(rng.choice(kinds), ' '.join(
+                rng.sample(words, rng.randint(1, 3))).title())
+            venue_rows.append({'venue_name': name,
+                               'abbreviation': 'V{}'.format(i),
+                               'search_string': name.lower()})
+        venue_index = cdd.build_venue_index(venue_rows)
+        postings = venue_index['trigram_postings']
+        # only the documents with at least two of their three rarest
+        # trigrams in the text are scored
+        rarest_trigrams = [
+            set(sorted(trigrams, key=lambda trigram: (-postings[trigram][0],
+                                                      trigram))[:3])
+            for _, _, trigrams in venue_index['trigram_documents']]
+        for i in range(200):
+            idx = rng.randrange(len(venue_rows))
+            text = 'Proc. of the {} {}'.format(
+                venue_rows[idx]['venue_name'], 2000 + i)
+            if i % 2:
+                text = text.replace('on', 'in', 1)
+            text_weights = {trigram: postings[trigram][0]
+                            for trigram in cdd.get_venue_trigrams(text)
+                            if trigram in postings}
+            text_weight = math.fsum(text_weights.values())
+            for k, min_similarity in [(3, 0.3), (1, 0.8), (5, 0)]:
+                similarities = {}
+                scored_venues = set()
+                for (doc_idx, doc_weight, trigrams), doc_rarest_trigrams \
+                        in zip(venue_index['trigram_documents'],
+                               rarest_trigrams):
+                    if len(doc_rarest_trigrams & text_weights.keys()) < 2:
+                        continue
+                    scored_venues.add(doc_idx)
+                    similarity = math.fsum(map(
+                        text_weights.__getitem__,
+                        trigrams & frozenset(text_weights))) \
+                        / math.sqrt(text_weight * doc_weight)
+                    if similarity > 0 and similarity >= min_similarity:
+                        similarities[doc_idx] = max(
+                            similarity, similarities.get(doc_idx, 0))
+                expected = sorted(similarities.items(),
+                                  key=lambda item: (-item[1], item[0]))[:k]
+                similar_venues = cdd.find_similar_venues(
+                    venue_index, text, k, min_similarity)
+                self.assertEqual(similar_venues, expected, text)
+                # the venue of the text is scored, even with a typo
+                self.assertIn(idx, scored_venues, text)
+
+class FindVenueTest(unittest.TestCase):
+    def test_arxiv_entries(self):
+        # only the venue field and the arXiv fields are read, so that the
+        # undefined macro of the note is not reported, and the arXiv URL
+        # of a journal paper does not make it a pre-print
+        bibtex_text = '''@article{a, author = {A. Doe}, title = {One},
+  year = 2001, journal = {arXiv preprint arXiv:2101.00001},
+  eprint = {2101.00001}}
+@misc{b, author = {B. Roe}, title = {Two}, year = 2002, note = und,
+  eprint = {2102.00002}, archivePrefix = {arXiv}}
+@article{c, author = {C. Poe}, title = {Three}, year = 2003,
+  journal = {Journal of Machine Learning Research},
+  url = {https://arxiv.org/abs/2103.00003}}
+'''
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tex, log, _ = build_dumbib_database(bibtex_text, tmp_dir,
+                                                'refs')
+        self.assertIn('Doe A. (2001). One. \\textit{arXiv: 2101.00001}.', tex)
+        self.assertIn('Roe B. (2002). Two. \\textit{arXiv: 2102.00002}.', tex)
+        self.assertIn('Poe C. (2003). Three. \\textit{Journal of Machine'
+                      ' Learning Research (JMLR)}.', tex)
+        self.assertNotIn('"und" is not defined', log)
+
+#======================================================================
+# collation keys
+#======================================================================
+class CollationTest(unittest.TestCase):
+    def test_collation_strings(self):
+        for texts, collated in [
+                (['Erd{\\H{o}}s', 'Erd\\H{o}s', 'Erd\\H os', 'Erdős',
+                  'Erdős'], 'erdos'),
+                (['M{\\"u}ller', 'M\\"{u}ller', 'Müller', 'MÜLLER'],
+                 'muller'),
+                (['Wa{\\l}{\\c{e}}sa', 'Wałęsa'], 'walesa'),
+                (['{\\AA}berg', 'Åberg'], 'aberg'),
+                (['Stra{\\ss}e', 'Straße'], 'strasse'),
+                (['Learning: A {Survey}!', 'learning   a survey'],
+                 'learning a survey'),
+                (["O'Brien--Smith"], "o'brien--smith")]:
+            for text in texts:
+                with self.subTest(text=text):
+                    self.assertEqual(cdd.get_collation_string(text),
+                                     collated)
+        self.assertEqual(cdd.latex_to_unicode('{\\"O}berg and \\v{r}\\i'),
+                         'Öberg and řı')
+
+    def test_sorting_and_duplicates(self):
+        # the accented names are sorted with their base letters, and the
+        # entries which only differ in their markup are duplicates
+        bibtex_text = ''.join(
+            '@article{%s, author = {%s}, title = {%s}, year = 2001,\n'
+            '  journal = {Journal of Machine Learning Research}}\n'
+            % entry for entry in [
+                ('z', 'Zed, A.', 'One'),
+                ('o1', '{\\"O}berg, K.', 'Caf{\\\'e} Networks'),
+                ('o2', 'Oak, B.', 'Two'),
+                ('o3', 'Öberg, K.', 'Café networks')])
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tex, log, _ = build_dumbib_database(bibtex_text, tmp_dir,
+                                                'refs')
+        self.assertEqual(
+            [line.split('{')[1].split('}')[0] for line in tex.splitlines()
+             if line.startswith('\\dumbibReferenceEntry')],
+            ['oak2001', 'oberg2001', 'zed2001'])
+        self.assertIn('The following are duplicate entries: references #1'
+                      ' and #3', log)
+
+#======================================================================
+# near-duplicate titles
+#======================================================================
+class MinHashTest(unittest.TestCase):
+    def test_lsh_recall(self):
+        # pairs of 20-word titles sharing 16 words (Jaccard similarity
+        # 16/24 = 0.67) are candidates with probability 1 - (1 - J^4)^8
+        # = 0.83 (XOR-ing a single hash value with different seeds only
+        # gave 0.70)
+        rng = random.Random(0)
+        bands = cdd.MINHASH_BANDS
+        rows = cdd.MINHASH_ROWS
+        num_pairs = 300
+        num_candidates = 0
+        for i in range(num_pairs):
+            words = ['w{}_{}'.format(i, j) for j in range(24)]
+            rng.shuffle(words)
+            signatures = [cdd.compute_minhash_signature(words[:20]),
+                          cdd.compute_minhash_signature(words[4:])]
+            num_candidates += any(
+                signatures[0][band*rows:(band+1)*rows] ==
+                signatures[1][band*rows:(band+1)*rows]
+                for band in range(bands))
+        self.assertGreater(num_candidates / num_pairs, 0.78)
+
+    def test_duplicate_cache(self):
+        # a series of edits (as with --watch) gives the same outputs with
+        # the duplicate cache of the previous build as without it; with
+        # at most 2 titles per bucket, "t2" (whose title has the same
+        # words as "t0") makes the buckets of "t0" too full for "t1", and
+        # removing it empties them again
+        titles = ['Deep reinforcement learning for robot control',
+                  'Deep reinforcement learning for robot motion control',
+                  'Control for robot learning, deep reinforcement',
+                  'Deep reinforcement learning for robotic control',
+                  'Deep learning for robot control']
+        entries = ['@article{t%d, author = {A%d. Doe and B. Roe},'
+                   ' title = {%s}, year = %d,'
+                   ' journal = {Journal of Machine Learning Research}}\n'
+                   % (i, i, title, 2001 + i) for i, title in enumerate(titles)]
+        base_text = generate_bibtex(150, seed=5)
+        edits = [entries[:2],
+                 entries[:3],                       # buckets too full
+                 entries[:2],                       # and back
+                 entries[:2] + entries[3:],
+                 entries[1:],                       # remove an entry
+                 entries + [entries[0]],            # exact duplicate
+                 entries[1:] + [entries[0]],        # original removed
+                 entries[3:] + entries[:3]]
+        duplicate_cache = {}
+        near_duplicates = []
+        with unittest.mock.patch.object(cdd, 'MINHASH_MAX_BUCKET_SIZE', 2), \
+             tempfile.TemporaryDirectory() as tmp_dir:
+            for edited_entries in edits:
+                bibtex_text = base_text + ''.join(edited_entries)
+                outputs = []
+                for name, options in [
+                        ('cached', {'duplicate_cache': duplicate_cache}),
+                        ('uncached', {})]:
+                    outputs.append(build_dumbib_database(
+                        bibtex_text, tmp_dir, name, **options))
+                self.assertEqual(outputs[0], outputs[1])
+                near_duplicates.append(
+                    [line for line in outputs[1][1].splitlines()
+                     if 'possibly duplicate' in line])
+        self.assertNotEqual(near_duplicates[0], near_duplicates[1])
+        self.assertEqual(near_duplicates[0], near_duplicates[2])
+
+    def test_duplicate_messages(self):
+        # similar titles are only possible duplicates if the entries share
+        # authors, and exact duplicates name the fields that matched
+        journal = 'journal = {Journal of Machine Learning Research}'
+        bibtex_text = '''
+@article{a1, author = {A. Doe and B. Roe}, %s, year = 2001,
+  title = {Deep reinforcement learning for robot control}}
+@article{a2, author = {Roe, B. and C. Poe}, %s, year = 2002,
+  title = {Deep reinforcement learning for robot motion control}}
+@article{a3, author = {D. Moe}, %s, year = 2003,
+  title = {Deep reinforcement learning for robotic control}}
+@article{a4, author = {Doe, Alice}, %s, year = 2001,
+  title = {Deep Reinforcement Learning for Robot Control}}
+''' % ((journal,) * 4)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            _, log, _ = build_dumbib_database(bibtex_text, tmp_dir, 'dup')
+        self.assertIn('#0 and #1 (title similarity: 0.86, shared authors:'
+                      ' 1)', log)
+        self.assertNotIn('and #2 (title similarity', log)
+        self.assertIn('#0 and #3 (same title, year, and first author'
+                      ' (Doe))', log)
+
+#======================================================================
+# the whole pipeline
+#======================================================================
+class ParallelParsingTest(unittest.TestCase):
+    def test_serial_and_parallel_outputs_are_identical(self):
+        bibtex_text = generate_bibtex(300, seed=3) + '''
+@article{malformed, author = {A. B. Cee}, title = {unbalanced,
+@string{j = {Journal of Machine Learning Research}}
+@article{m1, author = {A. Doe}, title = {One}, journal = j, year = 2001}
+@string{j = {Journal of Unknown Stuff}}
+@article{m2, author = {B. Doe}, title = {Two}, journal = j, year = 2002}
+@article{m3, author = {C. Doe}, title = {Three}, journal = k, year = 2003}
+@string{k = {Journal of Machine Learning Research}}
+@inproceedings{c1, author = {D. Doe}, title = {Four}, crossref = {p1}}
+@proceedings{p1, title = {International Conference on Machine Learning},
+  year = 2004}
+'''
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            serial = build_dumbib_database(bibtex_text, tmp_dir, 'serial')
+            parallel = build_dumbib_database(bibtex_text, tmp_dir,
+                                             'parallel', jobs=2)
+        self.assertEqual(serial[0], parallel[0])
+        self.assertEqual(serial[1], parallel[1])
+        self.assertEqual(serial[2], parallel[2])
+        self.assertIn('Doe D. (2004). Four.', serial[0])
+        # the macros are resolved in the order of the file
+        self.assertIn('Doe A. (2001). One.', serial[0])
+        self.assertIn('Journal of Unknown Stuff', serial[1])
+        self.assertIn('The @string macro "k" is not defined', serial[1])
+
+    def test_worker_closes_its_files(self):
+        # the files mapped for a chunk, including the one read for the
+        # parent of a crossref entry, are closed once it is parsed
+        bibtex_text = '''
+@inproceedings{c1, author = {D. Doe}, title = {Four}, crossref = {p1}}
+@proceedings{p1, title = {International Conference on Machine Learning},
+  year = 2004}
+'''
+        mapped_files = []
+
+        class TrackedMmap(mmap.mmap):
+            def __init__(self, *args, **kwargs):
+                mapped_files.append(self)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            bibtex_filename = os.path.join(tmp_dir, 'refs.bib')
+            with open(bibtex_filename, 'w', encoding='utf-8') as f:
+                f.write(bibtex_text)
+            symbol_table = cdd.create_symbol_table()
+            references = [reference for reference, _ in cdd.read_references(
+                cdd.read_bibtex_entries(bibtex_filename,
+                                        symbol_table['open_sources']),
+                bibtex_filename, symbol_table)]
+            cdd.close_symbol_table(symbol_table)
+            with unittest.mock.patch.object(cdd.mmap, 'mmap', TrackedMmap):
+                (parsed_fields,), = cdd.parse_entry_spans(
+                    [(bibtex_filename, [(references[0].span, 0, None)])],
+                    {'macro_definitions': [],
+                     'entries': symbol_table['entries'],
+                     'author_names': []},
+                    None, cdd.load_venue_index(cdd.venue_filename))
+        cdd.restore_cached_fields(references[0], parsed_fields)
+        self.assertEqual(references[0].year, '2004')
+        self.assertGreater(len(mapped_files), 0)
+        self.assertTrue(all(data.closed for data in mapped_files))
+
+class LibraryTest(unittest.TestCase):
+    def test_crossref_in_memory(self):
+        # the parent entry is read from the text given to
+        # parse_bibtex_entries()
+        references = parse_bibtex_text('''
+@inproceedings{c1, author = {D. Doe}, title = {Four}, crossref = {p1}}
+@proceedings{p1, title = {International Conference on Machine Learning},
+  year = 2004}
+''')
+        self.assertEqual((references[1].bib_key, references[1].year,
+                          references[1].warning_message), ('c1', '2004', ''))
+
+    def test_author_name_cache_of_a_build(self):
+        # a build only uses the author name cache it is given
+        bibtex_text = ''.join(
+            '@article{a%d, author = {A. Doe and B. Roe}, title = {T%d},'
+            ' journal = {Journal of Machine Learning Research},'
+            ' year = %d}\n' % (i, i, 2000 + i) for i in range(3))
+        author_name_cache = cdd.create_author_name_cache()
+        parse_bibtex_text(bibtex_text, symbol_table=cdd.create_symbol_table(
+            author_name_cache=author_name_cache))
+        self.assertEqual((author_name_cache['hits'],
+                          author_name_cache['misses']), (4, 2))
+        self.assertEqual(list(author_name_cache['names']),
+                         ['A. Doe', 'B. Roe'])
+        symbol_table = cdd.create_symbol_table()
+        parse_bibtex_text(bibtex_text, symbol_table=symbol_table)
+        self.assertEqual(symbol_table['author_names']['misses'], 2)
+        self.assertEqual(author_name_cache['misses'], 2)
+
+class MultiFileTest(unittest.TestCase):
+    def test_find_bibtex_files(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for name in ['b.bib', 'a.bib', 'c.txt']:
+                open(os.path.join(tmp_dir, name), 'w').close()
+            patterns = [os.path.join(tmp_dir, name)
+                        for name in ['b.bib', '*.bib', 'missing.bib']]
+            self.assertEqual(cdd.find_bibtex_files(patterns), [
+                os.path.join(tmp_dir, name)
+                for name in ['b.bib', 'a.bib', 'missing.bib']])
+
+    def test_merged_files(self):
+        # the merged files give the same dumbib database as a single file
+        # with all their entries, and each entry is reported with its own
+        # file and line
+        bibtex_texts = [generate_bibtex(80, seed=11), '''
+@article{b1, author = {A. Doe}, title = {Merged}, year = 2001,
+  journal = {Journal of Machine Learning Research}}
+''' + generate_bibtex(80, seed=12) + '''
+@article{B1, author = {B. Roe}, title = {Repeated}, year = 2002,
+  journal = {Journal of Machine Learning Research}}
+''']
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            bibtex_filenames = []
+            for i, bibtex_text in enumerate(bibtex_texts):
+                bibtex_filenames.append(os.path.join(tmp_dir,
+                                                     'part{}.bib'.format(i)))
+                with open(bibtex_filenames[-1], 'w', encoding='utf-8') as f:
+                    f.write(bibtex_text)
+            output_filename = os.path.join(tmp_dir, 'merged.tex')
+            with io.StringIO() as messages:
+                cdd.create_dumbib_database(bibtex_filenames, output_filename,
+                                           file=messages)
+                terminal = messages.getvalue()
+            with open(output_filename, encoding='utf-8') as f:
+                tex = f.read()
+            with open(os.path.join(tmp_dir, 'merged.log'),
+                      encoding='utf-8') as f:
+                log = f.read()
+            single_tex = build_dumbib_database(''.join(bibtex_texts),
+                                               tmp_dir, 'single')[0]
+        self.assertEqual(tex, single_tex)
+        num_lines = bibtex_texts[1].count('\n')
+        self.assertIn('Source: {}, line 2\n'.format(bibtex_filenames[1]),
+                      log)
+        self.assertIn('{}:{}: entry "B1"'.format(bibtex_filenames[1],
+                                                 num_lines - 1), terminal)
+        # the ids go on across the files
+        self.assertIn('The BibTeX key "B1" is already used by reference #80.',
+                      log)
+
+class LogTest(unittest.TestCase):
+    bibtex_text = '''@article{a, author = {A. Doe}, title = {One}, year = 2001,
+  journal = {Journal of Machine Learning Research}}
+@article{b, author = {B. Roe}, title = {Two} # und, year = 2002,
+  journal = {Journal of Machine Learning Research}}
+@article{c, author = {C. Poe}, title = {Three}, year = 2003,
+  journal = {Journal of Unknown Stuff}}
+'''
+
+    def test_log_levels(self):
+        for log_level, bib_keys in [('errors', ['c']),
+                                    ('warnings', ['b', 'c']),
+                                    ('full', ['a', 'b', 'c'])]:
+            with self.subTest(log_level=log_level), \
+                 tempfile.TemporaryDirectory() as tmp_dir:
+                log = build_dumbib_database(
+                    self.bibtex_text, tmp_dir, 'refs', log_level=log_level,
+                    log_format='json')[1]
+                records = [json.loads(line) for line in log.splitlines()]
+                self.assertEqual([record['bib_key'] for record in records],
+                                 bib_keys)
+                text_log = build_dumbib_database(
+                    self.bibtex_text, tmp_dir, 'refs',
+                    log_level=log_level)[1]
+                self.assertEqual(text_log.count('Reference id: '),
+                                 len(bib_keys))
+                # the raw text is only repeated for errors and warnings
+                self.assertEqual(text_log.count('Raw .bibtex input:'),
+                                 len(set(bib_keys) & {'b', 'c'}))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            bibtex_filename = os.path.join(tmp_dir, 'refs.bib')
+            with open(bibtex_filename, 'w', encoding='utf-8') as f:
+                f.write(self.bibtex_text)
+            cdd.create_dumbib_database(
+                [bibtex_filename], os.path.join(tmp_dir, 'refs.tex'),
+                log_level='none', file=io.StringIO())
+            self.assertEqual(sorted(os.listdir(tmp_dir)),
+                             ['refs.bib', 'refs.tex'])
+
+    def test_json_records(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            log = build_dumbib_database(self.bibtex_text, tmp_dir, 'refs',
+                                        log_format='json')[1]
+        records = [json.loads(line) for line in log.splitlines()]
+        self.assertEqual(records[0], {
+            'id': 0, 'source': os.path.join(tmp_dir, '<name>.bib'),
+            'line': 1, 'bib_key': 'a', 'key': 'doe2001', 'status': 'ok',
+            'errors': [], 'warnings': [],
+            'output': 'Doe A. (2001). One. \\textit{Journal of Machine'
+                      ' Learning Research (JMLR)}.'})
+        self.assertEqual(records[1]['status'], 'warning')
+        self.assertEqual(records[1]['warnings'], [
+            'The @string macro "und" is not defined, so its name was used'
+            ' instead.'])
+        self.assertTrue(records[1]['raw'].startswith('@article{b,'))
+        self.assertEqual((records[2]['status'], records[2]['key']),
+                         ('error', None))
+        self.assertNotIn('output', records[2])
+
+    def test_terminal_summary(self):
+        with tempfile.TemporaryDirectory() as tmp_dir, \
+             unittest.mock.patch.object(cdd, 'MAX_ERRORS_ON_TERMINAL', 0):
+            terminal = build_dumbib_database(self.bibtex_text, tmp_dir,
+                                             'refs')[2]
+        self.assertEqual(terminal, '... and 1 more entries with errors.\n'
+                         '1 entries had errors and 1 had warnings; see {}'
+                         ' for the details.\n'.format(
+                             os.path.join(tmp_dir, '<name>.log')))
+
+class CompressedInputTest(unittest.TestCase):
+    def test_contents_kept_only_if_needed(self):
+        # without a dictionary for the decompressed contents, they are
+        # written into a temporary file instead of being kept in memory,
+        # and the parents of the crossref entries are still read from it
+        bibtex_text = '''
+@proceedings{p1, title = {International Conference on Machine Learning},
+  year = 2004}
+@inproceedings{c1, author = {D. Doe}, title = {Four}, crossref = {p1}}
+@inproceedings{c2, author = {E. Doe}, title = {Five}, crossref = {p2}}
+@proceedings{p2, title = {Neural Information Processing Systems},
+  year = 2005}
+'''
+        def summarize(references):
+            return [(reference.bib_key, reference.year,
+                     reference.warning_message, reference.error_message)
+                    for reference in references]
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            bibtex_filename = os.path.join(tmp_dir, 'refs.bib')
+            with open(bibtex_filename, 'w', encoding='utf-8') as f:
+                f.write(bibtex_text)
+            with gzip.open(bibtex_filename + '.gz', 'wt',
+                           encoding='utf-8') as f:
+                f.write(bibtex_text)
+            expected = summarize(cdd.process_bibtex_into_reference_list(
+                [bibtex_filename]))
+            sources = {}
+            references = cdd.process_bibtex_into_reference_list(
+                [bibtex_filename + '.gz'], sources=sources)
+            self.assertEqual(summarize(references), expected)
+            self.assertEqual(cdd.read_raw_data(references[1], sources),
+                             bibtex_text.split('\n', 3)[3].split('\n')[0])
+            with unittest.mock.patch.object(
+                    cdd, 'append_to_blocks', side_effect=AssertionError):
+                references = cdd.process_bibtex_into_reference_list(
+                    [bibtex_filename + '.gz'])
+        self.assertEqual(summarize(references), expected)
+        self.assertEqual(expected[1][1:], ('2004', '', ''))
+        self.assertEqual(expected[2][1:], ('2005', '', ''))
+
+    def test_compression_formats(self):
+        # the format is detected from the contents, whatever the name of
+        # the file, and the entries may span several chunks
+        bibtex_text = generate_bibtex(60, seed=41)
+        bibtex_data = bibtex_text.encode('utf-8')
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            expected = build_dumbib_database(bibtex_text, tmp_dir, 'plain')
+            for compression, compress in [
+                    ('gzip', gzip.compress), ('xz', lzma.compress),
+                    ('bzip2', bz2.compress), ('none', lambda data: data)]:
+                with self.subTest(compression=compression), \
+                     unittest.mock.patch.object(cdd, 'READ_CHUNK_SIZE', 100):
+                    bibtex_filename = os.path.join(tmp_dir, 'refs.dat')
+                    with open(bibtex_filename, 'wb') as f:
+                        f.write(compress(bibtex_data))
+                    output_filename = os.path.join(tmp_dir, 'refs.tex')
+                    with io.StringIO() as messages:
+                        cdd.create_dumbib_database(
+                            [bibtex_filename], output_filename,
+                            file=messages)
+                        terminal = messages.getvalue()
+                    with open(output_filename, encoding='utf-8') as f:
+                        tex = f.read()
+                    with open(os.path.join(tmp_dir, 'refs.log'),
+                              encoding='utf-8') as f:
+                        log = f.read()
+                    self.assertEqual(
+                        (tex, log.replace('refs.dat', '<name>.bib')
+                         .replace('refs.', '<name>.'),
+                         terminal.replace('refs.dat', '<name>.bib')
+                         .replace('refs.', '<name>.')), expected)
+
+    def test_standard_input_and_output(self):
+        # the log goes to a file descriptor, and the summary of the errors
+        # to the given stream (stderr in the script)
+        bibtex_text = generate_bibtex(60, seed=42)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            expected_tex, expected_log, _ = build_dumbib_database(
+                bibtex_text, tmp_dir, 'plain')
+            log_filename = os.path.join(tmp_dir, 'stdin.log')
+            log_fd = os.open(log_filename, os.O_WRONLY | os.O_CREAT)
+            stdin = unittest.mock.Mock(
+                buffer=io.BytesIO(lzma.compress(bibtex_text.encode('utf-8'))))
+            try:
+                with unittest.mock.patch('sys.stdin', stdin), \
+                     unittest.mock.patch('sys.stdout',
+                                         io.StringIO()) as stdout:
+                    cdd.create_dumbib_database(['-'], '-', log_fd=log_fd,
+                                               file=io.StringIO())
+            finally:
+                os.close(log_fd)
+            with open(log_filename, encoding='utf-8') as f:
+                log = f.read()
+            self.assertEqual(stdout.getvalue(), expected_tex)
+            self.assertEqual(log.replace('Source: -,', 'Source: {},'.format(
+                os.path.join(tmp_dir, '<name>.bib'))), expected_log)
+            self.assertEqual(sorted(os.listdir(tmp_dir)),
+                             ['plain.bib', 'plain.log', 'plain.tex',
+                              'stdin.log'])
+
+class EntryCacheTest(unittest.TestCase):
+    def test_uncited_entry_cited_later(self):
+        # the venue of "b" is skipped in the first run (see --aux), and
+        # only found in the second run, from the entry cache
+        bibtex_text = '''
+@article{a, author = {A. Doe}, title = {One}, year = 2001,
+  journal = {Journal of Machine Learning Research}}
+@article{b, author = {B. Roe}, title = {Two} # und1, year = 2002,
+  journal = {Journal of Unknown Stuff} # und2, note = und3}
+'''
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            bibtex_filename = os.path.join(tmp_dir, 'refs.bib')
+            with open(bibtex_filename, 'w', encoding='utf-8') as f:
+                f.write(bibtex_text)
+            aux_filename = os.path.join(tmp_dir, 'paper.aux')
+
+            def run(cited_keys, entry_cache, name):
+                with open(aux_filename, 'w', encoding='utf-8') as f:
+                    for key in cited_keys:
+                        f.write('\\dumbib@citation@count{%s}{1}\n' % key)
+                entry_cache = cdd.create_dumbib_database(
+                    [bibtex_filename], os.path.join(tmp_dir, name + '.tex'),
+                    entry_cache, aux_filenames=[aux_filename],
+                    file=io.StringIO())[0]
+                with open(os.path.join(tmp_dir, name + '.log'),
+                          encoding='utf-8') as f:
+                    return entry_cache, f.read().replace(name + '.', '')
+
+            entry_cache = run(['doe2001'], None, 'first')[0]
+            self.assertEqual(len(entry_cache), 2)
+            cached_log = run(['doe2001', 'roe2002'], entry_cache,
+                             'cached')[1]
+            uncached_log = run(['doe2001', 'roe2002'], None, 'uncached')[1]
+        self.assertEqual(cached_log, uncached_log)
+        self.assertIn('Unknown publication venue: Journal of Unknown Stuff'
+                      'und2', cached_log)
+        self.assertIn('"und1" is not defined', cached_log)
+        # the note is not read
+        self.assertNotIn('"und3" is not defined', cached_log)
+
+    def test_saved_after_macro_edit(self):
+        # the entry using the edited macro is parsed again once, and its
+        # refreshed fields are saved, even though no entry was added
+        bibtex_text = '''@string{jn = {Journal of Machine Learning Research}}
+@article{a, author = {A. Doe}, title = {One}, year = 2001, journal = jn}
+@article{b, author = {B. Roe}, title = {Two}, year = 2002,
+  journal = {Journal of Machine Learning Research}}
+'''
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            bibtex_filename = os.path.join(tmp_dir, 'refs.bib')
+            job = dict(cdd.manifest_job_options, inputs=[bibtex_filename],
+                       output=os.path.join(tmp_dir, 'refs.tex'))
+
+            def run(bibtex_text):
+                with open(bibtex_filename, 'w', encoding='utf-8') as f:
+                    f.write(bibtex_text)
+                with unittest.mock.patch.object(
+                        cdd, 'find_fields', wraps=cdd.find_fields) as mock:
+                    self.assertEqual(cdd.run_batch_job(job)['status'], 'ok')
+                return mock.call_count
+
+            self.assertEqual(run(bibtex_text), 2)
+            self.assertEqual(run(bibtex_text), 0)
+            bibtex_text = bibtex_text.replace('Machine Learning Research}}',
+                                              'Mach. Learn. Res.}}', 1)
+            self.assertEqual(run(bibtex_text), 1)
+            self.assertEqual(run(bibtex_text), 0)
+
+    def test_unchanged_outputs_not_rewritten(self):
+        # a second run leaves the files untouched (e.g. for latexmk),
+        # unless their contents change
+        bibtex_text = '''
+@article{a, author = {A. Doe}, title = {One}, year = 2001,
+  journal = {Journal of Machine Learning Research}}
+'''
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            bibtex_filename = os.path.join(tmp_dir, 'refs.bib')
+            output_filenames = [os.path.join(tmp_dir, 'refs' + extension)
+                                for extension in ['.tex', '.log']]
+
+            def run(bibtex_text):
+                with open(bibtex_filename, 'w', encoding='utf-8') as f:
+                    f.write(bibtex_text)
+                cdd.create_dumbib_database(
+                    [bibtex_filename], output_filenames[0],
+                    file=io.StringIO())
+                modification_times = [os.stat(filename).st_mtime_ns
+                                      for filename in output_filenames]
+                for filename in output_filenames:
+                    os.utime(filename, ns=(0, 0))
+                return modification_times
+
+            run(bibtex_text)
+            self.assertEqual(run(bibtex_text), [0, 0])
+            self.assertNotIn(0, run(bibtex_text.replace('One', 'Two')))
+            self.assertFalse(os.path.exists(output_filenames[0] + '.tmp'))
+
+class AuthorNameCacheTest(unittest.TestCase):
+    def test_least_recently_used_eviction(self):
+        author_name_cache = cdd.create_author_name_cache()
+        with unittest.mock.patch.object(cdd, 'AUTHOR_NAME_CACHE_SIZE', 2):
+            for author in ['Doe, Jane', 'Roe, B.', 'Doe, Jane', 'Poe, C.']:
+                self.assertEqual(
+                    cdd.get_author_name(author, author_name_cache),
+                    cdd.parse_author_name(author))
+        self.assertEqual(list(author_name_cache['names'].items()),
+                         [('Doe, Jane', ('Doe', 'J.')),
+                          ('Poe, C.', ('Poe', 'C.'))])
+        self.assertEqual((author_name_cache['hits'],
+                          author_name_cache['misses']), (1, 3))
+
+    def test_saved_with_the_entry_cache(self):
+        # the names are kept (in the same order) even when the entries of
+        # the cache cannot be reused
+        author_name_cache = cdd.create_author_name_cache()
+        for author in ['Doe, Jane', 'Roe, B.', 'Doe, Jane']:
+            cdd.get_author_name(author, author_name_cache)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache_filename = os.path.join(tmp_dir, 'refs.cache')
+            cdd.save_entry_cache(cache_filename, {'hash': ()},
+                                 author_name_cache=author_name_cache)
+            for venue_index, entry_cache in [(None, {'hash': ()}),
+                                             ({}, {})]:
+                with self.subTest(venue_index=venue_index):
+                    loaded_cache = cdd.create_author_name_cache()
+                    self.assertEqual(cdd.load_entry_cache(
+                        cache_filename, venue_index,
+                        author_name_cache=loaded_cache), entry_cache)
+                    self.assertEqual(loaded_cache['names'],
+                                     author_name_cache['names'])
+                    self.assertEqual(list(loaded_cache['names']),
+                                     ['Roe, B.', 'Doe, Jane'])
+
+class YearIndexTest(unittest.TestCase):
+    def test_year_indices(self):
+        self.assertEqual([cdd.get_year_index(index)
+                          for index in [0, 1, 25, 26, 27, 51, 52, 701, 702]],
+                         ['a', 'b', 'z', 'aa', 'ab', 'az', 'ba', 'zz', 'aaa'])
+
+    def test_keys_that_are_not_adjacent(self):
+        # "Smith and Jones" sorts between the two "Smith" entries, which
+        # still get different keys; more than 26 entries with the same
+        # key get two letters
+        authors = ['Smith, A.', 'Smith, B. and Jones, C.', 'Smith, Z.'] \
+            + ['Doe, J.'] * 28
+        bibtex_text = ''.join(
+            '@article{k%d, author = {%s}, title = {Title %d}, year = 2001,\n'
+            '  journal = {Journal of Machine Learning Research}}\n'
+            % (i, author, i) for i, author in enumerate(authors))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tex = build_dumbib_database(bibtex_text, tmp_dir, 'refs')[0]
+        keys = [line.split('{')[1].split('}')[0] for line in tex.splitlines()
+                if line.startswith('\\dumbibReferenceEntry')]
+        self.assertEqual(keys[-3:],
+                         ['smith2001a', 'smith_jones2001', 'smith2001b'])
+        self.assertEqual(keys[:28], ['doe2001' + cdd.get_year_index(index)
+                                     for index in range(28)])
+        self.assertEqual(keys[27], 'doe2001ab')
+        self.assertIn('Smith Z. (2001b).', tex)
+
+class ShardTest(unittest.TestCase):
+    def test_shards_and_index(self):
+        # the shards hold the entries of a single file, split by the
+        # prefixes of their keys, and the index lists the keys of each
+        bibtex_text = generate_bibtex(120, seed=31)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            single_tex = build_dumbib_database(bibtex_text, tmp_dir,
+                                               'single')[0]
+            index = build_dumbib_database(bibtex_text, tmp_dir, 'refs',
+                                          shard_prefix_length=2)[0]
+            shard_lines = [line for line in index.splitlines()
+                           if line.startswith('\\dumbibShard')]
+            shard_texts = []
+            for line in shard_lines:
+                shard_filename, keys = line[len('\\dumbibShard{'):-2]\
+                    .split('}{')
+                self.assertEqual(shard_filename, os.path.join(
+                    tmp_dir, 'refs-' + keys[:2]).replace(os.sep, '/'))
+                with open(shard_filename + '.tex', encoding='utf-8') as f:
+                    shard_texts.append(f.read())
+                self.assertEqual(
+                    [entry.split('{')[1].split('}')[0]
+                     for entry in shard_texts[-1].split('\n\n') if entry],
+                    keys.split(','))
+                self.assertEqual({key[:2] for key in keys.split(',')},
+                                 {keys[:2]})
+        self.assertGreater(len(shard_lines), 1)
+        self.assertEqual(''.join(shard_texts), single_tex)
+
+class CheckTest(unittest.TestCase):
+    def test_repeated_bibtex_keys(self):
+        # only the first entry is checked, but the later entry with the
+        # same key (irrespective of case) is reported too
+        bibtex_text = '''@article{doe01, author = {A. Doe}, title = {One},
+  journal = {Journal of Machine Learning Research}, year = 2001}
+@article{roe02, author = {B. Roe}, title = {Two},
+  journal = {Journal of Machine Learning Research}, year = 2002}
+@article{DOE01, author = {C. Poe}, title = {Three},
+  journal = {Journal of Machine Learning Research}, year = 2003}
+'''
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            bibtex_filename = os.path.join(tmp_dir, 'refs.bib')
+            with open(bibtex_filename, 'w', encoding='utf-8') as f:
+                f.write(bibtex_text)
+            with io.StringIO() as messages:
+                checked_references = cdd.check_bibtex_files(
+                    [bibtex_filename], None, cdd.parse_line_ranges(['1-2']),
+                    file=messages)
+        self.assertEqual([(reference.bib_key, reference.INCLUDE_FLAG)
+                          for reference in checked_references],
+                         [('doe01', True), ('DOE01', False)])
+        self.assertIn('The BibTeX key "DOE01" is already used by reference'
+                      ' #0', checked_references[1].error_message)
+
+    def test_changed_lines_of_a_file(self):
+        # the file of a range can be named by any path to it
+        bibtex_text = '''@article{doe01, author = {A. Doe}, title = {One},
+  journal = {Journal of Machine Learning Research}, year = 2001}
+@article{roe02, author = {B. Roe}, title = {Two},
+  journal = {Journal of Unknown Stuff}, year = 2002}
+'''
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            bibtex_filename = os.path.join(tmp_dir, 'refs.bib')
+            with open(bibtex_filename, 'w', encoding='utf-8') as f:
+                f.write(bibtex_text)
+            for filename in [bibtex_filename,
+                             os.path.relpath(bibtex_filename),
+                             os.path.join(tmp_dir, '.', 'refs.bib')]:
+                with self.subTest(filename=filename):
+                    checked_references = cdd.check_bibtex_files(
+                        [bibtex_filename], None, cdd.parse_line_ranges(
+                            [filename + ':4']), file=io.StringIO())
+                    self.assertEqual([reference.bib_key for reference
+                                      in checked_references], ['roe02'])
+
+    def test_invalid_utf8(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            bibtex_filename = os.path.join(tmp_dir, 'refs.bib')
+            with open(bibtex_filename, 'wb') as f:
+                f.write(b'@article{a, author = {A. Doe}, title = {One}}\n'
+                        b'@article{b, author = {Ren\xe9 Roe}, title = {Two}}')
+            with self.assertRaises(UnicodeDecodeError) as context:
+                cdd.check_bibtex_files([bibtex_filename], file=io.StringIO())
+        self.assertIn('in the entry at line 2 of ' + bibtex_filename,
+                      str(context.exception))
+
+#======================================================================
+# watch mode
+#======================================================================
+class WatchTest(unittest.TestCase):
+    def test_update_matches_full_build(self):
+        # each edit (of the text edited so far) only processes the
+        # entries around it again, but gives the same output as a build
+        # from scratch
+        bibtex_text = generate_bibtex(200, duplicate_rate=0.1, seed=7)
+        entries = bibtex_text.split('\n@')
+        edits = [
+            ('title', lambda text: text.replace('title = {',
+                                                'title = {Edited ', 1)),
+            ('duplicate', lambda text: text + '\n@' + entries[3]),
+            ('removed', lambda text: text.replace('\n@' + entries[5], '')),
+            ('moved lines', lambda text: '\n\n' + text),
+            ('repeated key', lambda text: text.replace(
+                entries[2].split(',')[0], entries[1].split(',')[0], 1))]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            bibtex_filename = os.path.join(tmp_dir, 'watched.bib')
+            output_filename = os.path.join(tmp_dir, 'watched.tex')
+            with open(bibtex_filename, 'w', encoding='utf-8') as f:
+                f.write(bibtex_text)
+            watch_state = {}
+            entry_cache = cdd.create_dumbib_database(
+                [bibtex_filename], output_filename, file=io.StringIO(),
+                watch_state=watch_state)[0]
+            edited_text = bibtex_text
+            for name, edit in edits:
+                edited_text = edit(edited_text)
+                with self.subTest(edit=name):
+                    with open(bibtex_filename, 'w', encoding='utf-8') as f:
+                        f.write(edited_text)
+                    with io.StringIO() as messages:
+                        num_parsed = cdd.update_dumbib_database(
+                            watch_state, [bibtex_filename], output_filename,
+                            entry_cache, file=messages)
+                        terminal = messages.getvalue()
+                    self.assertIsNotNone(num_parsed)
+                    self.assertLessEqual(num_parsed, 1)
+                    with open(output_filename, encoding='utf-8') as f:
+                        tex = f.read()
+                    with open(output_filename[:-4] + '.log',
+                              encoding='utf-8') as f:
+                        log = f.read()
+                    self.assertEqual(
+                        (tex, log.replace('watched.', '<name>.'),
+                         terminal.replace('watched.', '<name>.')),
+                        build_dumbib_database(edited_text, tmp_dir,
+                                              'rebuilt'))
+
+    def test_changes_that_need_a_full_build(self):
+        bibtex_text = '''@string{jn = {Journal of Machine Learning Research}}
+@article{a, author = {A. Doe}, title = {One}, year = 2001, journal = jn}
+'''
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            bibtex_filename = os.path.join(tmp_dir, 'refs.bib')
+            output_filename = os.path.join(tmp_dir, 'refs.tex')
+            with open(bibtex_filename, 'w', encoding='utf-8') as f:
+                f.write(bibtex_text)
+            watch_state = {}
+            entry_cache = cdd.create_dumbib_database(
+                [bibtex_filename], output_filename, file=io.StringIO(),
+                watch_state=watch_state)[0]
+            # the log deleted in the meantime is written again
+            os.remove(os.path.join(tmp_dir, 'refs.log'))
+            self.assertEqual(cdd.update_dumbib_database(
+                watch_state, [bibtex_filename], output_filename,
+                entry_cache, file=io.StringIO()), 0)
+            self.assertTrue(os.path.exists(os.path.join(tmp_dir,
+                                                        'refs.log')))
+            # the macro changes how the other entries are parsed
+            with open(bibtex_filename, 'w', encoding='utf-8') as f:
+                f.write(bibtex_text.replace('Research}}', 'Res.}}'))
+            self.assertIsNone(cdd.update_dumbib_database(
+                watch_state, [bibtex_filename], output_filename,
+                entry_cache, file=io.StringIO()))
+
+
+#======================================================================
+# reference store
+#======================================================================
+class StoreTest(unittest.TestCase):
+    def test_export_of_several_files(self):
+        # the files are saved by separate runs, but the keys and the
+        # duplicates of the export are those of a single run on both
+        bibtex_texts = {'a.bib': '''
+@article{a1, author = {A. Doe}, title = {One}, year = 2001,
+  journal = {Journal of Machine Learning Research}}
+@article{a2, author = {B. Roe}, title = {Two}, year = 2002,
+  journal = {Journal of Machine Learning Research}}
+''', 'b.bib': '''
+@article{b1, author = {Doe, A.}, title = {Three}, year = 2001,
+  journal = {Journal of Machine Learning Research}}
+@article{b2, author = {Roe, B.}, title = {Two}, year = 2002,
+  journal = {Journal of Machine Learning Research}}
+'''}
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            bibtex_filenames = []
+            for name, bibtex_text in bibtex_texts.items():
+                bibtex_filenames.append(os.path.join(tmp_dir, name))
+                with open(bibtex_filenames[-1], 'w', encoding='utf-8') as f:
+                    f.write(bibtex_text)
+            store_filename = os.path.join(tmp_dir, 'refs.sqlite')
+            for bibtex_filename in bibtex_filenames:
+                cdd.create_dumbib_database(
+                    [bibtex_filename], bibtex_filename[:-4] + '.tex',
+                    store_filename=store_filename, file=io.StringIO())
+            output_filename = os.path.join(tmp_dir, 'both.tex')
+            cdd.create_dumbib_database(bibtex_filenames, output_filename,
+                                       file=io.StringIO())
+            reference_list, duplicates = cdd.load_references_from_store(
+                store_filename)
+            exported_filename = os.path.join(tmp_dir, 'exported.tex')
+            cdd.write_dumbib_database(reference_list, exported_filename)
+            with open(output_filename, encoding='utf-8') as f, \
+                 open(exported_filename, encoding='utf-8') as g:
+                self.assertEqual(f.read(), g.read())
+            self.assertEqual([reference.key for reference in reference_list],
+                             ['doe2001a', 'doe2001b', 'roe2002'])
+            self.assertEqual([(reference.bib_key, original.bib_key)
+                              for reference, original in duplicates],
+                             [('b2', 'a2')])
+            # the query does not change the keys
+            reference_list = cdd.load_references_from_store(
+                store_filename, keys=['doe2001b'], author='Doe')[0]
+            self.assertEqual([(reference.bib_key, reference.key)
+                              for reference in reference_list],
+                             [('b1', 'doe2001b')])
+
+
+#======================================================================
+# batch mode
+#======================================================================
+class ManifestTest(unittest.TestCase):
+    def test_load_manifest(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            manifest_filename = os.path.join(tmp_dir, 'jobs.json')
+            jobs = [{'inputs': 'a/*.bib', 'output': 'a/refs.tex',
+                     'aux': 'a/paper.aux'},
+                    {'inputs': ['b.bib', '/shared/c.bib'],
+                     'output': 'b.tex', 'log_format': 'json',
+                     'no_cache': True, 'shard_prefix_length': 2}]
+            for manifest in [jobs, {'jobs': jobs}]:
+                with open(manifest_filename, 'w') as f:
+                    json.dump(manifest, f)
+                self.assertEqual(cdd.load_manifest(manifest_filename), [
+                    dict(cdd.manifest_job_options,
+                         inputs=[os.path.join(tmp_dir, 'a', '*.bib')],
+                         output=os.path.join(tmp_dir, 'a', 'refs.tex'),
+                         aux=[os.path.join(tmp_dir, 'a', 'paper.aux')]),
+                    dict(cdd.manifest_job_options,
+                         inputs=[os.path.join(tmp_dir, 'b.bib'),
+                                 '/shared/c.bib'],
+                         output=os.path.join(tmp_dir, 'b.tex'),
+                         log_format='json', no_cache=True,
+                         shard_prefix_length=2)])
+
+    def test_batch_run(self):
+        # the jobs give the same outputs as separate runs, and a failed
+        # job does not stop the others
+        bibtex_texts = [generate_bibtex(60, seed=21),
+                        generate_bibtex(40, seed=22)]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            jobs = []
+            for i, bibtex_text in enumerate(bibtex_texts):
+                with open(os.path.join(tmp_dir, 'in{}.bib'.format(i)), 'w',
+                          encoding='utf-8') as f:
+                    f.write(bibtex_text)
+                jobs.append({'inputs': 'in{}.bib'.format(i),
+                             'output': 'out{}.tex'.format(i)})
+            jobs.append({'inputs': 'missing.bib', 'output': 'missing.tex'})
+            manifest_filename = os.path.join(tmp_dir, 'jobs.json')
+            with open(manifest_filename, 'w') as f:
+                json.dump(jobs, f)
+            for executor_type in ['thread', 'process']:
+                with self.subTest(executor_type=executor_type):
+                    results = cdd.run_batch(
+                        cdd.load_manifest(manifest_filename), 2,
+                        executor_type)
+                    self.assertEqual([result['status']
+                                      for result in results],
+                                     ['ok', 'ok', 'failed'])
+                    self.assertEqual([result['num_entries']
+                                      for result in results], [60, 40, 0])
+                    self.assertIn('The job failed: FileNotFoundError',
+                                  results[2]['messages'])
+                    for i, bibtex_text in enumerate(bibtex_texts):
+                        with open(os.path.join(tmp_dir,
+                                               'out{}.tex'.format(i)),
+                                  encoding='utf-8') as f:
+                            self.assertEqual(f.read(), build_dumbib_database(
+                                bibtex_text, tmp_dir, 'single')[0])
+                        self.assertTrue(os.path.exists(os.path.join(
+                            tmp_dir, 'out{}.cache'.format(i))))
+            with io.StringIO() as summary:
+                cdd.print_batch_summary(results, 1.0, summary)
+                summary = summary.getvalue()
+        self.assertIn('3 jobs: 2 succeeded, 1 failed (1.000 s in total).',
+                      summary)
+        # (the jobs are named relative to the current directory)
+        self.assertIn('missing.tex:\nThe job failed: FileNotFoundError',
+                      summary)
+
+    def test_invalid_jobs(self):
+        for jobs, message in [
+                (['paper.bib'], 'Job #0 is not an object.'),
+                ([{'inputs': 'a.bib', 'output': 'a.tex'}, None],
+                 'Job #1 is not an object.'),
+                ([{'inputs': 'a.bib', 'output': 3}],
+                 'Job #0 has an option of the wrong type.'),
+                ([{'inputs': 'a.bib', 'output': 'a.tex', 'no_cache': 'no'}],
+                 'Job #0 has an option of the wrong type.'),
+                ([{'inputs': 'a.bib', 'output': 'a.tex',
+                   'shard_prefix_length': 0}],
+                 'Job #0 has an invalid shard prefix length.')]:
+            with self.subTest(jobs=jobs), \
+                 tempfile.TemporaryDirectory() as tmp_dir:
+                manifest_filename = os.path.join(tmp_dir, 'jobs.json')
+                with open(manifest_filename, 'w') as f:
+                    json.dump({'jobs': jobs}, f)
+                with self.assertRaises(ValueError) as context:
+                    cdd.load_manifest(manifest_filename)
+                self.assertEqual(str(context.exception), message)
+
+
+if __name__ == '__main__':
+    unittest.main()